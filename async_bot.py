@@ -0,0 +1,471 @@
+"""
+The bot.py strategy on asyncio: one event loop, one AsyncExtendedSymbolExchange.
+
+Order updates come from watch_orders on the same exchange, follow-up orders are tasks,
+and unfilled limit buys are canceled by event loop timers instead of sleeping threads.
+Configured through config.py like bot.py:
+
+    python async_bot.py
+"""
+
+import asyncio
+import random
+import signal
+import time
+
+import ccxt
+
+import logs
+import metrics
+from async_exchange import AsyncExtendedSymbolExchange
+from order_book import OrderBook
+from order_monitor import OrderMonitor
+from strategy import limit_buy_for, limit_sell_for
+from utils import log_error
+
+
+class AsyncSymbolBot():
+    """
+    SymbolBot (symbol_bot.py) for an AsyncExtendedSymbolExchange.
+
+    Every filled order starts its follow-up as a task, so the order stream is never
+    held up by REST calls. A limit buy's delayed cancel is a loop.call_later() timer,
+    dropped as soon as the buy is filled or canceled.
+    """
+
+    def __init__(
+        self, exchange, sleep_min, sleep_max, profit_margin_min, profit_margin_max, buy_cancel_timeout,
+        reconcile_interval=60, journal=None, max_closed_orders=10000, ledger=None,
+    ):
+        self.exchange = exchange
+        self.symbol = exchange.s
+
+        self.sleep_min = sleep_min
+        self.sleep_max = sleep_max
+        self.profit_margin_min = profit_margin_min
+        self.profit_margin_max = profit_margin_max
+        self.buy_cancel_timeout = buy_cancel_timeout
+        self.reconcile_interval = reconcile_interval
+        self.journal = journal
+        self.max_closed_orders = max_closed_orders
+        self.ledger = ledger
+
+        self.stop_event = asyncio.Event()
+        self.order_monitor = None
+
+        # order id -> TimerHandle of its delayed cancel
+        self._cancel_timers = {}
+        self._tasks = set()
+
+    async def initialize(self):
+        """
+        Load the open orders into the order monitor.
+        """
+        self.order_monitor = OrderMonitor(
+            self.exchange, open_orders=await self.exchange.open_orders(), journal=self.journal, max_closed_orders=self.max_closed_orders,
+            ledger=self.ledger,
+        )
+
+    def spawn(self, coro):
+        """
+        Run coro as a task tracked by the bot, so that stop() can wait for it.
+        """
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def process_order_update(self, order):
+        """
+        Process order updates. Returns True if the order has been filled.
+        """
+        if order.get("symbol") == self.symbol:
+            self.exchange.trade_tracker.on_order(order)
+
+        if order["id"] not in self.order_monitor.open_orders:
+            # e.g. an order placed by a rebalance
+            if order.get("symbol") == self.symbol:
+                self.order_monitor.adopt(order)
+            return False
+
+        if order["status"] == "open":
+            return False
+
+        self.order_monitor.log(order)
+
+        timer = self._cancel_timers.pop(order["id"], None)
+        if timer is not None:
+            timer.cancel()
+
+        if order["status"] == "closed":
+
+            detected = time.perf_counter()
+            if order["side"] == "buy":
+                self.spawn(self.limit_sell(order, detected))
+            else:
+                self.spawn(self.limit_buy(order, detected))
+            return True
+
+        return False
+
+    ############################################
+
+    async def cancel_order(self, order):
+        """
+        Cancel an order.
+        """
+        self._cancel_timers.pop(order["id"], None)
+
+        try:
+            canceled_order = await self.exchange.cancel_order(order["id"], symbol=self.symbol)
+            self.order_monitor.log(canceled_order)
+
+        except (ccxt.errors.OrderNotFound, KeyError):
+            pass
+
+        except ccxt.errors.ExchangeError as e:
+            log_error(e, f"cancel_order {self.symbol}")
+
+    def cancel_order_later(self, order, timeout):
+        """
+        Cancel an order after timeout seconds, unless it is filled or canceled before.
+        """
+        loop = asyncio.get_running_loop()
+        self._cancel_timers[order["id"]] = loop.call_later(timeout, lambda: self.spawn(self.cancel_order(order)))
+
+    async def market_buy(self):
+        """
+        Market buy the minimum amount of the symbol.
+        """
+        exchange = self.exchange
+
+        try:
+
+            price = await exchange.price()
+            amount = await exchange.min_order_amount(price)
+
+            order = await exchange.create_order(
+                symbol=self.symbol,
+                type="market",
+                side="buy",
+                amount=amount,
+                rebalance_on_max_orders=True
+            )
+
+            self.order_monitor.log(order)
+
+            await self.limit_sell(order, time.perf_counter())
+
+        except ccxt.errors.InsufficientFunds:
+
+            logs.info(f"Insufficient funds for market buy of {self.symbol}")
+
+        except (ccxt.errors.ExchangeError, ccxt.errors.NetworkError) as e:
+
+            log_error(e, f"market_buy {self.symbol}")
+
+    async def _profit_scale(self):
+        return random.uniform(self.profit_margin_min, await self.exchange.scale_by_balance(self.profit_margin_min, self.profit_margin_max))
+
+    async def limit_sell(self, order, detected=None):
+        """
+        Limit sell the amount of base that was bought. detected is the perf_counter() time the buy was seen filled.
+        """
+        exchange = self.exchange
+
+        try:
+            sell_price, sell_amount = limit_sell_for(order, await self._profit_scale())
+
+            sell_order = await exchange.create_order(
+                symbol=self.symbol,
+                type="limit",
+                side="sell",
+                amount=sell_amount,
+                price=sell_price,
+                rebalance_on_max_orders=True
+            )
+
+            if detected is not None:
+                metrics.FILL_TO_ACK.labels(self.symbol, "sell").observe(time.perf_counter() - detected)
+
+            self.order_monitor.log(sell_order, order)
+
+            # if status closed then immediately buy back
+            if sell_order["status"] == "closed":
+                await self.limit_buy(sell_order, time.perf_counter())
+
+        except ccxt.errors.InsufficientFunds:
+            logs.info(f'Insufficient funds for limit sell of {sell_amount} at {sell_price} for total: {sell_price * sell_amount}')
+
+        except (ccxt.errors.ExchangeError, ccxt.errors.NetworkError) as e:
+            log_error(e, f"limit_sell {self.symbol}")
+
+    async def limit_buy(self, order, detected=None):
+        """
+        Limit buy the amount of base that was sold. Cancel the order if it is not filled within buy_cancel_timeout.
+        detected is the perf_counter() time the sell was seen filled.
+        """
+        exchange = self.exchange
+
+        try:
+            buy_price, buy_amount = limit_buy_for(order, await self._profit_scale(), exchange.min_cost, exchange.min_price, exchange.min_amount)
+
+            buy_order = await exchange.create_order(
+                symbol=self.symbol,
+                type="limit",
+                side="buy",
+                amount=buy_amount,
+                price=buy_price,
+                rebalance_on_max_orders=True
+            )
+
+            if detected is not None:
+                metrics.FILL_TO_ACK.labels(self.symbol, "buy").observe(time.perf_counter() - detected)
+
+            self.order_monitor.log(buy_order, order)
+
+            # if status closed then immediately sell again
+            if buy_order["status"] == "closed":
+                await self.limit_sell(buy_order, time.perf_counter())
+                return
+
+            self.cancel_order_later(buy_order, self.buy_cancel_timeout)
+
+        except ccxt.errors.InsufficientFunds:
+            logs.info(f'Insufficient funds for limit buy of {buy_amount} at {buy_price} for total: {buy_price * buy_amount}')
+
+        except (ccxt.errors.ExchangeError, ccxt.errors.NetworkError) as e:
+            log_error(e, f"limit_buy {self.symbol}")
+
+    ############################################
+
+    async def rebalance_if_needed(self):
+        """
+        Proactive check: rebalance if we're getting close to max orders.
+        """
+        exchange = self.exchange
+
+        try:
+            max_orders = exchange.get_max_num_orders()
+            current_sell_orders = len(await exchange.open_sell_orders())
+            threshold = int(max_orders * 0.9)  # Rebalance at 90% capacity
+
+            if current_sell_orders < threshold:
+                return
+
+            if exchange._rebalance_lock.locked():
+                logs.info(f"Proactive rebalancing skipped: {current_sell_orders}/{max_orders} (rebalancing already in progress)")
+                return
+
+            async with exchange._rebalance_lock:
+                logs.info(f"Proactive rebalancing {self.symbol}: {current_sell_orders}/{max_orders} orders (threshold: {threshold})")
+                old_orders, new_orders = await exchange.rebalance_sell_orders()
+                self.order_monitor.replaced(old_orders, new_orders)
+                logs.info(f"Rebalanced {len(old_orders)} orders into {len(new_orders)} orders")
+
+        except Exception as check_error:
+            logs.info(f"Error during proactive order check: {check_error}")
+
+    async def status(self):
+        """
+        Print the status from the tracked orders, fetching the price only if the last one is older than price_ttl.
+        """
+        order_monitor = self.order_monitor
+
+        price = order_monitor.cached_price()
+        if price is None:
+            try:
+                # status output is the first thing to go when the weight budget runs low
+                with self.exchange.budget.low_priority():
+                    price = await self.exchange.price()
+            except Exception as e:
+                log_error(e, "AsyncSymbolBot.status()")
+
+        order_monitor.status(price=price, fetch=False)
+
+    async def reconcile(self):
+        """
+        Fetch the state of tracked orders that are no longer open on the exchange and process them.
+        """
+        exchange = self.exchange
+
+        exchange.snapshot.invalidate("open_orders")
+        with exchange.budget.low_priority():
+            open_ids = {o["id"] for o in await exchange.open_orders()}
+
+        missing = [id for id in list(self.order_monitor.open_orders) if id not in open_ids]
+        orders = await asyncio.gather(*(exchange.fetch_order(id, self.symbol) for id in missing), return_exceptions=True)
+
+        for order in orders:
+            if isinstance(order, ccxt.errors.OrderNotFound):
+                continue
+            if isinstance(order, Exception):
+                log_error(order, "AsyncSymbolBot.reconcile")
+                continue
+            self.process_order_update(order)
+
+    async def watch_orders(self):
+        """
+        Process order updates from the user data stream until stopped. Reconciles with REST
+        after every reconnect and every reconcile_interval seconds.
+        """
+        exchange = self.exchange
+        loop = asyncio.get_running_loop()
+        next_reconcile = loop.time() + self.reconcile_interval
+
+        while not self.stop_event.is_set():
+            try:
+                timeout = max(0, next_reconcile - loop.time())
+                orders = await asyncio.wait_for(exchange.watch_orders(self.symbol), timeout)
+
+            except asyncio.TimeoutError:
+                # how late the timeout fired, i.e. how busy the event loop is
+                metrics.LOOP_LAG.labels("watcher", self.symbol).observe(max(0.0, loop.time() - next_reconcile))
+                orders = []
+
+            except asyncio.CancelledError:
+                raise
+
+            except Exception as e:
+                if self.stop_event.is_set():
+                    break
+                log_error(e, "AsyncSymbolBot.watch_orders")
+                await asyncio.sleep(1)
+                # the stream may have dropped updates while it was down
+                next_reconcile = loop.time()
+                exchange.trade_tracker.invalidate()
+                continue
+
+            for order in orders:
+                self.process_order_update(order)
+
+            if loop.time() >= next_reconcile:
+                next_reconcile = loop.time() + self.reconcile_interval
+                try:
+                    await self.reconcile()
+                except Exception as e:
+                    log_error(e, "AsyncSymbolBot.reconcile")
+
+    async def run(self):
+        """
+        Begin the main loop. Returns once stop_event is set.
+        """
+        exchange = self.exchange
+
+        await self.rebalance_if_needed()
+
+        logs.info(f"Starting main loop for {self.symbol}...")
+
+        while not self.stop_event.is_set():
+
+            # independent requests, issued at the same time
+            seconds_since_last_trade, sleep_timer = await asyncio.gather(
+                exchange.seconds_since_last_trade(),
+                exchange.scale_by_balance(self.sleep_max, self.sleep_min),
+            )
+            if seconds_since_last_trade > sleep_timer:
+
+                await self.market_buy()
+                seconds_since_last_trade = 0
+
+                await self.status()
+
+            sleeping_for = int(sleep_timer - seconds_since_last_trade + 1)
+            ts = exchange.iso8601(exchange.milliseconds())
+            ts_unitl = exchange.iso8601(exchange.milliseconds() + sleeping_for * 1000)
+            logs.info(f"{ts} | {self.symbol} | Sleeping until {ts_unitl}... ({sleeping_for} seconds)")
+
+            # returns early when stop_event is set
+            wake_at = time.monotonic() + sleeping_for
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), sleeping_for)
+            except asyncio.TimeoutError:
+                metrics.LOOP_LAG.labels("main", self.symbol).observe(max(0.0, time.monotonic() - wake_at))
+
+    async def stop(self):
+        """
+        Stop the bot: drop pending cancel timers, wait for running tasks and cancel all open buy orders.
+        """
+        self.stop_event.set()
+
+        for timer in self._cancel_timers.values():
+            timer.cancel()
+        self._cancel_timers.clear()
+
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        logs.info("Cancelling all open buy orders...")
+        await self.exchange.cancel_all_buy_orders()
+
+
+async def main():
+    import config
+
+    config.get_log_pipeline()
+
+    if config.METRICS_PORT is not None:
+        metrics.serve(config.METRICS_PORT, config.METRICS_HOST)
+
+    exchange = AsyncExtendedSymbolExchange(
+        config.SYMBOL, config.EXCHANGE_CONFIGS["binance"], snapshot_ttl=config.SNAPSHOT_TTL, budget=config.get_budget(),
+        retry_policy=config.get_retry_policy(), order_retry_deadline=config.ORDER_RETRY_DEADLINE, price_ttl=config.PRICE_TTL,
+    )
+
+    try:
+        await exchange.initialize(markets_cache=config.get_markets_cache())
+
+        if config.PRICE_STREAM:
+            price_feed_task = asyncio.create_task(exchange.price_feed.run())
+
+        if config.ORDER_BOOK_DEPTH > 0:
+            exchange.order_book = OrderBook(exchange, depth=config.ORDER_BOOK_DEPTH)
+            order_book_task = asyncio.create_task(exchange.order_book.run())
+
+        logs.info(f"SLEEP_MIN: {config.SLEEP_MIN} SLEEP_MAX: {config.SLEEP_MAX}")
+        logs.info(f"PROFIT_MARGIN_MIN: {config.PROFIT_MARGIN_MIN} PROFIT_MARGIN_MAX: {config.PROFIT_MARGIN_MAX}")
+
+        bot = AsyncSymbolBot(
+            exchange,
+            sleep_min=config.SLEEP_MIN,
+            sleep_max=config.SLEEP_MAX,
+            profit_margin_min=config.PROFIT_MARGIN_MIN,
+            profit_margin_max=config.PROFIT_MARGIN_MAX,
+            buy_cancel_timeout=config.BUY_CANCEL_TIMEOUT,
+            journal=config.get_order_journal(),
+            max_closed_orders=config.MAX_CLOSED_ORDERS,
+            ledger=config.get_ledger(),
+        )
+
+        await exchange.cancel_all_buy_orders()
+        await bot.initialize()
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, bot.stop_event.set)
+
+        watcher = asyncio.create_task(bot.watch_orders())
+        await bot.run()
+
+        watcher.cancel()
+        await asyncio.gather(watcher, return_exceptions=True)
+        if exchange.order_book is not None:
+            exchange.order_book.stop()
+            await asyncio.gather(order_book_task, return_exceptions=True)
+        if config.PRICE_STREAM:
+            exchange.price_feed.stop()
+            await asyncio.gather(price_feed_task, return_exceptions=True)
+        await bot.stop()
+        if bot.journal is not None:
+            bot.journal.close()
+        if bot.ledger is not None:
+            bot.ledger.save()
+        logs.info("Exiting...")
+
+    finally:
+        await exchange.close()
+        logs.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,454 @@
+"""
+Implementation of the AsyncExtendedSymbolExchange class, ExtendedSymbolExchange for asyncio.
+"""
+
+import asyncio
+import contextvars
+import time
+
+import ccxt
+import ccxt.pro as ccxtpro
+
+import logs
+import metrics
+from market_math import MarketMath
+from averager import check_replacement, plan_sell_orders, print_orders
+from exchange import ExtendedSymbolExchange
+from price_feed import PriceFeed
+from rebalance_executor import RebalanceExecutor
+from retry import RetryPolicy
+from snapshot import AccountSnapshot
+from strategy import scale_by_balance
+from trade_tracker import TradeTracker
+from utils import calculate_min_order_amount, log_error
+from weight_budget import WeightBudget
+
+
+class AsyncExtendedSymbolExchange(ccxtpro.binance):
+    """
+    Wrapper class for ccxt.pro.binance with the API of ExtendedSymbolExchange, every call being a coroutine.
+
+    Being a ccxt.pro exchange, the same instance also watches the user data stream
+    (watch_orders). Create it, then `await exchange.initialize()` to load the markets,
+    and `await exchange.close()` when done.
+    """
+
+    # market limits and rounding don't touch the network, share them with the threaded exchange
+    decimal_places = ExtendedSymbolExchange.decimal_places
+    round = ExtendedSymbolExchange.round
+    round_array = ExtendedSymbolExchange.round_array
+    get_max_num_orders = ExtendedSymbolExchange.get_max_num_orders
+    current_timestamp = ExtendedSymbolExchange.current_timestamp
+
+    def __init__(self, symbol, config, snapshot_ttl=5.0, budget=None, retry_policy=None, order_retry_deadline=60.0, price_ttl=1.0):
+
+        super().__init__(config)
+
+        self.s = symbol
+
+        # one rebalance at a time, the task rebalancing (and the tasks it starts) may
+        # still place and cancel orders while holding the lock
+        self._rebalance_lock = asyncio.Lock()
+        self._rebalancing = contextvars.ContextVar(f"rebalancing_{id(self)}", default=False)
+
+        # request weight and order count budget, shared with other bots on the host
+        # when a file-backed WeightBudget is passed in
+        self.budget = budget if budget is not None else WeightBudget()
+        metrics.USED_WEIGHT.set_function(lambda: self.budget.stats()["used_weight"])
+
+        # transient errors are retried with backoff, placing an order gives up after order_retry_deadline seconds
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.order_retry_deadline = order_retry_deadline
+
+        # balances and open orders are served from memory for up to snapshot_ttl
+        # seconds, and dropped whenever we create or cancel an order ourselves
+        self.snapshot = AccountSnapshot(ttl=snapshot_ttl)
+
+        # local order book mirror (order_book.OrderBook run as a task), REST is used while it is None or out of sync
+        self.order_book = None
+
+        # last fill of the symbol, from order responses and the updates the bot is fed
+        self.trade_tracker = TradeTracker()
+        metrics.TRADE_RATE.labels(symbol).set_function(self.trade_tracker.trade_rate)
+
+        # created by initialize(), once the markets are loaded
+        self.price_ttl = price_ttl
+        self.price_feed = None
+
+        self._background_tasks = set()
+
+    async def initialize(self, markets=None, markets_cache=None):
+        """
+        Load the markets (from `markets`, the MarketsCache or Binance) and the limits of the symbol.
+        """
+        print(f"{self.current_timestamp()}")
+        print(f"Initializing {self.__class__.__name__}...")
+
+        started = time.perf_counter()
+
+        if markets is not None:
+            source = "shared"
+        elif markets_cache is not None:
+            markets = markets_cache.load([self.s])
+            source = "cache"
+
+        if markets is not None:
+            self.m = self.set_markets(markets)[self.s]
+        else:
+            self.m = (await self.load_markets())[self.s]
+            source = "download"
+            if markets_cache is not None:
+                try:
+                    await asyncio.to_thread(markets_cache.save, self.markets)
+                except OSError as e:
+                    log_error(e, "MarketsCache.save()")
+
+        print(f"Markets ready in {time.perf_counter() - started:.3f}s ({source})")
+
+        if source == "cache" and markets_cache.is_stale():
+            self._spawn(self._refresh_markets_cache(markets_cache))
+
+        self.precision = self.m['precision']
+
+        self.min_amount = self.m['limits']['amount']['min']
+        self.min_price = self.m['limits']['price']['min']
+        self.min_cost = self.m['limits']['cost']['min']
+
+        # rounding and lot units of the market, worked out once
+        self.math = MarketMath(self.precision, self.m['limits'])
+
+        self.max_num_orders = self.get_max_num_orders()
+
+        self.base = self.m['base']
+        self.quote = self.m['quote']
+
+        # the price is read from memory: from the trade stream once price_feed.run() is running,
+        # else from a REST fetch for price_ttl seconds
+        self.price_feed = PriceFeed(self, rest_ttl=self.price_ttl)
+
+        price = await self.price()
+
+        print(f"min_cost: {self.min_cost} {self.quote}")
+        print(f"min_amount: {self.min_amount} {self.base}")
+        print(f"min_price: {self.min_price} {self.quote}")
+        print(f"min_order_amount: {await self.min_order_amount(price)} {self.base} at {price} {self.quote}")
+
+    def _spawn(self, coro):
+        # keep a reference, the event loop only holds weak ones to its tasks
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
+    async def _refresh_markets_cache(self, markets_cache):
+        try:
+            with self.budget.low_priority():
+                markets = await self.fetch_markets()
+            await asyncio.to_thread(markets_cache.save, markets)
+            print(f"Markets cache refreshed with {len(markets)} markets")
+        except Exception as e:
+            log_error(e, "MarketsCache.refresh()")
+
+    async def fetch2(self, path, api='public', method='GET', params={}, headers=None, body=None, config={}):
+        """
+        Wrapper for fetch2() that reserves request weight in the budget and corrects it from the response headers.
+        Latency and weight are recorded per endpoint.
+        """
+        # ccxt's spot rate limiter costs are 0.2 per unit of Binance request weight
+        weight = max(1, int(round(self.calculate_rate_limiter_cost(api, method, path, params, config) * 5)))
+        orders = 1 if method == "POST" and path in ("order", "order/cancelReplace") else 0
+
+        await self.budget.acquire_async(weight, orders)
+        previous_headers = self.last_response_headers
+        started = time.perf_counter()
+        try:
+            return await super().fetch2(path, api, method, params, headers, body, config)
+        finally:
+            metrics.REST_LATENCY.labels(method, path).observe(time.perf_counter() - started)
+            metrics.REST_WEIGHT.labels(path).inc(weight)
+            # a request that failed before any response leaves the headers of an earlier one behind
+            if self.last_response_headers is not previous_headers:
+                self.budget.update(self.last_response_headers)
+
+    async def get_best_bid_ask(self):
+        """
+        Get the best bid and ask, from the order book mirror when one is in sync.
+        """
+        if self.order_book is not None:
+            best = self.order_book.best_bid_ask()
+            if best is not None:
+                return best
+        best = self.price_feed.best_bid_ask()
+        if best is not None:
+            return best
+        order_book = await self.fetch_order_book(symbol=self.s, limit=5)
+        return order_book['bids'][0][0], order_book['asks'][0][0]
+
+    async def handle_max_orders_error(self):
+        """
+        Handle MAX_NUM_ORDERS error by rebalancing orders, one rebalance at a time.
+
+        Returns:
+            bool: True if successful, False if error occurred
+        """
+        if self._rebalance_lock.locked():
+            logs.info("MAX_NUM_ORDERS reached, but rebalancing already in progress. Waiting...")
+
+            async with self._rebalance_lock:
+                logs.info("Previous rebalancing completed. Checking if retry is still needed...")
+
+                current_orders = len(await self.open_sell_orders())
+                max_orders = self.get_max_num_orders()
+
+                if current_orders < max_orders * 0.85:  # If below 85%, we're good
+                    logs.info(f"Order count now at {current_orders}/{max_orders} (safe). No rebalancing needed.")
+                    return True
+
+                logs.info(f"Order count still high at {current_orders}/{max_orders}. Proceeding with rebalancing...")
+
+        async with self._rebalance_lock:
+            logs.info("MAX_NUM_ORDERS reached. Starting rebalancing...")
+            token = self._rebalancing.set(True)
+
+            try:
+                # Cancel any open buy orders first to free up slots
+                buy_orders = await self.open_buy_orders()
+                if buy_orders:
+                    logs.info(f"Cancelling {len(buy_orders)} open buy orders...")
+                    results = await asyncio.gather(
+                        *(self.cancel_order(order['id'], symbol=self.s) for order in buy_orders),
+                        return_exceptions=True,
+                    )
+                    for result in results:
+                        if isinstance(result, Exception):
+                            logs.info(f"Error cancelling buy order: {result}")
+
+                # Rebalance sell orders to 80% of max limit
+                try:
+                    old_orders, new_orders = await self.rebalance_sell_orders()
+                    logs.info(f"Rebalanced {len(old_orders)} orders into {len(new_orders)} orders")
+
+                    # Verify we're below the limit
+                    max_orders = self.get_max_num_orders()
+                    if len(new_orders) >= max_orders:
+                        logs.info(f"WARNING: Still at or above max orders ({len(new_orders)}/{max_orders})")
+                        return False
+
+                    logs.info(f"Successfully reduced orders to {len(new_orders)}/{max_orders} (safe)")
+                    return True
+
+                except Exception as rebalance_error:
+                    logs.info(f"Error during rebalancing: {rebalance_error}")
+                    log_error(rebalance_error, "rebalance_sell_orders")
+                    return False
+
+            finally:
+                self._rebalancing.reset(token)
+                logs.info("Rebalancing lock released.")
+
+    async def rebalance_sell_orders(self):
+        """
+        averager.rebalance_sell_orders() with the replacements run concurrently on the event loop.
+
+        Returns:
+            tuple: (old_orders, new_orders) - the orders before and after rebalancing
+        """
+        started = time.perf_counter()
+
+        logs.info("CURRENT SELL ORDERS")
+        orders = await self.open_sell_orders()
+        new_orders = plan_sell_orders(self, orders)
+
+        check_replacement(self, orders, new_orders)
+        report = await RebalanceExecutor(self).execute_async(orders, new_orders)
+        metrics.REBALANCE_OPS.labels(self.s).observe(report["ops"])
+        metrics.REBALANCE_SECONDS.labels(self.s).observe(time.perf_counter() - started)
+
+        logs.info("NEW SELL ORDERS")
+        orders_after = await self.open_sell_orders()
+        print_orders(self, orders_after)
+
+        return orders, orders_after
+
+    async def create_order(self, symbol, type, side, amount, price=None, params={}, rebalance_on_max_orders=True):
+        """
+        Wrapper for create_order() that retries transient errors by the retry policy (for up to
+        order_retry_deadline seconds) and handles MAX_NUM_ORDERS.
+
+        Args:
+            symbol: Trading pair symbol
+            type: Order type (market, limit)
+            side: Order side (buy, sell)
+            amount: Order amount
+            price: Order price (optional for market orders)
+            params: Additional parameters
+            rebalance_on_max_orders: If True, automatically rebalance when MAX_NUM_ORDERS is reached (default: True)
+
+        Returns:
+            Order object from the exchange
+        """
+
+        # If another task is rebalancing, wait until it completes.
+        # The rebalancing task itself is allowed to place/cancel orders while holding the lock.
+        if self._rebalance_lock.locked() and not self._rebalancing.get():
+            logs.info("Rebalancing in progress. Waiting before placing order...")
+            async with self._rebalance_lock:
+                pass
+
+        async def attempt():
+            try:
+                order = await super(AsyncExtendedSymbolExchange, self).create_order(symbol, type, side, amount, price, params)
+            finally:
+                # invalidate even on errors, the order may have reached the exchange
+                self.snapshot.invalidate()
+            # e.g. a market buy is filled in the response
+            self.trade_tracker.on_order(order)
+            return order
+
+        try:
+
+            return await self.retry_policy.call_async(attempt, name=f"create_order {type} {side} {amount} {self.base} at {price}", deadline=self.order_retry_deadline)
+
+        except ccxt.errors.ExchangeError as e:
+
+            # Check if max orders limit was reached
+            if str(e) != 'binance {"code":-2010,"msg":"Filter failure: MAX_NUM_ORDERS"}' or not rebalance_on_max_orders:
+                raise e
+
+            logs.info(f"MAX_NUM_ORDERS error while trying to {type} {side} {amount} {self.base}")
+
+            if not await self.handle_max_orders_error():
+                logs.info("Rebalancing failed, cannot place order")
+                raise e
+
+            # Retry the order after successful rebalancing, without rebalancing again
+            logs.info(f"Retrying {type} {side} order after rebalancing...")
+            return await self.create_order(symbol, type, side, amount, price, params, rebalance_on_max_orders=False)
+
+    async def cancel_order(self, id, symbol=None, params={}):
+        """
+        Wrapper for cancel_order() that invalidates the account snapshot.
+        """
+        try:
+            return await super().cancel_order(id, symbol=symbol, params=params)
+        finally:
+            self.snapshot.invalidate()
+
+    async def edit_order(self, id, symbol, type, side, amount=None, price=None, params={}):
+        """
+        Wrapper for edit_order() (cancel-replace on spot) that invalidates the account snapshot.
+        """
+        try:
+            return await super().edit_order(id, symbol, type, side, amount=amount, price=price, params=params)
+        finally:
+            self.snapshot.invalidate()
+
+    async def price(self, max_age=None):
+        """
+        Get the current price of the symbol, from the price feed if known within max_age seconds.
+        """
+        price = self.price_feed.get(max_age)
+        if price is None:
+            price = self.price_feed.remember(float((await self.publicGetTickerPrice({"symbol": self.m["id"]}))["price"]))
+        return price
+
+    async def min_order_amount(self, price=None, max_age=None):
+        """
+        Get the minimum amount of the base currency that can be traded in one order.
+        """
+        if price is None:
+            price = await self.price(max_age)
+        return calculate_min_order_amount(price, self.min_cost, self.min_price, self.min_amount)
+
+    async def open_orders(self):
+        """
+        Get all open orders for the symbol. Served from the account snapshot when fresh.
+        """
+        return list(await self.snapshot.get_async("open_orders", lambda: self.fetch_open_orders(self.s)))
+
+    async def balances(self):
+        """
+        Get account balances. Served from the account snapshot when fresh.
+        """
+        return await self.snapshot.get_async("balance", self.fetch_balance)
+
+    async def open_buy_orders(self):
+        """
+        Get all open buy orders for the symbol.
+        """
+        return [order for order in await self.open_orders() if order["side"] == "buy"]
+
+    async def open_sell_orders(self):
+        """
+        Get all open sell orders for the symbol.
+        """
+        return [order for order in await self.open_orders() if order["side"] == "sell"]
+
+    async def sell_base_value(self):
+        """
+        Calculate the total quote currency value of all open sell orders.
+        """
+        return sum(order["price"] * order["amount"] for order in await self.open_sell_orders())
+
+    async def base_balance(self):
+        """
+        Get free and total base currency balance.
+        """
+        balances = await self.balances()
+        return balances["free"][self.base], balances["total"][self.base]
+
+    async def quote_balance(self):
+        """
+        Get free and total quote currency balance.
+        """
+        balances = await self.balances()
+        return balances["free"][self.quote], balances["total"][self.quote]
+
+    async def scale_by_balance(self, x, y):
+        """
+        Get a value between x and y scaled linearly by the balance of the quote currency.
+        Transient errors are retried by the retry policy until the balance can be read.
+        """
+        async def attempt():
+            # balance and open orders are independent requests, fetch them at the same time
+            (free_quote, total_quote), sell_base_value = await asyncio.gather(self.quote_balance(), self.sell_base_value())
+
+            return scale_by_balance(free_quote, total_quote, sell_base_value, x, y)
+
+        return await self.retry_policy.call_async(attempt, name="scale_by_balance()")
+
+    async def seconds_since_last_trade(self):
+        """
+        Get seconds since last trade, from the trade tracker. Only when it doesn't know the last
+        trade (on start, after a stream reconnect) is it fetched, transient errors being retried by the retry policy.
+        """
+        if not self.trade_tracker.known:
+            trades = await self.retry_policy.call_async(lambda: self.fetch_my_trades(self.s, limit=1), name="seconds_since_last_trade()")
+            self.trade_tracker.seed(trades[0]["timestamp"] if trades else None)
+
+        last_trade = self.trade_tracker.last_trade()
+        if last_trade is None:
+            logs.info("No trades found in seconds_since_last_trade. Returning float(\"inf\")")
+            return float("inf")
+
+        return time.time() - last_trade // 1000
+
+    async def get_lowest_sell_order(self):
+        """
+        Get lowest sell order.
+        """
+        orders = await self.open_sell_orders()
+        return min(orders, key=lambda order: order["price"]) if orders else None
+
+    async def get_highest_buy_order(self):
+        """
+        Get highest buy order.
+        """
+        orders = await self.open_buy_orders()
+        return max(orders, key=lambda order: order["price"]) if orders else None
+
+    async def cancel_all_buy_orders(self):
+        """
+        Cancel all buy orders for the current symbol, concurrently.
+        """
+        await asyncio.gather(*(self.cancel_order(order["id"], symbol=self.s) for order in await self.open_buy_orders()))
@@ -1,14 +1,19 @@
 import os
 import pprint
-from decimal import ROUND_FLOOR, ROUND_CEILING
+import time
+from decimal import ROUND_FLOOR, ROUND_CEILING, Decimal
 
 import numpy as np
 
+import logs
+import metrics
 from exchange import ExtendedSymbolExchange
+from rebalance_executor import RebalanceExecutor
 from utils import (
     amount_to_units,
     calculate_min_order_amount,
     how_many_orders_can_fit_in_spread_given_amount,
+    min_order_units_array,
     round_units,
     units_to_amount,
 )
@@ -38,7 +43,7 @@ def print_orders(exchange: ExtendedSymbolExchange, orders):
     min_price = exchange.round(min(prices), "price")
     max_price = exchange.round(max(prices), "price")
 
-    print(
+    logs.info(
         f"Number of sell orders: {len_orders} | Sum amount: {sum_amount} | Sum total: {sum_total} | Min price: {min_price} | Max price: {max_price}"
     )
     
@@ -47,8 +52,99 @@ def print_orders(exchange: ExtendedSymbolExchange, orders):
 ############################################
 
 
-def get_new_orders(exchange: ExtendedSymbolExchange, n, sum_amount, min_price, max_price, set_amount=None):
-    
+def get_new_orders(exchange: ExtendedSymbolExchange, n, sum_amount, min_price, max_price, set_amount=None, lower_set_amount=False):
+    """
+    Plan n sell orders evenly spread over [min_price, max_price] holding exactly sum_amount.
+
+    The whole ladder is computed in one vectorized pass over int64 lot units and matches
+    get_new_orders_reference() bit for bit. With lower_set_amount=True, set_amount is
+    lowered in min_amount steps to the largest value that fits, the same result the
+    decrement-and-retry loop in rebalance_sell_orders used to reach.
+    """
+    lot = exchange.math.lot
+    scale = lot.unit
+
+    # round() of the np.float64 values from linspace has always used numpy's rounding, keep it
+    price_decimals = exchange.decimal_places("price")
+    prices = np.linspace(min_price, max_price, num=n)
+    if price_decimals is not None:
+        prices = np.round(prices, price_decimals)
+    total_units = lot.to_units(exchange.round(sum_amount, "amount"))
+    min_units = min_order_units_array(prices, exchange.min_cost, exchange.min_price, exchange.min_amount)
+
+    sum_min_units = int(min_units.sum())
+    if sum_min_units > total_units:
+        raise AssertionError(
+            f"Cannot rebalance: total amount {sum_amount} ({total_units} units) is less than "
+            f"sum of per-order minimums ({sum_min_units} units)"
+        )
+
+    if set_amount is None:
+        units = min_units.copy()
+    else:
+        if lower_set_amount:
+            set_amount = _max_set_amount(exchange, min_units, total_units, set_amount)
+        target_units = lot.to_units_rounded(set_amount, ROUND_FLOOR)
+        units = np.maximum(min_units, target_units)
+        if int(units.sum()) > total_units:
+            # Caller should lower set_amount; we fail loudly so rebalance can adjust deterministically.
+            raise AssertionError(
+                f"set_amount too high: target {set_amount} => {target_units} units results in "
+                f"sum(units)={int(units.sum())} > total_units={total_units}"
+            )
+
+    units[0] += total_units - int(units.sum())
+
+    order_prices = prices + exchange.min_price
+    if price_decimals is not None:
+        order_prices = np.round(order_prices, price_decimals)
+    amounts = exchange.round_array(units / scale, "amount")
+
+    assert np.array_equal(np.rint(amounts * scale).astype(np.int64), units)
+    assert np.all(amounts * order_prices >= exchange.min_cost)
+    assert int(units.sum()) == total_units
+
+    return [{"price": p, "amount": a} for p, a in zip(order_prices.tolist(), amounts.tolist())]
+
+
+def _max_set_amount(exchange: ExtendedSymbolExchange, min_units, total_units, set_amount):
+    """
+    Largest set_amount - k * min_amount (k >= 0) whose ladder fits in total_units.
+
+    The units needed, sum(max(min_units, target)), only shrink as the target goes down,
+    so k is found by binary search instead of retrying one min_amount at a time.
+    """
+    step = Decimal(str(exchange.min_amount))
+    start = Decimal(str(set_amount))
+    start_units = exchange.math.lot.to_units_rounded(set_amount, ROUND_FLOOR)
+    units_per_step = exchange.math.lot.step_units
+
+    def fits(k):
+        return int(np.maximum(min_units, start_units - k * units_per_step).sum()) <= total_units
+
+    if fits(0):
+        return set_amount
+
+    # below the smallest per-order minimum every order sits at its minimum, which fits
+    lo, hi = 0, max(1, -(-(start_units - int(min_units.min())) // units_per_step))
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if fits(mid):
+            hi = mid
+        else:
+            lo = mid
+
+    lowered = start - hi * step
+    if lowered <= 0:
+        raise AssertionError(f"set_amount cannot be lowered below {set_amount} without reaching zero")
+
+    return exchange.round(float(lowered), "amount")
+
+
+def get_new_orders_reference(exchange: ExtendedSymbolExchange, n, sum_amount, min_price, max_price, set_amount=None):
+    """
+    Per-level planner that get_new_orders() replaced, kept as the reference it is checked against.
+    """
     prices = np.linspace(min_price, max_price, num=n)
     prices = [exchange.round(p, "price") for p in prices]
     
@@ -95,13 +191,16 @@ def get_new_orders(exchange: ExtendedSymbolExchange, n, sum_amount, min_price, m
     return orders
 
 
-def replace_orders(exchange: ExtendedSymbolExchange, orders, orders_new):
+def check_replacement(exchange: ExtendedSymbolExchange, orders, orders_new):
+    """
+    Assert that orders_new hold exactly the amount of orders, for at least the same total value.
+    """
     sum_amount = exchange.round(sum([order["amount"] for order in orders]), "amount")
     sum_amount_new = exchange.round(sum([order["amount"] for order in orders_new]), "amount")
 
-    print(f"Are sum_amount and sum_amount_new equal? {sum_amount} {sum_amount_new}")
-    min_amount_step = exchange.min_amount
-    assert amount_to_units(min_amount_step, sum_amount) == amount_to_units(min_amount_step, sum_amount_new), (
+    logs.info(f"Are sum_amount and sum_amount_new equal? {sum_amount} {sum_amount_new}")
+    lot = exchange.math.lot
+    assert lot.to_units(sum_amount) == lot.to_units(sum_amount_new), (
         f"Sum amount must be exactly equal | {sum_amount} != {sum_amount_new}"
     )
 
@@ -110,39 +209,24 @@ def replace_orders(exchange: ExtendedSymbolExchange, orders, orders_new):
 
     assert sum_value_new >= sum_value, f"Sum value must be greater or equal | {sum_value_new} < {sum_value}"
 
-    # cancel current orders
-    for order in orders:
-        exchange.cancel_order(order["id"], symbol=exchange.s)
 
-    # create new orders
-    for order in orders_new:
-        
-        print(f"{exchange.s} limit sell {order['amount']} {order['price']} ")
+def replace_orders(exchange: ExtendedSymbolExchange, orders, orders_new, max_workers=8):
+    check_replacement(exchange, orders, orders_new)
 
-        exchange.create_order(
-            symbol=exchange.s, type="limit", side="sell", amount=order["amount"], price=order["price"],
-            rebalance_on_max_orders=False
-        )
+    # cancel current orders and create new ones, paired per price level and run concurrently
+    return RebalanceExecutor(exchange, max_workers=max_workers).execute(orders, orders_new)
 
 ############################################
 
 
-def rebalance_sell_orders(exchange_instance=None):
+def plan_sell_orders(exchange: ExtendedSymbolExchange, orders):
     """
-    Rebalance sell orders by redistributing them evenly across the price spread.
-    
-    Args:
-        exchange_instance: An instance of ExtendedSymbolExchange (optional, uses global if not provided)
-        
-    Returns:
-        tuple: (old_orders, new_orders) - the orders before and after rebalancing
+    Plan the sell ladder that replaces `orders`: as many orders as fit the spread (at most
+    80% of MAX_NUM_ORDERS), holding the same amount for at least the same total value.
+
+    Only uses the market limits and rounding of `exchange`, so it also runs against
+    the simulated exchange of backtest.py.
     """
-    if exchange_instance is None:
-        raise ValueError("rebalance_sell_orders(exchange_instance) requires an exchange instance")
-    exchange = exchange_instance
-    
-    print("CURRENT SELL ORDERS")
-    orders = exchange.open_sell_orders()
     sum_amount, sum_total, min_price, max_price = print_orders(exchange, orders)
     n = how_many_orders_can_fit_in_spread_given_amount(
         sum_amount,
@@ -158,50 +242,36 @@ def rebalance_sell_orders(exchange_instance=None):
 
     if n > max_num_orders:
 
-        print(f"Number of orders {n} is greater than max number of orders {max_num_orders} \n")
+        logs.info(f"Number of orders {n} is greater than max number of orders {max_num_orders} \n")
 
         n = int(max_num_orders * 0.8)
         
         set_amount = exchange.round(sum_amount / n, "amount")
 
-        print("POTENTIAL NEW SELL ORDERS")
-        while True:
-            try:
-                new_orders = get_new_orders(exchange, n, sum_amount, min_price, max_price, set_amount=set_amount)
-                break
-            except AssertionError:
-                set_amount = exchange.round(set_amount - exchange.min_amount, "amount")
-                if set_amount <= 0:
-                    raise
-        
+        logs.info("POTENTIAL NEW SELL ORDERS")
+        new_orders = get_new_orders(exchange, n, sum_amount, min_price, max_price, set_amount=set_amount, lower_set_amount=True)
+
         
         sum_amount = exchange.round(sum([order["amount"] for order in orders]), "amount")
         sum_amount_new = exchange.round(sum([order["amount"] for order in new_orders]), "amount")
-        assert amount_to_units(exchange.min_amount, sum_amount) == amount_to_units(exchange.min_amount, sum_amount_new)
+        assert exchange.math.lot.to_units(sum_amount) == exchange.math.lot.to_units(sum_amount_new)
         _, new_sum_total, _, _ = print_orders(exchange, new_orders)
 
     else:
 
-        print("Number of orders is less than max number of orders \n")
+        logs.info("Number of orders is less than max number of orders \n")
         
         # Still ensure we don't exceed 80% of max to leave room for new orders
         safe_limit = int(max_num_orders * 0.8)
         if n > safe_limit:
-            print(f"Limiting orders to safe threshold: {n} -> {safe_limit}")
+            logs.info(f"Limiting orders to safe threshold: {n} -> {safe_limit}")
             n = safe_limit
             set_amount = exchange.round(sum_amount / n, "amount")
-            while True:
-                try:
-                    new_orders = get_new_orders(exchange, n, sum_amount, min_price, max_price, set_amount=set_amount)
-                    break
-                except AssertionError:
-                    set_amount = exchange.round(set_amount - exchange.min_amount, "amount")
-                    if set_amount <= 0:
-                        raise
+            new_orders = get_new_orders(exchange, n, sum_amount, min_price, max_price, set_amount=set_amount, lower_set_amount=True)
         else:
             new_orders = get_new_orders(exchange, n, sum_amount, min_price, max_price)
 
-        print("POTENTIAL NEW SELL ORDERS")
+        logs.info("POTENTIAL NEW SELL ORDERS")
         _, new_sum_total, _, _ = print_orders(exchange, new_orders)
 
     if sum_total > new_sum_total:
@@ -209,12 +279,36 @@ def rebalance_sell_orders(exchange_instance=None):
         for order in new_orders:
             order["price"] = exchange.round(order["price"] * multiplier + exchange.min_price, "price")
 
-        print("POTENTIAL NEW MULTIPLIED SELL ORDERS")
+        logs.info("POTENTIAL NEW MULTIPLIED SELL ORDERS")
         _, _, _, _ = print_orders(exchange, new_orders)
 
-    replace_orders(exchange, orders, new_orders)
+    return new_orders
+
+
+def rebalance_sell_orders(exchange_instance=None):
+    """
+    Rebalance sell orders by redistributing them evenly across the price spread.
+    
+    Args:
+        exchange_instance: An instance of ExtendedSymbolExchange (optional, uses global if not provided)
+        
+    Returns:
+        tuple: (old_orders, new_orders) - the orders before and after rebalancing
+    """
+    if exchange_instance is None:
+        raise ValueError("rebalance_sell_orders(exchange_instance) requires an exchange instance")
+    exchange = exchange_instance
+    started = time.perf_counter()
+    
+    logs.info("CURRENT SELL ORDERS")
+    orders = exchange.open_sell_orders()
+    new_orders = plan_sell_orders(exchange, orders)
+
+    report = replace_orders(exchange, orders, new_orders)
+    metrics.REBALANCE_OPS.labels(exchange.s).observe(report["ops"])
+    metrics.REBALANCE_SECONDS.labels(exchange.s).observe(time.perf_counter() - started)
 
-    print("NEW SELL ORDERS")
+    logs.info("NEW SELL ORDERS")
     orders_after = exchange.open_sell_orders()
     _, _, _, _ = print_orders(exchange, orders_after)
     
@@ -0,0 +1,532 @@
+"""
+Offline backtester for the market-buy / limit-ladder strategy of bot.py.
+
+Replays 1-second klines (the CSV files from data.binance.vision) against a simulated
+exchange that enforces the market limits ExtendedSymbolExchange loads. Instead of
+stepping through every second, the engine jumps straight to the next second where
+something can happen: the lowest sell is reached by the high, the highest buy by the
+low, a buy times out, or the bot's sleep timer runs out. Those seconds are found with
+NumPy over block maxima/minima of the kline arrays, so a month of data replays in seconds.
+
+    python backtest.py BTCFDUSD-1s-2025-01-*.csv --quote 1000
+    python backtest.py --synthetic 30 --profit-margin-max 1.01
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import random
+import time
+
+import numpy as np
+import ccxt
+
+from averager import plan_sell_orders
+from market_math import MarketMath
+from exchange import ExtendedSymbolExchange
+from order_monitor import PriceIndex
+from strategy import limit_buy_for, limit_sell_for, scale_by_balance
+from utils import calculate_min_order_amount
+
+
+# BTC/FDUSD as loaded by ExtendedSymbolExchange, used when no market file is given
+DEFAULT_MARKET = {
+    "symbol": "BTC/FDUSD",
+    "base": "BTC",
+    "quote": "FDUSD",
+    "precision": {"amount": 1e-05, "price": 0.01, "base": 1e-08, "quote": 1e-08},
+    "limits": {
+        "amount": {"min": 1e-05},
+        "price": {"min": 0.01},
+        "cost": {"min": 5.0},
+    },
+    "info": {"filters": [{"filterType": "MAX_NUM_ORDERS", "maxNumOrders": "200"}]},
+}
+
+# klines are scanned in blocks of this many seconds when looking for the next fill
+BLOCK = 4096
+
+
+def load_klines(paths):
+    """
+    Load 1-second kline CSV files into an array of [time (s), open, high, low, close] rows.
+
+    Binance kline files have open times in milliseconds (microseconds since 2025), with or without a header.
+    """
+    arrays = []
+    for path in paths:
+        with open(path) as f:
+            has_header = not f.readline()[:1].isdigit()
+        arrays.append(np.loadtxt(path, delimiter=",", usecols=(0, 1, 2, 3, 4), skiprows=int(has_header), ndmin=2))
+
+    klines = np.concatenate(arrays)
+    klines = klines[np.argsort(klines[:, 0], kind="stable")]
+    klines[:, 0] /= np.where(klines[:, 0] > 1e14, 1e6, 1e3)
+    return klines
+
+
+def synthetic_klines(days, price=100000.0, volatility=0.0002, seed=0):
+    """
+    Random-walk 1-second klines, for trying the backtester without downloading data.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(days * 86400)
+
+    close = price * np.exp(np.cumsum(rng.normal(0, volatility, n)))
+    open_ = np.concatenate(([price], close[:-1]))
+    wick = np.abs(rng.normal(0, volatility / 2, (2, n)))
+    high = np.maximum(open_, close) * (1 + wick[0])
+    low = np.minimum(open_, close) * (1 - wick[1])
+    times = 1700000000 + np.arange(n, dtype=np.float64)
+
+    return np.column_stack((times, open_, high, low, close))
+
+
+class SimExchange():
+    """
+    Simulated spot exchange holding the balances and open orders of a backtest.
+
+    Orders are checked like Binance does: amounts are truncated to the amount step and
+    prices rounded to the tick, and orders below min_amount / min_cost, without enough
+    free balance, or over MAX_NUM_ORDERS are rejected with the ccxt error the live bot gets.
+    Limit orders rest on the book and fill at their own price.
+    """
+
+    # the exact same rounding as the live bot
+    decimal_places = ExtendedSymbolExchange.decimal_places
+    round = ExtendedSymbolExchange.round
+    round_array = ExtendedSymbolExchange.round_array
+    get_max_num_orders = ExtendedSymbolExchange.get_max_num_orders
+
+    def __init__(self, market, quote_balance, base_balance=0.0, fee=0.001):
+        self.m = market
+        self.s = market["symbol"]
+        self.base = market["base"]
+        self.quote = market["quote"]
+
+        self.precision = market["precision"]
+
+        self.min_amount = market["limits"]["amount"]["min"]
+        self.min_price = market["limits"]["price"]["min"]
+        self.min_cost = market["limits"]["cost"]["min"]
+
+        self.math = MarketMath(self.precision, market["limits"])
+
+        self.max_num_orders = self.get_max_num_orders()
+
+        self.fee = fee
+
+        self.quote_free = self.quote_total = quote_balance
+        self.base_free = self.base_total = base_balance
+        self.fees_paid = 0.0
+
+        self.orders = {}
+        self.indexes = {"buy": PriceIndex(), "sell": PriceIndex()}
+        self.sell_value = 0.0
+
+        self._ids = itertools.count(1)
+
+    def min_order_amount(self, price):
+        return calculate_min_order_amount(price, self.min_cost, self.min_price, self.min_amount)
+
+    def scale_by_balance(self, x, y):
+        return scale_by_balance(self.quote_free, self.quote_total, self.sell_value, x, y)
+
+    def open_sell_orders(self):
+        return [self.orders[id] for id in self.indexes["sell"].between()]
+
+    def open_buy_orders(self):
+        return [self.orders[id] for id in self.indexes["buy"].between()]
+
+    def _truncate_amount(self, amount):
+        units = int(amount / self.min_amount + 1e-9)
+        return self.round(units * self.min_amount, "amount")
+
+    def create_order(self, type, side, amount, price, timestamp, market_price):
+        """
+        Place an order at `timestamp`. Market orders, and limit orders crossing `market_price`, fill immediately.
+        """
+        amount = self._truncate_amount(amount)
+        price = self.round(market_price if type == "market" else price, "price")
+        cost = amount * price
+
+        if amount < self.min_amount or cost < self.min_cost:
+            raise ccxt.errors.InvalidOrder('binance {"code":-1013,"msg":"Filter failure: NOTIONAL"}')
+
+        if type == "limit" and len(self.orders) >= self.max_num_orders:
+            raise ccxt.errors.InvalidOrder('binance {"code":-2010,"msg":"Filter failure: MAX_NUM_ORDERS"}')
+
+        if side == "buy" and cost * (1 + self.fee) > self.quote_free:
+            raise ccxt.errors.InsufficientFunds(f"{self.quote} free {self.quote_free} < {cost}")
+
+        if side == "sell" and amount > self.base_free + self.min_amount / 2:
+            raise ccxt.errors.InsufficientFunds(f"{self.base} free {self.base_free} < {amount}")
+
+        order = {
+            "id": str(next(self._ids)),
+            "type": type,
+            "side": side,
+            "price": price,
+            "amount": amount,
+            "filled": 0.0,
+            "status": "open",
+            "timestamp": timestamp,
+        }
+
+        crosses = market_price <= price if side == "buy" else market_price >= price
+        if type == "market" or crosses:
+            self.fill(order, timestamp)
+            return order
+
+        if side == "buy":
+            self.quote_free -= cost * (1 + self.fee)
+        else:
+            self.base_free -= amount
+            self.sell_value += cost
+
+        self.orders[order["id"]] = order
+        self.indexes[side].add(order)
+        return order
+
+    def cancel_order(self, id):
+        order = self.orders.pop(id)
+        self.indexes[order["side"]].discard(id)
+
+        if order["side"] == "buy":
+            self.quote_free += order["price"] * order["amount"] * (1 + self.fee)
+        else:
+            self.base_free += order["amount"]
+            self.sell_value -= order["price"] * order["amount"]
+
+        order["status"] = "canceled"
+        return order
+
+    def fill(self, order, timestamp):
+        """
+        Fill an order completely at its price, paying the fee in the quote currency.
+        """
+        was_open = self.orders.pop(order["id"], None) is not None
+        if was_open:
+            self.indexes[order["side"]].discard(order["id"])
+
+        cost = order["price"] * order["amount"]
+        fee = cost * self.fee
+        self.fees_paid += fee
+
+        if order["side"] == "buy":
+            if not was_open:
+                self.quote_free -= cost + fee
+            self.quote_total -= cost + fee
+            self.base_free += order["amount"]
+            self.base_total += order["amount"]
+        else:
+            if was_open:
+                self.sell_value -= cost
+            else:
+                self.base_free -= order["amount"]
+            self.base_total -= order["amount"]
+            self.quote_free += cost - fee
+            self.quote_total += cost - fee
+
+        order["filled"] = order["amount"]
+        order["status"] = "closed"
+        order["fill_timestamp"] = timestamp
+
+    def equity(self, price):
+        """
+        Total account value in the quote currency at `price`.
+        """
+        return self.quote_total + self.base_total * price
+
+
+class Backtest():
+    """
+    Event-driven replay of bot.py: market buy when no trade happened for the sleep timer,
+    limit sell every filled buy, limit buy every filled sell, cancel buys after BUY_CANCEL_TIMEOUT,
+    and rebalance the sell ladder on MAX_NUM_ORDERS.
+    """
+
+    def __init__(self, klines, exchange, profit_margin_min, profit_margin_max, sleep_min, sleep_max, buy_cancel_timeout, seed=0):
+        self.exchange = exchange
+
+        self.times = np.ascontiguousarray(klines[:, 0])
+        self.high = np.ascontiguousarray(klines[:, 2])
+        self.low = np.ascontiguousarray(klines[:, 3])
+        self.close = np.ascontiguousarray(klines[:, 4])
+
+        n_blocks = -(-len(self.times) // BLOCK)
+        padded = n_blocks * BLOCK - len(self.times)
+        self.block_high = np.pad(self.high, (0, padded), constant_values=-np.inf).reshape(n_blocks, BLOCK).max(axis=1)
+        self.block_low = np.pad(self.low, (0, padded), constant_values=np.inf).reshape(n_blocks, BLOCK).min(axis=1)
+
+        self.profit_margin_min = profit_margin_min
+        self.profit_margin_max = profit_margin_max
+        self.sleep_min = sleep_min
+        self.sleep_max = sleep_max
+        self.buy_cancel_timeout = buy_cancel_timeout
+
+        self.random = random.Random(seed)
+
+        self.last_trade = -np.inf
+        self.deadlines = {}
+
+        self.counts = dict.fromkeys(
+            ["events", "market_buys", "sells_filled", "buys_filled", "buys_canceled", "rejected", "insufficient_funds", "rebalances"], 0
+        )
+
+    def _first_index(self, values, blocks, start, reached):
+        """
+        First index >= start where reached(values[index]) holds, or len(values).
+        """
+        n = len(values)
+        if start >= n:
+            return n
+
+        block = start // BLOCK
+        end = min((block + 1) * BLOCK, n)
+        hits = reached(values[start:end])
+        if hits.any():
+            return start + int(hits.argmax())
+
+        hits = reached(blocks[block + 1:])
+        if not hits.any():
+            return n
+
+        block += 1 + int(hits.argmax())
+        hits = reached(values[block * BLOCK:(block + 1) * BLOCK])
+        return block * BLOCK + int(hits.argmax())
+
+    def _next_event(self, start):
+        exchange = self.exchange
+        n = len(self.times)
+
+        candidates = [n]
+
+        lowest_sell = exchange.indexes["sell"].lowest()
+        if lowest_sell is not None:
+            price = exchange.orders[lowest_sell]["price"]
+            candidates.append(self._first_index(self.high, self.block_high, start, lambda v: v >= price))
+
+        highest_buy = exchange.indexes["buy"].highest()
+        if highest_buy is not None:
+            price = exchange.orders[highest_buy]["price"]
+            candidates.append(self._first_index(self.low, self.block_low, start, lambda v: v <= price))
+
+        if self.deadlines:
+            candidates.append(int(np.searchsorted(self.times, min(self.deadlines.values()), side="left")))
+
+        buy_at = self.last_trade + exchange.scale_by_balance(self.sleep_max, self.sleep_min)
+        candidates.append(int(np.searchsorted(self.times, buy_at, side="right")))
+
+        return max(start, min(candidates))
+
+    def run(self):
+        """
+        Replay all klines. Returns a report of the run.
+        """
+        started = time.perf_counter()
+        exchange = self.exchange
+        start_equity = exchange.equity(self.close[0])
+
+        i = self._next_event(0)
+        while i < len(self.times):
+            self.counts["events"] += 1
+            self._step(i)
+            i = self._next_event(i + 1)
+
+        elapsed = time.perf_counter() - started
+        last_price = self.close[-1]
+
+        return {
+            "seconds": float(self.times[-1] - self.times[0]),
+            "klines": len(self.times),
+            "elapsed": elapsed,
+            "start_equity": start_equity,
+            "end_equity": exchange.equity(last_price),
+            "pnl": exchange.equity(last_price) - start_equity,
+            "fees": exchange.fees_paid,
+            "quote_total": exchange.quote_total,
+            "base_total": exchange.base_total,
+            "open_sells": len(exchange.indexes["sell"]),
+            "open_buys": len(exchange.indexes["buy"]),
+            **self.counts,
+        }
+
+    def _step(self, i):
+        exchange = self.exchange
+        now, high, low = self.times[i], self.high[i], self.low[i]
+
+        # only orders resting before this second can be filled by it
+        sells = [exchange.orders[id] for id in exchange.indexes["sell"].between(None, high)]
+        buys = [exchange.orders[id] for id in exchange.indexes["buy"].between(low, None)]
+
+        for order in sells:
+            if order["id"] in exchange.orders and order["timestamp"] < now:
+                exchange.fill(order, now)
+                self.last_trade = now
+                self.counts["sells_filled"] += 1
+                self.limit_buy(order, i)
+
+        for order in buys:
+            if order["id"] in exchange.orders and order["timestamp"] < now:
+                exchange.fill(order, now)
+                self.deadlines.pop(order["id"], None)
+                self.last_trade = now
+                self.counts["buys_filled"] += 1
+                self.limit_sell(order, i)
+
+        for id, deadline in list(self.deadlines.items()):
+            if deadline <= now:
+                del self.deadlines[id]
+                if id in exchange.orders:
+                    exchange.cancel_order(id)
+                    self.counts["buys_canceled"] += 1
+
+        if now - self.last_trade > exchange.scale_by_balance(self.sleep_max, self.sleep_min):
+            self.market_buy(i)
+
+    def _profit_scale(self):
+        return self.random.uniform(self.profit_margin_min, self.exchange.scale_by_balance(self.profit_margin_min, self.profit_margin_max))
+
+    def create_order(self, i, type, side, amount, price=None, rebalance_on_max_orders=True):
+        """
+        ExtendedSymbolExchange.create_order() against the simulated exchange, including the MAX_NUM_ORDERS rebalance.
+        """
+        exchange = self.exchange
+        try:
+            return exchange.create_order(type, side, amount, price, self.times[i], self.close[i])
+        except ccxt.errors.InvalidOrder as e:
+            if str(e) != 'binance {"code":-2010,"msg":"Filter failure: MAX_NUM_ORDERS"}' or not rebalance_on_max_orders:
+                raise
+            self.rebalance(i)
+            return self.create_order(i, type, side, amount, price, rebalance_on_max_orders=False)
+
+    def rebalance(self, i):
+        """
+        Cancel open buys and replace the sell ladder like handle_max_orders_error() does.
+        """
+        exchange = self.exchange
+        self.counts["rebalances"] += 1
+
+        for order in exchange.open_buy_orders():
+            exchange.cancel_order(order["id"])
+            self.deadlines.pop(order["id"], None)
+
+        orders = exchange.open_sell_orders()
+        if not orders:
+            return
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            new_orders = plan_sell_orders(exchange, orders)
+
+        for order in orders:
+            exchange.cancel_order(order["id"])
+        for order in new_orders:
+            # resting orders of the ladder keep their place, new ones can only fill from the next second
+            exchange.create_order("limit", "sell", order["amount"], order["price"], self.times[i], self.close[i])
+
+    def market_buy(self, i):
+        exchange = self.exchange
+        try:
+            order = self.create_order(i, "market", "buy", exchange.min_order_amount(self.close[i]))
+        except ccxt.errors.InsufficientFunds:
+            self.counts["insufficient_funds"] += 1
+            # bot.py retries after sleeping, which the sleep timer below reproduces
+            self.last_trade = self.times[i]
+            return
+        except ccxt.errors.ExchangeError:
+            self.counts["rejected"] += 1
+            self.last_trade = self.times[i]
+            return
+
+        self.last_trade = self.times[i]
+        self.counts["market_buys"] += 1
+        self.limit_sell(order, i)
+
+    def limit_sell(self, order, i):
+        sell_price, sell_amount = limit_sell_for(order, self._profit_scale())
+        try:
+            sell_order = self.create_order(i, "limit", "sell", sell_amount, sell_price)
+        except ccxt.errors.InsufficientFunds:
+            self.counts["insufficient_funds"] += 1
+            return
+        except ccxt.errors.ExchangeError:
+            self.counts["rejected"] += 1
+            return
+
+        if sell_order["status"] == "closed":
+            self.last_trade = self.times[i]
+            self.counts["sells_filled"] += 1
+            self.limit_buy(sell_order, i)
+
+    def limit_buy(self, order, i):
+        exchange = self.exchange
+        buy_price, buy_amount = limit_buy_for(order, self._profit_scale(), exchange.min_cost, exchange.min_price, exchange.min_amount)
+        try:
+            buy_order = self.create_order(i, "limit", "buy", buy_amount, buy_price)
+        except ccxt.errors.InsufficientFunds:
+            self.counts["insufficient_funds"] += 1
+            return
+        except ccxt.errors.ExchangeError:
+            self.counts["rejected"] += 1
+            return
+
+        if buy_order["status"] == "closed":
+            self.last_trade = self.times[i]
+            self.counts["buys_filled"] += 1
+            self.limit_sell(buy_order, i)
+            return
+
+        self.deadlines[buy_order["id"]] = self.times[i] + self.buy_cancel_timeout
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest the bot.py strategy on 1-second klines.")
+    parser.add_argument("klines", nargs="*", help="Binance 1s kline CSV files")
+    parser.add_argument("--synthetic", type=float, default=None, help="Use this many days of random-walk klines instead")
+    parser.add_argument("--market", default=None, help="JSON file with a ccxt market structure (default: BTC/FDUSD limits)")
+    parser.add_argument("--quote", type=float, default=1000.0, help="Starting quote balance")
+    parser.add_argument("--base", type=float, default=0.0, help="Starting base balance")
+    parser.add_argument("--fee", type=float, default=0.001, help="Fee rate paid on every fill")
+    parser.add_argument("--profit-margin-min", type=float, default=1.0005)
+    parser.add_argument("--profit-margin-max", type=float, default=1.005)
+    parser.add_argument("--sleep-min", type=float, default=300)
+    parser.add_argument("--sleep-max", type=float, default=1200)
+    parser.add_argument("--buy-cancel-timeout", type=float, default=1200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.synthetic is not None:
+        klines = synthetic_klines(args.synthetic, seed=args.seed)
+    elif args.klines:
+        klines = load_klines(args.klines)
+    else:
+        parser.error("pass kline files or --synthetic DAYS")
+
+    market = DEFAULT_MARKET
+    if args.market is not None:
+        with open(args.market) as f:
+            market = json.load(f)
+
+    exchange = SimExchange(market, quote_balance=args.quote, base_balance=args.base, fee=args.fee)
+    backtest = Backtest(
+        klines,
+        exchange,
+        profit_margin_min=args.profit_margin_min,
+        profit_margin_max=args.profit_margin_max,
+        sleep_min=args.sleep_min,
+        sleep_max=args.sleep_max,
+        buy_cancel_timeout=args.buy_cancel_timeout,
+        seed=args.seed,
+    )
+
+    report = backtest.run()
+
+    for key, value in report.items():
+        print(f"{key:<20} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+"""
+Micro-benchmarks for the trading hot paths, run offline against recorded fixtures.
+
+The exchange is a real ExtendedSymbolExchange talking to fake_exchange.FakeBinance, with the
+market filters and sell ladders (50/200/1000 orders) stored in benchmarks/fixtures.json.
+Each benchmark reports per-call latency percentiles and the memory allocated per call
+(tracemalloc peak above the starting point), and can be saved as a baseline to compare later runs to.
+
+    python bench.py                     # run, compare with benchmarks/baseline.json if present
+    python bench.py --save              # run and store the results as the new baseline
+    python bench.py -k get_new_orders   # only benchmarks whose name contains the string
+    python bench.py --record            # regenerate benchmarks/fixtures.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from decimal import ROUND_CEILING
+
+import numpy as np
+
+from averager import get_new_orders, plan_sell_orders
+from exchange import ExtendedSymbolExchange
+from fake_exchange import FakeBinance
+from order_monitor import OrderMonitor
+from utils import (
+    amount_to_units,
+    calculate_min_order_amount,
+    how_many_orders_can_fit_in_spread_given_amount,
+    round_units,
+)
+from weight_budget import WeightBudget
+
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+FIXTURES_FILE = os.path.join(BENCH_DIR, "fixtures.json")
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+
+LADDER_SIZES = (50, 200, 1000)
+
+# a benchmark is a regression when its best-round median is this much slower than the baseline
+REGRESSION_RATIO = 1.25
+
+BENCHMARKS = []
+
+
+def benchmark(name, calls=1000):
+    """
+    Register a benchmark. The decorated function gets the context and returns the callable to time.
+
+    A setup raising AssertionError (the planners' way of refusing an input) skips the benchmark.
+    """
+    def register(setup):
+        BENCHMARKS.append((name, calls, setup))
+        return setup
+    return register
+
+
+############################################
+# fixtures
+
+
+def record_fixtures(path=FIXTURES_FILE, seed=0):
+    """
+    Record the market as ccxt parses it from the fake exchange, and sell ladders
+    shaped like the bot's (one order per filled buy, priced 0.05-0.5% above it).
+    """
+    fake = FakeBinance(price=100000.0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        exchange = ExtendedSymbolExchange("BTC/FDUSD", fake.exchange_config(), budget=WeightBudget(weight_limit=10**9))
+
+    rng = random.Random(seed)
+    ladders = {}
+    for size in LADDER_SIZES:
+        price = fake.price
+        prices, amounts = [], []
+        for _ in range(size):
+            price *= 1 + rng.gauss(0, 0.001)
+            buy_price = exchange.round(price, "price")
+            prices.append(exchange.round(buy_price * rng.uniform(1.0005, 1.005), "price"))
+            amounts.append(exchange.min_order_amount(buy_price))
+        ladders[str(size)] = {"price": prices, "amount": amounts}
+
+    fixtures = {
+        "market": {
+            "symbol": exchange.s,
+            "price": fake.price,
+            "tick_size": exchange.precision["price"],
+            "step_size": exchange.precision["amount"],
+            "min_notional": exchange.min_cost,
+            "max_num_orders": exchange.max_num_orders,
+        },
+        "ladders": ladders,
+    }
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(fixtures, f)
+    print(f"Recorded {', '.join(ladders)} order ladders to {path}")
+
+
+def load_context(path=FIXTURES_FILE):
+    """
+    Build the exchange and order ladders the benchmarks run against.
+    """
+    with open(path) as f:
+        fixtures = json.load(f)
+
+    market = fixtures["market"]
+    fake = FakeBinance(
+        symbol=market["symbol"],
+        price=market["price"],
+        tick_size=market["tick_size"],
+        step_size=market["step_size"],
+        min_notional=market["min_notional"],
+        max_num_orders=market["max_num_orders"],
+        fill_model="never",
+    )
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        exchange = ExtendedSymbolExchange(market["symbol"], fake.exchange_config(), budget=WeightBudget(weight_limit=10**9))
+        order_monitor = OrderMonitor(exchange)
+
+    ladders = {}
+    for size, ladder in fixtures["ladders"].items():
+        ladders[int(size)] = [
+            {
+                "id": str(i),
+                "datetime": "2025-01-01T00:00:00.000Z",
+                "type": "limit",
+                "side": "sell",
+                "price": price,
+                "amount": amount,
+                "filled": 0.0,
+                "status": "open",
+            }
+            for i, (price, amount) in enumerate(zip(ladder["price"], ladder["amount"]))
+        ]
+
+    return {"exchange": exchange, "order_monitor": order_monitor, "price": market["price"], "ladders": ladders}
+
+
+############################################
+# benchmarks
+
+
+@benchmark("utils.calculate_min_order_amount", calls=20000)
+def bench_calculate_min_order_amount(ctx):
+    exchange = ctx["exchange"]
+    return lambda: calculate_min_order_amount(ctx["price"], exchange.min_cost, exchange.min_price, exchange.min_amount)
+
+
+@benchmark("utils.amount_to_units", calls=20000)
+def bench_amount_to_units(ctx):
+    exchange = ctx["exchange"]
+    return lambda: amount_to_units(exchange.min_amount, 0.01234)
+
+
+@benchmark("utils.round_units", calls=20000)
+def bench_round_units(ctx):
+    exchange = ctx["exchange"]
+    return lambda: round_units(exchange.min_amount, 6.000000000000001e-05, ROUND_CEILING)
+
+
+@benchmark("MarketMath.lot.to_units", calls=20000)
+def bench_market_math_to_units(ctx):
+    lot = ctx["exchange"].math.lot
+    return lambda: lot.to_units(0.01234)
+
+
+@benchmark("MarketMath.lot.to_units_rounded", calls=20000)
+def bench_market_math_to_units_rounded(ctx):
+    lot = ctx["exchange"].math.lot
+    return lambda: lot.to_units_rounded(6.000000000000001e-05, ROUND_CEILING)
+
+
+@benchmark("ExtendedSymbolExchange.round", calls=20000)
+def bench_exchange_round(ctx):
+    exchange = ctx["exchange"]
+    return lambda: exchange.round(100123.456789, "price")
+
+
+def _ladder_totals(ladder):
+    prices = [o["price"] for o in ladder]
+    return sum(o["amount"] for o in ladder), min(prices), max(prices)
+
+
+def _register_ladder_benchmarks(size):
+
+    @benchmark(f"utils.how_many_orders_can_fit_in_spread_given_amount[{size}]", calls=200)
+    def bench_how_many(ctx):
+        exchange = ctx["exchange"]
+        sum_amount, min_price, max_price = _ladder_totals(ctx["ladders"][size])
+        return lambda: how_many_orders_can_fit_in_spread_given_amount(
+            sum_amount, min_price, max_price, exchange.min_cost, exchange.min_price, exchange.min_amount
+        )
+
+    @benchmark(f"averager.get_new_orders[{size}]", calls=200)
+    def bench_get_new_orders(ctx):
+        exchange = ctx["exchange"]
+        sum_amount, min_price, max_price = _ladder_totals(ctx["ladders"][size])
+        sum_amount = exchange.round(sum_amount, "amount")
+        n = how_many_orders_can_fit_in_spread_given_amount(
+            sum_amount, min_price, max_price, exchange.min_cost, exchange.min_price, exchange.min_amount
+        )
+        # the float estimate can be a few orders above what fits in whole lot units
+        while True:
+            try:
+                get_new_orders(exchange, n, sum_amount, min_price, max_price)
+                break
+            except AssertionError:
+                n -= 1
+        return lambda: get_new_orders(exchange, n, sum_amount, min_price, max_price)
+
+    @benchmark(f"averager.plan_sell_orders[{size}]", calls=100)
+    def bench_plan_sell_orders(ctx):
+        exchange = ctx["exchange"]
+        ladder = ctx["ladders"][size]
+
+        def plan():
+            # the planner prints the ladders it considers, keep that out of the timings
+            with contextlib.redirect_stdout(io.StringIO()):
+                plan_sell_orders(exchange, ladder)
+
+        plan()
+        return plan
+
+
+for _size in LADDER_SIZES:
+    _register_ladder_benchmarks(_size)
+
+
+@benchmark("OrderMonitor.log[open+close]", calls=5000)
+def bench_order_monitor_log(ctx):
+    order_monitor = ctx["order_monitor"]
+    ladder = ctx["ladders"][1000]
+    for order in ladder[:-1]:
+        order_monitor._add_open(order)
+
+    order = dict(ladder[-1])
+    closed = dict(order, status="closed", filled=order["amount"])
+
+    def log():
+        # log_order() prints every order, keep that out of the timings
+        with contextlib.redirect_stdout(io.StringIO()):
+            order_monitor.log(order)
+            order_monitor.log(closed)
+    return log
+
+
+@benchmark("OrderMonitor.get_lowest_sell_order[1000]", calls=20000)
+def bench_lowest_sell(ctx):
+    return ctx["order_monitor"].get_lowest_sell_order
+
+
+@benchmark("OrderMonitor.get_highest_buy_order", calls=20000)
+def bench_highest_buy(ctx):
+    return ctx["order_monitor"].get_highest_buy_order
+
+
+############################################
+# runner
+
+
+def measure(fn, calls):
+    """
+    Time `calls` calls of fn, then measure their allocations. Returns the result dict.
+    """
+    for _ in range(min(calls, 50)):
+        fn()
+
+    timings = np.empty(calls)
+    clock = time.perf_counter_ns
+    for i in range(calls):
+        start = clock()
+        fn()
+        timings[i] = clock() - start
+
+    # tracemalloc slows every allocation down, so it gets its own (shorter) pass
+    alloc_calls = max(1, min(calls, 200))
+    peaks = np.empty(alloc_calls)
+    tracemalloc.start()
+    try:
+        for i in range(alloc_calls):
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            fn()
+            peaks[i] = tracemalloc.get_traced_memory()[1] - current
+    finally:
+        tracemalloc.stop()
+
+    p50, p90, p99 = np.percentile(timings, [50, 90, 99]) / 1000
+    return {
+        "calls": calls,
+        # median of the fastest of 5 rounds, the least noisy number to compare runs by
+        "best_p50_us": min(np.median(chunk) for chunk in np.array_split(timings, 5)) / 1000,
+        "p50_us": p50,
+        "p90_us": p90,
+        "p99_us": p99,
+        "mean_us": timings.mean() / 1000,
+        "alloc_kib": float(np.median(peaks)) / 1024,
+    }
+
+
+def run(names=None):
+    ctx = load_context()
+    results = {}
+    for name, calls, setup in BENCHMARKS:
+        if names and not any(n in name for n in names):
+            continue
+        try:
+            fn = setup(ctx)
+        except AssertionError as e:
+            print(f"{name:<62} skipped: {e}")
+            continue
+        results[name] = measure(fn, calls)
+        print_result(name, results[name])
+    return results
+
+
+def print_result(name, result, baseline=None):
+    line = (
+        f"{name:<62} p50 {result['p50_us']:>10.2f} us | p90 {result['p90_us']:>10.2f} us | "
+        f"p99 {result['p99_us']:>10.2f} us | alloc {result['alloc_kib']:>9.2f} KiB"
+    )
+    if baseline is not None:
+        ratio = result["best_p50_us"] / baseline["best_p50_us"]
+        flag = " REGRESSION" if ratio > REGRESSION_RATIO else ""
+        line += f" | {ratio:5.2f}x baseline{flag}"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the trading hot paths.")
+    parser.add_argument("-k", dest="names", action="append", help="Only run benchmarks whose name contains this (repeatable)")
+    parser.add_argument("--save", action="store_true", help="Save the results as the new baseline")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--record", action="store_true", help="Regenerate the fixtures and exit")
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures()
+        return
+
+    results = run(args.names)
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump({"python": sys.version.split()[0], "machine": platform.machine(), "results": results}, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+
+    print(f"\nCompared with {args.baseline}")
+    regressions = 0
+    for name, result in results.items():
+        if name in baseline:
+            print_result(name, result, baseline[name])
+            regressions += result["best_p50_us"] / baseline[name]["best_p50_us"] > REGRESSION_RATIO
+
+    if regressions:
+        print(f"{regressions} regression(s) above {REGRESSION_RATIO}x the baseline")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Delayed order cancellation on a single worker thread.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+from utils import log_error
+
+
+class CancelScheduler():
+    """
+    Cancel orders once their deadline passes, from one worker thread for any number of orders.
+
+    Deadlines are kept in a heap: schedule() is O(log n), unschedule() marks the entry as
+    removed in O(1) (it is dropped when it reaches the top of the heap). Orders whose
+    deadlines fall within batch_window seconds of each other are handed to `cancel`
+    together, as one list.
+
+    `cancel` is called on the worker thread with a list of orders, and should not raise.
+    """
+
+    def __init__(self, cancel, batch_window=1.0, name="cancel-scheduler"):
+        self.cancel = cancel
+        self.batch_window = batch_window
+        self.name = name
+
+        self.scheduled = 0
+        self.unscheduled = 0
+        self.canceled = 0
+        self.batches = 0
+
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    def __len__(self):
+        with self._condition:
+            return len(self._entries)
+
+    def schedule(self, order, timeout):
+        """
+        Cancel `order` in `timeout` seconds, unless it is unscheduled before. Rescheduling replaces the deadline.
+        """
+        deadline = time.monotonic() + timeout
+
+        with self._condition:
+            previous = self._entries.pop(order["id"], None)
+            if previous is not None:
+                previous[2] = None
+
+            entry = [deadline, next(self._counter), order]
+            self._entries[order["id"]] = entry
+            heapq.heappush(self._heap, entry)
+            self.scheduled += 1
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+            # wake the worker only if the new deadline is the earliest one
+            if self._heap[0] is entry:
+                self._condition.notify()
+
+    def unschedule(self, id):
+        """
+        Drop the pending cancel of an order, e.g. once it is filled or canceled. Returns True if one was pending.
+        """
+        with self._condition:
+            entry = self._entries.pop(id, None)
+            if entry is None:
+                return False
+            entry[2] = None
+            self.unscheduled += 1
+            return True
+
+    def stop(self, timeout=5):
+        """
+        Stop the worker. Pending cancels are dropped.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _pop_due(self):
+        """
+        Pop the orders due by now + batch_window. Returns (orders, seconds until the next deadline or None).
+        """
+        heap = self._heap
+        now = time.monotonic()
+
+        # drop unscheduled entries from the top
+        while heap and heap[0][2] is None:
+            heapq.heappop(heap)
+
+        if not heap:
+            return [], None
+
+        if heap[0][0] > now:
+            return [], heap[0][0] - now
+
+        due = []
+        horizon = now + self.batch_window
+        while heap and heap[0][0] <= horizon:
+            _, _, order = heapq.heappop(heap)
+            if order is not None:
+                del self._entries[order["id"]]
+                due.append(order)
+        return due, 0
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self._stopped:
+                        return
+                    due, wait = self._pop_due()
+                    if due:
+                        break
+                    self._condition.wait(wait)
+
+            self.batches += 1
+            self.canceled += len(due)
+            try:
+                self.cancel(due)
+            except Exception as e:
+                log_error(e, "CancelScheduler.cancel")
+
+    def stats(self):
+        """
+        Get the pending count and scheduled/unscheduled/canceled counters.
+        """
+        return {
+            "pending": len(self),
+            "scheduled": self.scheduled,
+            "unscheduled": self.unscheduled,
+            "canceled": self.canceled,
+            "batches": self.batches,
+        }
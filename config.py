@@ -5,16 +5,19 @@ This module loads a dotenv file (default: ".env"). You can override which file
 gets loaded by setting ENV_FILE, e.g.:
 
     ENV_FILE=.env.o python bot.py
+
+Importing it only reads the environment. The trading parameters are checked when first
+used, and exchanges are built on first use by get_exchange() (or `from config import
+exchange` for the one of SYMBOL), so tools that only need EXCHANGE_CONFIGS start fast.
 """
 
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
-import ccxt
 from dotenv import load_dotenv
 
-from exchange import ExtendedSymbolExchange
-
 def _require(name: str) -> str:
     value = os.getenv(name)
     if value is None or value == "":
@@ -55,13 +58,47 @@ API_SECRET: str = _optional("API_SECRET")
 ACCESS_KEY: str = _optional("ACCESS_KEY")
 SECRET_KEY: str = _optional("SECRET_KEY")
 
-# Trading parameters (required by bot.py)
-SYMBOL: str = _require("SYMBOL")
-SLEEP_MIN: int = _get_float("SLEEP_MIN")
-SLEEP_MAX: int = _get_float("SLEEP_MAX")
-BUY_CANCEL_TIMEOUT: float = _get_float("BUY_CANCEL_TIMEOUT")
-PROFIT_MARGIN_MIN: float = _get_float("PROFIT_MARGIN_MIN")
-PROFIT_MARGIN_MAX: float = _get_float("PROFIT_MARGIN_MAX")
+# Seconds balances and open orders are served from memory before refetching
+SNAPSHOT_TTL: float = _get_float("SNAPSHOT_TTL", default=5.0)
+
+# File holding the request weight budget shared by all bots on this host (same IP)
+WEIGHT_BUDGET_FILE: Optional[str] = _optional("WEIGHT_BUDGET_FILE")
+WEIGHT_LIMIT: int = _get_int("WEIGHT_LIMIT", default=6000)
+
+# File caching the Binance markets between starts, and seconds before it is refreshed
+MARKETS_CACHE_FILE: Optional[str] = _optional("MARKETS_CACHE_FILE")
+MARKETS_CACHE_TTL: float = _get_float("MARKETS_CACHE_TTL", default=86400)
+
+# SQLite file every order update is journaled to, and the closed orders kept in memory
+ORDER_JOURNAL_FILE: Optional[str] = _optional("ORDER_JOURNAL_FILE")
+MAX_CLOSED_ORDERS: int = _get_int("MAX_CLOSED_ORDERS", default=10000)
+
+# JSON file the running PnL of buy -> sell pairs is kept in
+LEDGER_FILE: Optional[str] = _optional("LEDGER_FILE")
+
+# Seconds an order is retried on transient errors before giving up
+ORDER_RETRY_DEADLINE: float = _get_float("ORDER_RETRY_DEADLINE", default=60.0)
+# Consecutive transient failures that open the circuit breaker (0 disables it), and seconds it stays open
+CIRCUIT_BREAKER_FAILURES: int = _get_int("CIRCUIT_BREAKER_FAILURES", default=10)
+CIRCUIT_BREAKER_RESET: float = _get_float("CIRCUIT_BREAKER_RESET", default=30.0)
+
+# JSON lines log file (console only if not set), its size before rotation and the rotated files kept,
+# and the per-order lines per second printed during rebalances
+LOG_FILE: Optional[str] = _optional("LOG_FILE")
+LOG_MAX_BYTES: int = _get_int("LOG_MAX_BYTES", default=50 * 2**20)
+LOG_BACKUPS: int = _get_int("LOG_BACKUPS", default=5)
+LOG_SAMPLE_RATE: float = _get_float("LOG_SAMPLE_RATE", default=5.0)
+
+# Seconds a price fetched over REST is served, and whether to follow the trade/bookTicker streams instead (0 or 1)
+PRICE_TTL: float = _get_float("PRICE_TTL", default=1.0)
+PRICE_STREAM: bool = _get_int("PRICE_STREAM", default=0) > 0
+
+# Levels per side of the local order book mirror kept for every exchange (off if 0)
+ORDER_BOOK_DEPTH: int = _get_int("ORDER_BOOK_DEPTH", default=0)
+
+# Port of the Prometheus metrics endpoint (off if not set), and the address it listens on
+METRICS_PORT: Optional[int] = _get_int("METRICS_PORT", default=0) or None
+METRICS_HOST: str = _optional("METRICS_HOST") or "127.0.0.1"
 
 EXCHANGE_CONFIGS = {
     "binance": {
@@ -74,4 +111,201 @@ EXCHANGE_CONFIGS = {
     },
 }
 
-exchange = ExtendedSymbolExchange(symbol=SYMBOL, config=EXCHANGE_CONFIGS["binance"])
+############################################
+# built on first use
+
+# Trading parameters (required by bot.py)
+_PARAMETERS = {
+    "SYMBOL": lambda: _require("SYMBOL"),
+    "SLEEP_MIN": lambda: _get_float("SLEEP_MIN"),
+    "SLEEP_MAX": lambda: _get_float("SLEEP_MAX"),
+    "BUY_CANCEL_TIMEOUT": lambda: _get_float("BUY_CANCEL_TIMEOUT"),
+    "PROFIT_MARGIN_MIN": lambda: _get_float("PROFIT_MARGIN_MIN"),
+    "PROFIT_MARGIN_MAX": lambda: _get_float("PROFIT_MARGIN_MAX"),
+}
+
+_lock = threading.RLock()
+_exchanges = {}
+_exchange_locks = {}
+
+
+def get_budget():
+    """
+    The WeightBudget shared by every exchange of this process.
+    """
+    with _lock:
+        if "budget" not in globals():
+            from weight_budget import WeightBudget
+
+            globals()["budget"] = WeightBudget(path=WEIGHT_BUDGET_FILE, weight_limit=WEIGHT_LIMIT)
+        return globals()["budget"]
+
+
+def get_markets_cache():
+    """
+    The MarketsCache of MARKETS_CACHE_FILE, or None if it is not set.
+    """
+    with _lock:
+        if "markets_cache" not in globals():
+            from markets_cache import MarketsCache
+
+            globals()["markets_cache"] = MarketsCache(MARKETS_CACHE_FILE, ttl=MARKETS_CACHE_TTL) if MARKETS_CACHE_FILE else None
+        return globals()["markets_cache"]
+
+
+def get_order_journal():
+    """
+    The OrderJournal of ORDER_JOURNAL_FILE, or None if it is not set.
+    """
+    with _lock:
+        if "order_journal" not in globals():
+            from order_journal import OrderJournal
+
+            globals()["order_journal"] = OrderJournal(ORDER_JOURNAL_FILE) if ORDER_JOURNAL_FILE else None
+        return globals()["order_journal"]
+
+
+def get_ledger():
+    """
+    The PairLedger, persisted to LEDGER_FILE if it is set.
+    """
+    with _lock:
+        if "ledger" not in globals():
+            from ledger import PairLedger
+
+            globals()["ledger"] = PairLedger(LEDGER_FILE)
+        return globals()["ledger"]
+
+
+def get_log_pipeline():
+    """
+    The LogPipeline of this process, installed for logs.py's module-level functions on first use.
+    """
+    with _lock:
+        if "log_pipeline" not in globals():
+            import logs
+
+            globals()["log_pipeline"] = logs.install(
+                logs.LogPipeline(LOG_FILE, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS, sample_rate=LOG_SAMPLE_RATE)
+            )
+        return globals()["log_pipeline"]
+
+
+def get_retry_policy():
+    """
+    The RetryPolicy shared by every exchange of this process, with a circuit breaker unless CIRCUIT_BREAKER_FAILURES is 0.
+    """
+    with _lock:
+        if "retry_policy" not in globals():
+            from retry import CircuitBreaker, RetryPolicy
+
+            breaker = CircuitBreaker(CIRCUIT_BREAKER_FAILURES, CIRCUIT_BREAKER_RESET) if CIRCUIT_BREAKER_FAILURES > 0 else None
+            globals()["retry_policy"] = RetryPolicy(breaker=breaker)
+        return globals()["retry_policy"]
+
+
+def _create_exchange(venue, symbol):
+    if venue == "binance":
+        from exchange import ExtendedSymbolExchange
+
+        exchange = ExtendedSymbolExchange(
+            symbol=symbol,
+            config=EXCHANGE_CONFIGS["binance"],
+            snapshot_ttl=SNAPSHOT_TTL,
+            budget=get_budget(),
+            markets_cache=get_markets_cache(),
+            retry_policy=get_retry_policy(),
+            order_retry_deadline=ORDER_RETRY_DEADLINE,
+            price_ttl=PRICE_TTL,
+        )
+        if PRICE_STREAM:
+            exchange.price_feed.start()
+        if ORDER_BOOK_DEPTH > 0:
+            from order_book import OrderBook
+
+            exchange.order_book = OrderBook(exchange, depth=ORDER_BOOK_DEPTH).start()
+        return exchange
+
+    # other venues are only used by tools, through plain ccxt
+    import ccxt
+
+    return getattr(ccxt, venue)(EXCHANGE_CONFIGS[venue])
+
+
+def get_exchange(symbol=None, venue="binance"):
+    """
+    The exchange for (venue, symbol), built on first use and cached. symbol defaults to
+    SYMBOL for binance, other venues get one plain ccxt instance for all symbols.
+    """
+    if venue == "binance":
+        symbol = symbol if symbol is not None else __getattr__("SYMBOL")
+    else:
+        symbol = None
+    key = (venue, symbol)
+
+    with _lock:
+        if key in _exchanges:
+            return _exchanges[key]
+        key_lock = _exchange_locks.setdefault(key, threading.Lock())
+
+    # built outside _lock, so different exchanges can be built at the same time
+    with key_lock:
+        if key not in _exchanges:
+            _exchanges[key] = _create_exchange(venue, symbol)
+        return _exchanges[key]
+
+
+def warm_up(keys=None, max_workers=8):
+    """
+    Build exchanges in parallel before they are needed. keys are (venue, symbol) pairs,
+    by default the binance exchange of SYMBOL. Returns {key: exchange}, failures are left out.
+    """
+    from utils import log_error
+
+    keys = list(keys) if keys is not None else [("binance", __getattr__("SYMBOL"))]
+
+    def build(key):
+        venue, symbol = key
+        try:
+            return get_exchange(symbol, venue=venue)
+        except Exception as e:
+            log_error(e, f"warm_up {venue} {symbol}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(keys)))) as executor:
+        exchanges = dict(zip(keys, executor.map(build, keys)))
+
+    return {key: exchange for key, exchange in exchanges.items() if exchange is not None}
+
+
+def __getattr__(name):
+    """
+    Module attributes built on first access: the trading parameters, budget, markets_cache, order_journal, ledger, retry_policy, log_pipeline and exchange.
+    """
+    if name in _PARAMETERS:
+        value = _PARAMETERS[name]()
+        globals()[name] = value
+        return value
+
+    if name == "budget":
+        return get_budget()
+
+    if name == "markets_cache":
+        return get_markets_cache()
+
+    if name == "order_journal":
+        return get_order_journal()
+
+    if name == "ledger":
+        return get_ledger()
+
+    if name == "retry_policy":
+        return get_retry_policy()
+
+    if name == "log_pipeline":
+        return get_log_pipeline()
+
+    if name == "exchange":
+        return get_exchange()
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
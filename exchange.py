@@ -2,35 +2,63 @@
 Implementation of the ExtendedSymbolExchange class.
 """
 
-import math
 import time
-import requests
 import threading
 
 import numpy as np
 import ccxt
 
-from utils import calculate_min_order_amount, log_error, map_range
+import logs
+import metrics
+from market_math import MarketMath
+from price_feed import PriceFeed
+from retry import RetryPolicy
+from snapshot import AccountSnapshot
+from trade_tracker import TradeTracker
+from strategy import scale_by_balance
+from utils import calculate_min_order_amount, log_error
+from weight_budget import WeightBudget
 
 
 class ExtendedSymbolExchange(ccxt.binance):
     """
     Wrapper class for ccxt.binance that adds some extra functionality.
     """
-    # Class-level lock for rebalancing operations (shared across all instances)
-    _rebalance_lock = threading.Lock()
-    _rebalance_local = threading.local()
-    
-    def __init__(self, symbol, config):
+
+    def __init__(self, symbol, config, snapshot_ttl=5.0, budget=None, markets=None, markets_cache=None, retry_policy=None, order_retry_deadline=60.0, price_ttl=1.0):
 
         super().__init__(config)
 
+        # Lock for rebalancing operations, one per symbol (multi_bot.py runs several in one process)
+        self._rebalance_lock = threading.Lock()
+        self._rebalance_local = threading.local()
+
+        # request weight and order count budget, shared with other bots on the host
+        # when a file-backed WeightBudget is passed in
+        self.budget = budget if budget is not None else WeightBudget()
+        metrics.USED_WEIGHT.set_function(lambda: self.budget.stats()["used_weight"])
+
+        # transient errors are retried with backoff, placing an order gives up after order_retry_deadline seconds
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.order_retry_deadline = order_retry_deadline
+
+        # balances and open orders are served from memory for up to snapshot_ttl
+        # seconds, and dropped whenever we create or cancel an order ourselves
+        self.snapshot = AccountSnapshot(ttl=snapshot_ttl)
+
+        # local order book mirror (order_book.OrderBook), REST is used while it is None or out of sync
+        self.order_book = None
+
+        # last fill of the symbol, from order responses and the updates the bot is fed
+        self.trade_tracker = TradeTracker()
+        metrics.TRADE_RATE.labels(symbol).set_function(self.trade_tracker.trade_rate)
+
         # print ts
         print(f"{self.iso8601(self.milliseconds())}")
 
         print(f"Initializing {self.__class__.__name__}...")
         self.s = symbol
-        self.m = self.load_markets()[self.s]
+        self.m = self._init_markets(markets, markets_cache)
 
         self.precision = self.m['precision']
 
@@ -38,31 +66,96 @@ class ExtendedSymbolExchange(ccxt.binance):
         self.min_price = self.m['limits']['price']['min']
         self.min_cost = self.m['limits']['cost']['min']
 
+        # rounding and lot units of the market, worked out once
+        self.math = MarketMath(self.precision, self.m['limits'])
+
         self.max_num_orders = self.get_max_num_orders()
 
         self.base = self.m['base']
         self.quote = self.m['quote']
 
+        # the price is read from memory: from the trade stream once price_feed.start() is called,
+        # else from a REST fetch for price_ttl seconds
+        self.price_feed = PriceFeed(self, rest_ttl=price_ttl)
+
         print(f"min_cost: {self.min_cost} {self.quote}")
         print(f"min_amount: {self.min_amount} {self.base}")
         print(f"min_price: {self.min_price} {self.quote}")
-        print(f"min_order_amount: {self.min_order_amount()} {self.base} at {self.price()} {self.quote}")
+        price = self.price()
+        print(f"min_order_amount: {self.min_order_amount(price)} {self.base} at {price} {self.quote}")
+
+    def _init_markets(self, markets, markets_cache):
+        """
+        Set the markets and return the market of the symbol. Markets come from `markets`
+        (already loaded by another instance), the MarketsCache or, failing both, Binance.
+        """
+        started = time.perf_counter()
+
+        if markets is not None:
+            source = "shared"
+        elif markets_cache is not None:
+            markets = markets_cache.load([self.s])
+            source = "cache"
+
+        if markets is not None:
+            market = self.set_markets(markets)[self.s]
+        else:
+            market = self.load_markets()[self.s]
+            source = "download"
+            if markets_cache is not None:
+                try:
+                    markets_cache.save(self.markets)
+                except OSError as e:
+                    log_error(e, "MarketsCache.save()")
+
+        print(f"Markets ready in {time.perf_counter() - started:.3f}s ({source})")
+
+        # refresh a stale cache for the next start, the markets in use are kept as they are
+        if source == "cache" and markets_cache.is_stale():
+            markets_cache.refresh_in_background(self)
+
+        return market
+
+    def decimal_places(self, precision):
+        """
+        Number of decimal places of the step size for the specified precision, or None if there is no step.
+        """
+        # precision values are step sizes (e.g., {'amount': 1e-05, 'price': 0.01}),
+        # e.g. 1e-05 -> 5 decimal places, 0.01 -> 2 decimal places, computed once in self.math
+        return self.math.decimal_places(precision)
 
     def round(self, x, precision):
         """
         Round x to the specified decimal precision. Used to round amounts and prices.
         """
-        # precision values are step sizes (e.g., {'amount': 1e-05, 'price': 0.01})
-        assert precision in self.precision.keys(), f"precision must be one of {self.precision.keys()}"
-        
-        step_size = self.precision[precision]
-        if step_size is None or step_size == 0:
-            return x
-        
-        # Convert step size to decimal places
-        # e.g., 1e-05 -> 5 decimal places, 0.01 -> 2 decimal places
-        decimal_places = int(round(-math.log10(step_size)))
-        return round(x, decimal_places)
+        return self.math.round(x, precision)
+
+    def round_array(self, values, precision):
+        """
+        Vectorized round() over a NumPy array, with results identical to round() of each element as a Python float.
+        """
+        return self.math.round_array(values, precision)
+
+    def fetch2(self, path, api='public', method='GET', params={}, headers=None, body=None, config={}):
+        """
+        Wrapper for fetch2() that reserves request weight in the budget and corrects it from the response headers.
+        Latency and weight are recorded per endpoint.
+        """
+        # ccxt's spot rate limiter costs are 0.2 per unit of Binance request weight
+        weight = max(1, int(round(self.calculate_rate_limiter_cost(api, method, path, params, config) * 5)))
+        orders = 1 if method == "POST" and path in ("order", "order/cancelReplace") else 0
+
+        self.budget.acquire(weight, orders)
+        previous_headers = self.last_response_headers
+        started = time.perf_counter()
+        try:
+            return super().fetch2(path, api, method, params, headers, body, config)
+        finally:
+            metrics.REST_LATENCY.labels(method, path).observe(time.perf_counter() - started)
+            metrics.REST_WEIGHT.labels(path).inc(weight)
+            # a request that failed before any response leaves the headers of an earlier one behind
+            if self.last_response_headers is not previous_headers:
+                self.budget.update(self.last_response_headers)
 
     def get_max_num_orders(self):
         """
@@ -72,6 +165,16 @@ class ExtendedSymbolExchange(ccxt.binance):
         return int(max_num_orders)
     
     def get_best_bid_ask(self):
+        """
+        Get the best bid and ask, from the order book mirror when one is in sync.
+        """
+        if self.order_book is not None:
+            best = self.order_book.best_bid_ask()
+            if best is not None:
+                return best
+        best = self.price_feed.best_bid_ask()
+        if best is not None:
+            return best
         order_book = self.fetch_order_book(symbol=self.s, limit=5)
         return order_book['bids'][0][0], order_book['asks'][0][0]
 
@@ -88,58 +191,58 @@ class ExtendedSymbolExchange(ccxt.binance):
         
         if not acquired:
             # Another thread is already rebalancing
-            print("MAX_NUM_ORDERS reached, but rebalancing already in progress. Waiting...")
+            logs.info("MAX_NUM_ORDERS reached, but rebalancing already in progress. Waiting...")
             
             # Wait for the other rebalancing to complete
             with self._rebalance_lock:
                 # Lock acquired, other thread finished
-                print("Previous rebalancing completed. Checking if retry is still needed...")
+                logs.info("Previous rebalancing completed. Checking if retry is still needed...")
                 
                 # Check if we still need to rebalance
                 current_orders = len(self.open_sell_orders())
                 max_orders = self.get_max_num_orders()
                 
                 if current_orders < max_orders * 0.85:  # If below 85%, we're good
-                    print(f"Order count now at {current_orders}/{max_orders} (safe). No rebalancing needed.")
+                    logs.info(f"Order count now at {current_orders}/{max_orders} (safe). No rebalancing needed.")
                     return True
                 else:
-                    print(f"Order count still high at {current_orders}/{max_orders}. Proceeding with rebalancing...")
+                    logs.info(f"Order count still high at {current_orders}/{max_orders}. Proceeding with rebalancing...")
                     # Fall through to rebalance
         
         try:
             # We have the lock, proceed with rebalancing
             if acquired:
-                print("MAX_NUM_ORDERS reached. Starting rebalancing...")
+                logs.info("MAX_NUM_ORDERS reached. Starting rebalancing...")
                 self._rebalance_local.active = True
             
             # Cancel any open buy orders first to free up slots
             buy_orders = self.open_buy_orders()
             if buy_orders:
-                print(f"Cancelling {len(buy_orders)} open buy orders...")
+                logs.info(f"Cancelling {len(buy_orders)} open buy orders...")
                 for order in buy_orders:
                     try:
                         self.cancel_order(order['id'], symbol=self.s)
                     except Exception as cancel_error:
-                        print(f"Error cancelling buy order: {cancel_error}")
+                        logs.info(f"Error cancelling buy order: {cancel_error}")
             
             # Rebalance sell orders to 80% of max limit
             try:
                 # Import here to avoid circular dependency
                 from averager import rebalance_sell_orders
                 old_orders, new_orders = rebalance_sell_orders(self)
-                print(f"Rebalanced {len(old_orders)} orders into {len(new_orders)} orders")
+                logs.info(f"Rebalanced {len(old_orders)} orders into {len(new_orders)} orders")
                 
                 # Verify we're below the limit
                 max_orders = self.get_max_num_orders()
                 if len(new_orders) >= max_orders:
-                    print(f"WARNING: Still at or above max orders ({len(new_orders)}/{max_orders})")
+                    logs.info(f"WARNING: Still at or above max orders ({len(new_orders)}/{max_orders})")
                     return False
                 else:
-                    print(f"Successfully reduced orders to {len(new_orders)}/{max_orders} (safe)")
+                    logs.info(f"Successfully reduced orders to {len(new_orders)}/{max_orders} (safe)")
                     return True
                     
             except Exception as rebalance_error:
-                print(f"Error during rebalancing: {rebalance_error}")
+                logs.info(f"Error during rebalancing: {rebalance_error}")
                 log_error(rebalance_error, "rebalance_sell_orders")
                 return False
                 
@@ -148,12 +251,13 @@ class ExtendedSymbolExchange(ccxt.binance):
             if acquired:
                 self._rebalance_local.active = False
                 self._rebalance_lock.release()
-                print("Rebalancing lock released.")
+                logs.info("Rebalancing lock released.")
 
     # wrapper for create_order() that retries on network errors
     def create_order(self, symbol, type, side, amount, price=None, params={}, rebalance_on_max_orders=True):
         """
-        Wrapper for create_order() that retries on transient network errors and handles MAX_NUM_ORDERS.
+        Wrapper for create_order() that retries transient errors by the retry policy (for up to
+        order_retry_deadline seconds) and handles MAX_NUM_ORDERS.
         
         Args:
             symbol: Trading pair symbol
@@ -171,19 +275,29 @@ class ExtendedSymbolExchange(ccxt.binance):
         # If another thread is rebalancing, block until it completes.
         # The rebalance thread itself is allowed to place/cancel orders while holding the lock.
         if self._rebalance_lock.locked() and not getattr(self._rebalance_local, "active", False):
-            print("Rebalancing in progress. Waiting before placing order...")
+            logs.info("Rebalancing in progress. Waiting before placing order...")
             with self._rebalance_lock:
                 pass
 
+        def attempt():
+            try:
+                order = super(ExtendedSymbolExchange, self).create_order(
+                    symbol=symbol,
+                    type=type,
+                    side=side,
+                    amount=amount,
+                    price=price,
+                    params=params)
+            finally:
+                # invalidate even on errors, the order may have reached the exchange
+                self.snapshot.invalidate()
+            # e.g. a market buy is filled in the response
+            self.trade_tracker.on_order(order)
+            return order
+
         try:
 
-            return super().create_order(
-                symbol=symbol,
-                type=type,
-                side=side,
-                amount=amount,
-                price=price,
-                params=params)
+            return self.retry_policy.call(attempt, name=f"create_order {type} {side} {amount} {self.base} at {price}", deadline=self.order_retry_deadline)
 
         except ccxt.errors.ExchangeError as e:
             
@@ -191,12 +305,12 @@ class ExtendedSymbolExchange(ccxt.binance):
             if str(e) == 'binance {"code":-2010,"msg":"Filter failure: MAX_NUM_ORDERS"}':
                 
                 if rebalance_on_max_orders:
-                    print(f"MAX_NUM_ORDERS error while trying to {type} {side} {amount} {self.base}")
+                    logs.info(f"MAX_NUM_ORDERS error while trying to {type} {side} {amount} {self.base}")
                     
                     # Try to rebalance
                     if self.handle_max_orders_error():
                         # Retry the order after successful rebalancing
-                        print(f"Retrying {type} {side} order after rebalancing...")
+                        logs.info(f"Retrying {type} {side} order after rebalancing...")
                         return self.create_order(
                             symbol=symbol,
                             type=type,
@@ -207,7 +321,7 @@ class ExtendedSymbolExchange(ccxt.binance):
                             rebalance_on_max_orders=False  # Don't rebalance again on retry
                         )
                     else:
-                        print("Rebalancing failed, cannot place order")
+                        logs.info("Rebalancing failed, cannot place order")
                         raise e
                 else:
                     # Rebalancing disabled or already tried, re-raise the error
@@ -216,42 +330,52 @@ class ExtendedSymbolExchange(ccxt.binance):
                 # Other exchange errors, re-raise
                 raise e
 
-        except (ccxt.errors.NetworkError, ccxt.errors.InvalidOrder, ccxt.errors.DDoSProtection, requests.exceptions.HTTPError) as e:
-
-            print(f"Error: Tried to {type} {side} {amount} {self.base} at {price} {self.quote} but got error.")
-            log_error(e, "ExtendedSymbolExchange.create_order()")
-            print("Retrying in 10 seconds...")
-            time.sleep(10)
-
-            return self.create_order(
-                symbol=symbol,
-                type=type,
-                side=side,
-                amount=amount,
-                price=price,
-                params=params,
-                rebalance_on_max_orders=rebalance_on_max_orders
-            )
+    def cancel_order(self, id, symbol=None, params={}):
+        """
+        Wrapper for cancel_order() that invalidates the account snapshot.
+        """
+        try:
+            return super().cancel_order(id, symbol=symbol, params=params)
+        finally:
+            self.snapshot.invalidate()
+
+    def edit_order(self, id, symbol, type, side, amount=None, price=None, params={}):
+        """
+        Wrapper for edit_order() (cancel-replace on spot) that invalidates the account snapshot.
+        """
+        try:
+            return super().edit_order(id, symbol, type, side, amount=amount, price=price, params=params)
+        finally:
+            self.snapshot.invalidate()
 
-    def price(self):
+    def price(self, max_age=None):
         """
-        Get the current price of the symbol.
+        Get the current price of the symbol, from the price feed if known within max_age seconds.
         """
-        return self.fetch_ticker(self.s)['last']
+        price = self.price_feed.get(max_age)
+        if price is None:
+            price = self.price_feed.remember(float(self.publicGetTickerPrice({"symbol": self.m["id"]})["price"]))
+        return price
 
-    def min_order_amount(self, price=None):
+    def min_order_amount(self, price=None, max_age=None):
         """
         Get the minimum amoount of the base currency that can be traded in one order.
         """
         if price is None:
-            price = self.price()
+            price = self.price(max_age)
         return calculate_min_order_amount(price, self.min_cost, self.min_price, self.min_amount)
 
     def open_orders(self):
         """
-        Get all open orders for the symbol.
+        Get all open orders for the symbol. Served from the account snapshot when fresh.
         """
-        return self.fetch_open_orders(self.s)
+        return list(self.snapshot.get("open_orders", lambda: self.fetch_open_orders(self.s)))
+
+    def balances(self):
+        """
+        Get account balances. Served from the account snapshot when fresh.
+        """
+        return self.snapshot.get("balance", self.fetch_balance)
 
     def open_buy_orders(self):
         """
@@ -279,43 +403,34 @@ class ExtendedSymbolExchange(ccxt.binance):
         """
         Get free and total base currency balance.
         """
-        balances = self.fetch_balance()
+        balances = self.balances()
         return balances["free"][self.base], balances["total"][self.base]
 
     def quote_balance(self):
         """
         Get free and total quote currency balance.
         """
-        balances = self.fetch_balance()
+        balances = self.balances()
         return balances["free"][self.quote], balances["total"][self.quote]
 
     def scale_by_balance(self, x, y):
         """
         Get a value between x and y scaled linearly by the balance of the quote currency.
+        Transient errors are retried by the retry policy until the balance can be read.
         """
 
-        try:
-
+        def attempt():
             free_quote, total_quote = self.quote_balance()
 
             sell_base_value = self.sell_base_value()
 
             # todo sometimes this throws an error `TypeError: can only
             # concatenate str (not "float") to str``
-            scaled_value = map_range(free_quote, 0, total_quote + sell_base_value, x, y)
+            return scale_by_balance(free_quote, total_quote, sell_base_value, x, y)
 
-            # Clamp to handle floating-point precision issues
-            scaled_value = max(min(x, y), min(scaled_value, max(x, y)))
-            
-            return scaled_value
+        try:
 
-        except ccxt.errors.NetworkError as e:
-            
-            log_error(e, "scale_by_balance()")
-            print("Retrying in 10 seconds...")
-            time.sleep(10)
-            
-            return self.scale_by_balance(x, y)
+            return self.retry_policy.call(attempt, name="scale_by_balance()")
 
         except Exception as e:
 
@@ -326,25 +441,19 @@ class ExtendedSymbolExchange(ccxt.binance):
 
     def seconds_since_last_trade(self):
         """
-        Get seconds since last trade.
+        Get seconds since last trade, from the trade tracker. Only when it doesn't know the last
+        trade (on start, after a stream reconnect) is it fetched, transient errors being retried by the retry policy.
         """
+        if not self.trade_tracker.known:
+            trades = self.retry_policy.call(lambda: self.fetch_my_trades(self.s, limit=1), name="seconds_since_last_trade()")
+            self.trade_tracker.seed(trades[0]["timestamp"] if trades else None)
 
-        try:
-
-            trades = self.fetch_my_trades(self.s, limit=1)
-            if len(trades) == 0:
-                print("No trades found in seconds_since_last_trade. Returning float(\"inf\")")
-                return float("inf")
+        last_trade = self.trade_tracker.last_trade()
+        if last_trade is None:
+            logs.info("No trades found in seconds_since_last_trade. Returning float(\"inf\")")
+            return float("inf")
 
-            return time.time() - trades[0]["timestamp"] // 1000
-
-        except ccxt.errors.DDoSProtection as e:
-            
-            log_error(e, "seconds_since_last_trade()")
-            print("Retrying in 10 seconds...")
-            time.sleep(10)
-            
-            return self.seconds_since_last_trade()
+        return time.time() - last_trade // 1000
 
     def get_lowest_sell_order(self):
         """
@@ -450,7 +559,8 @@ class ExtendedSymbolExchange(ccxt.binance):
         prices = [o["price"] for o in sell_orders]
         max_sell_price = max(prices) - self.min_price
 
-        assert free >= self.min_order_amount(max_sell_price), f"free {free} < min_order_amount {self.min_order_amount(max_sell_price)}"
+        min_order_amount = self.min_order_amount(max_sell_price)
+        assert free >= min_order_amount, f"free {free} < min_order_amount {min_order_amount}"
 
         if free > self.min_order_amount():
 
@@ -0,0 +1,844 @@
+"""
+In-process fake of the Binance spot REST API, for running the bot's code offline.
+
+FakeBinance keeps markets, balances, open orders and trades in memory and answers
+the endpoints ccxt.binance calls for ExtendedSymbolExchange: exchangeInfo, ticker,
+depth, account, openOrders, order (create/cancel/fetch), order/cancelReplace and
+myTrades. Responses use Binance's JSON, status codes and error bodies, including
+`{"code":-2010,"msg":"Filter failure: MAX_NUM_ORDERS"}`, so the real ccxt parsing and
+error mapping run unchanged.
+
+It is wired into ccxt through the requests session, no sockets involved:
+
+    fake = FakeBinance(price=100000, latency=0.005)
+    exchange = ExtendedSymbolExchange("BTC/FDUSD", fake.exchange_config())
+
+serve() exposes the same fake over local HTTP for other processes, and
+FakeUserDataStream pushes its order updates as executionReports over a local
+websocket API, for OrderStream. Running the module starts a load test of
+ExtendedSymbolExchange, the rebalancer and OrderMonitor.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+from aiohttp import web
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+
+def _error(code, msg, status=400):
+    # compact separators: the live bot matches str(e) of -2010 errors exactly
+    return status, {}, json.dumps({"code": code, "msg": msg}, separators=(",", ":"))
+
+
+def _fmt(x):
+    return f"{x:.8f}"
+
+
+class FakeBinance():
+    """
+    Simulated Binance spot account for one symbol.
+
+    Args:
+        symbol: Unified ccxt symbol, e.g. "BTC/FDUSD"
+        price: Starting last price
+        balances: Starting free balances per asset
+        tick_size, step_size, min_notional, max_num_orders: Market filters
+        latency: Seconds added to every response (plus up to `jitter` more)
+        fill_model: "cross" fills limit orders when the price crosses them,
+            "instant" fills every limit order on placement, "never" only fills market orders
+        volatility: Relative size of the random price step taken by tick()
+        weight_limit, order_limit: Request weight per minute and orders per 10 seconds
+            before the fake answers 429 with Retry-After
+        error_rate: Probability of answering any request with a 429 anyway
+        fee: Commission rate charged on fills, in the quote asset
+        seed: Seed of the random generator, for deterministic runs
+    """
+
+    def __init__(
+        self,
+        symbol="BTC/FDUSD",
+        price=100000.0,
+        balances=None,
+        tick_size=0.01,
+        step_size=0.00001,
+        min_notional=5.0,
+        max_num_orders=200,
+        latency=0.0,
+        jitter=0.0,
+        fill_model="cross",
+        volatility=0.0005,
+        weight_limit=6000,
+        order_limit=100,
+        error_rate=0.0,
+        fee=0.001,
+        seed=0,
+    ):
+        self.base, self.quote = symbol.split("/")
+        self.symbol = self.base + self.quote
+        self.price = price
+
+        self.tick_size = tick_size
+        self.step_size = step_size
+        self.min_notional = min_notional
+        self.max_num_orders = max_num_orders
+
+        self.latency = latency
+        self.jitter = jitter
+        self.fill_model = fill_model
+        self.volatility = volatility
+        self.weight_limit = weight_limit
+        self.order_limit = order_limit
+        self.error_rate = error_rate
+        self.fee = fee
+
+        self.random = random.Random(seed)
+
+        self.free = {self.base: 0.0, self.quote: 0.0}
+        self.locked = {self.base: 0.0, self.quote: 0.0}
+        self.free.update(balances or {self.quote: 100000.0})
+
+        self.orders = {}
+        self.open_ids = set()
+        self.trades = []
+
+        self.requests = 0
+        self.rate_limited = 0
+
+        # called with every order whose status changed (placed, filled, canceled)
+        self.listeners = []
+
+        self._order_ids = itertools.count(1)
+        self._trade_ids = itertools.count(1)
+        self._minute = self._ten_seconds = None
+        self._used_weight = self._order_count = 0
+        self._lock = threading.RLock()
+
+        self._routes = {
+            ("GET", "/api/v3/exchangeInfo"): (20, self.exchange_info),
+            ("GET", "/api/v3/time"): (1, self.server_time),
+            ("GET", "/api/v3/ticker/24hr"): (2, self.ticker),
+            ("GET", "/api/v3/ticker/price"): (2, self.ticker_price),
+            ("GET", "/api/v3/depth"): (5, self.depth),
+            ("GET", "/api/v3/account"): (20, self.account),
+            ("GET", "/api/v3/openOrders"): (6, self.open_orders),
+            ("GET", "/api/v3/order"): (4, self.fetch_order),
+            ("POST", "/api/v3/order"): (1, self.create_order),
+            ("DELETE", "/api/v3/order"): (1, self.cancel_order),
+            ("POST", "/api/v3/order/cancelReplace"): (1, self.cancel_replace),
+            ("GET", "/api/v3/myTrades"): (20, self.my_trades),
+        }
+
+    ############################################
+    # wiring
+
+    def session(self):
+        """
+        A requests session that sends Binance API calls to this fake.
+        """
+        session = requests.Session()
+        adapter = FakeBinanceAdapter(self)
+        session.mount("https://api.binance.com", adapter)
+        session.mount("https://api1.binance.com", adapter)
+        return session
+
+    def exchange_config(self, **config):
+        """
+        ccxt.binance config talking to this fake: spot markets only, no currencies, no client-side rate limit.
+        """
+        return {
+            "apiKey": "fake",
+            "secret": "fake",
+            "session": self.session(),
+            "enableRateLimit": False,
+            "options": {
+                "fetchMarkets": ["spot"],
+                "fetchCurrencies": False,
+                "fetchMargins": False,
+            },
+            **config,
+        }
+
+    def handle(self, method, url, body=None):
+        """
+        Answer one HTTP request. Returns (status, headers, body).
+        """
+        if self.latency or self.jitter:
+            time.sleep(self.latency + self.random.random() * self.jitter)
+
+        parts = urlsplit(url)
+        params = dict(parse_qsl(parts.query))
+        if body:
+            params.update(parse_qsl(body if isinstance(body, str) else body.decode()))
+
+        route = self._routes.get((method, parts.path))
+        if route is None:
+            return _error(-1100, f"Unknown endpoint {method} {parts.path}", status=404)
+
+        weight, handler = route
+        is_order = method == "POST"
+
+        with self._lock:
+            self.requests += 1
+
+            now = time.time()
+            minute, ten_seconds = int(now // 60), int(now // 10)
+            if minute != self._minute:
+                self._minute, self._used_weight = minute, 0
+            if ten_seconds != self._ten_seconds:
+                self._ten_seconds, self._order_count = ten_seconds, 0
+
+            self._used_weight += weight
+            self._order_count += is_order
+
+            headers = {
+                "X-MBX-USED-WEIGHT-1M": str(self._used_weight),
+                "X-MBX-ORDER-COUNT-10S": str(self._order_count),
+            }
+
+            over_limit = self._used_weight > self.weight_limit or self._order_count > self.order_limit
+            if over_limit or self.random.random() < self.error_rate:
+                self.rate_limited += 1
+                retry_after = 60 - int(now) % 60 if self._used_weight > self.weight_limit else 1
+                status, _, body = _error(-1003, "Too many requests; current limit is exceeded.", status=429)
+                return status, {**headers, "Retry-After": str(retry_after)}, body
+
+            status, response_headers, body = handler(params)
+
+        return status, {**headers, **response_headers}, body
+
+    ############################################
+    # market data
+
+    def _ok(self, data):
+        return 200, {}, json.dumps(data)
+
+    def server_time(self, params):
+        return self._ok({"serverTime": int(time.time() * 1000)})
+
+    def exchange_info(self, params):
+        return self._ok({
+            "timezone": "UTC",
+            "serverTime": int(time.time() * 1000),
+            "rateLimits": [],
+            "exchangeFilters": [],
+            "symbols": [{
+                "symbol": self.symbol,
+                "status": "TRADING",
+                "baseAsset": self.base,
+                "baseAssetPrecision": 8,
+                "quoteAsset": self.quote,
+                "quotePrecision": 8,
+                "quoteAssetPrecision": 8,
+                "baseCommissionPrecision": 8,
+                "quoteCommissionPrecision": 8,
+                "orderTypes": ["LIMIT", "LIMIT_MAKER", "MARKET", "STOP_LOSS_LIMIT", "TAKE_PROFIT_LIMIT"],
+                "icebergAllowed": True,
+                "ocoAllowed": True,
+                "otoAllowed": True,
+                "quoteOrderQtyMarketAllowed": True,
+                "allowTrailingStop": True,
+                "cancelReplaceAllowed": True,
+                "isSpotTradingAllowed": True,
+                "isMarginTradingAllowed": False,
+                "filters": [
+                    {"filterType": "PRICE_FILTER", "minPrice": _fmt(self.tick_size), "maxPrice": "1000000.00000000", "tickSize": _fmt(self.tick_size)},
+                    {"filterType": "LOT_SIZE", "minQty": _fmt(self.step_size), "maxQty": "9000.00000000", "stepSize": _fmt(self.step_size)},
+                    {"filterType": "NOTIONAL", "minNotional": _fmt(self.min_notional), "applyMinToMarket": True, "maxNotional": "9000000.00000000", "applyMaxToMarket": False, "avgPriceMins": 5},
+                    {"filterType": "MAX_NUM_ORDERS", "maxNumOrders": self.max_num_orders},
+                ],
+                "permissions": [],
+                "permissionSets": [["SPOT"]],
+                "defaultSelfTradePreventionMode": "EXPIRE_MAKER",
+                "allowedSelfTradePreventionModes": ["EXPIRE_TAKER", "EXPIRE_MAKER", "EXPIRE_BOTH"],
+            }],
+        })
+
+    def ticker(self, params):
+        now = int(time.time() * 1000)
+        price = self._round_price(self.price)
+        return self._ok({
+            "symbol": self.symbol,
+            "priceChange": "0", "priceChangePercent": "0", "weightedAvgPrice": _fmt(price),
+            "prevClosePrice": _fmt(price), "lastPrice": _fmt(price), "lastQty": _fmt(self.step_size),
+            "bidPrice": _fmt(price - self.tick_size), "bidQty": "1.00000000",
+            "askPrice": _fmt(price), "askQty": "1.00000000",
+            "openPrice": _fmt(price), "highPrice": _fmt(price), "lowPrice": _fmt(price),
+            "volume": "0", "quoteVolume": "0", "openTime": now - 86400000, "closeTime": now,
+            "firstId": 0, "lastId": 0, "count": 0,
+        })
+
+    def ticker_price(self, params):
+        return self._ok({"symbol": self.symbol, "price": _fmt(self._round_price(self.price))})
+
+    def depth(self, params):
+        limit = int(params.get("limit", 100))
+        price = self._round_price(self.price)
+        bids = [[_fmt(price - (i + 1) * self.tick_size), "1.00000000"] for i in range(limit)]
+        asks = [[_fmt(price + i * self.tick_size), "1.00000000"] for i in range(limit)]
+        return self._ok({"lastUpdateId": self.requests, "bids": bids, "asks": asks})
+
+    ############################################
+    # account
+
+    def account(self, params):
+        return self._ok({
+            "makerCommission": 10, "takerCommission": 10, "buyerCommission": 0, "sellerCommission": 0,
+            "canTrade": True, "canWithdraw": True, "canDeposit": True,
+            "updateTime": int(time.time() * 1000),
+            "accountType": "SPOT",
+            "balances": [
+                {"asset": asset, "free": _fmt(self.free[asset]), "locked": _fmt(self.locked[asset])}
+                for asset in self.free
+            ],
+            "permissions": ["SPOT"],
+        })
+
+    def open_orders(self, params):
+        return self._ok([self._order_json(self.orders[id]) for id in sorted(self.open_ids)])
+
+    def fetch_order(self, params):
+        order = self.orders.get(int(params.get("orderId", 0)))
+        if order is None:
+            return _error(-2013, "Order does not exist.")
+        return self._ok(self._order_json(order))
+
+    def my_trades(self, params):
+        limit = int(params.get("limit", 500))
+        return self._ok(self.trades[-limit:])
+
+    ############################################
+    # orders
+
+    def _round_price(self, price):
+        return round(round(price / self.tick_size) * self.tick_size, 8)
+
+    def _round_amount(self, amount):
+        return round(int(amount / self.step_size + 1e-9) * self.step_size, 8)
+
+    def _order_json(self, order, full=False):
+        data = {
+            "symbol": self.symbol,
+            "orderId": order["id"],
+            "orderListId": -1,
+            "clientOrderId": order["client_id"],
+            "price": _fmt(order["price"]),
+            "origQty": _fmt(order["amount"]),
+            "executedQty": _fmt(order["filled"]),
+            "cummulativeQuoteQty": _fmt(order["filled"] * order["fill_price"]),
+            "status": order["status"],
+            "timeInForce": "GTC",
+            "type": order["type"],
+            "side": order["side"],
+            "workingTime": order["time"],
+            "selfTradePreventionMode": "EXPIRE_MAKER",
+            "time": order["time"],
+            "updateTime": order["update_time"],
+            "isWorking": True,
+            "origQuoteOrderQty": "0.00000000",
+        }
+        if full:
+            data["transactTime"] = order["update_time"]
+            data["fills"] = [
+                {"price": _fmt(order["fill_price"]), "qty": _fmt(order["filled"]), "commission": _fmt(order["filled"] * order["fill_price"] * self.fee),
+                 "commissionAsset": self.quote, "tradeId": order["trade_id"]}
+            ] if order["filled"] else []
+        return data
+
+    def _new_order(self, params):
+        """
+        Validate and place an order. Returns (order, None) or (None, error response).
+        """
+        side, type = params.get("side"), params.get("type")
+        amount = self._round_amount(float(params.get("quantity", 0)))
+        price = self._round_price(float(params["price"])) if type == "LIMIT" else self._round_price(self.price)
+
+        if amount <= 0 or amount * price < self.min_notional:
+            return None, _error(-1013, "Filter failure: NOTIONAL")
+
+        if type == "LIMIT" and len(self.open_ids) >= self.max_num_orders:
+            return None, _error(-2010, "Filter failure: MAX_NUM_ORDERS")
+
+        cost = amount * price
+        if (side == "BUY" and cost * (1 + self.fee) > self.free[self.quote] + 1e-9) or (side == "SELL" and amount > self.free[self.base] + 1e-12):
+            return None, _error(-2010, "Account has insufficient balance for requested action.")
+
+        now = int(time.time() * 1000)
+        order = {
+            "id": next(self._order_ids),
+            "client_id": params.get("newClientOrderId", f"fake{now}"),
+            "side": side,
+            "type": type,
+            "price": price,
+            "amount": amount,
+            "filled": 0.0,
+            "fill_price": 0.0,
+            "status": "NEW",
+            "time": now,
+            "update_time": now,
+            "trade_id": None,
+        }
+        self.orders[order["id"]] = order
+
+        crosses = (side == "BUY" and price >= self.price) or (side == "SELL" and price <= self.price)
+        if type == "MARKET" or self.fill_model == "instant" or (self.fill_model == "cross" and crosses):
+            self._fill(order, price if type == "LIMIT" else self._round_price(self.price), locked=False)
+        else:
+            self._lock_funds(order, 1)
+            self.open_ids.add(order["id"])
+            self._notify(order)
+
+        return order, None
+
+    def _lock_funds(self, order, sign):
+        if order["side"] == "BUY":
+            asset, amount = self.quote, order["amount"] * order["price"] * (1 + self.fee)
+        else:
+            asset, amount = self.base, order["amount"]
+        self.free[asset] -= sign * amount
+        self.locked[asset] += sign * amount
+
+    def _fill(self, order, price, locked):
+        if locked:
+            self._lock_funds(order, -1)
+            self.open_ids.discard(order["id"])
+
+        cost = order["amount"] * price
+        fee = cost * self.fee
+        if order["side"] == "BUY":
+            self.free[self.quote] -= cost + fee
+            self.free[self.base] += order["amount"]
+        else:
+            self.free[self.base] -= order["amount"]
+            self.free[self.quote] += cost - fee
+
+        now = int(time.time() * 1000)
+        order.update(filled=order["amount"], fill_price=price, status="FILLED", update_time=now, trade_id=next(self._trade_ids))
+
+        self.trades.append({
+            "symbol": self.symbol, "id": order["trade_id"], "orderId": order["id"], "orderListId": -1,
+            "price": _fmt(price), "qty": _fmt(order["amount"]), "quoteQty": _fmt(cost),
+            "commission": _fmt(fee), "commissionAsset": self.quote, "time": now,
+            "isBuyer": order["side"] == "BUY", "isMaker": locked, "isBestMatch": True,
+        })
+        self._notify(order)
+
+    def _notify(self, order):
+        for listener in self.listeners:
+            listener(order)
+
+    def execution_report(self, order):
+        """
+        The user data stream executionReport event of an order's current state.
+        """
+        filled = order["status"] == "FILLED"
+        return {
+            "e": "executionReport",
+            "E": order["update_time"],
+            "s": self.symbol,
+            "c": order["client_id"],
+            "S": order["side"],
+            "o": order["type"],
+            "f": "GTC",
+            "q": _fmt(order["amount"]),
+            "p": _fmt(order["price"]),
+            "P": "0.00000000",
+            "F": "0.00000000",
+            "g": -1,
+            "C": "",
+            "x": {"NEW": "NEW", "FILLED": "TRADE", "CANCELED": "CANCELED"}[order["status"]],
+            "X": order["status"],
+            "r": "NONE",
+            "i": order["id"],
+            "l": _fmt(order["filled"]),
+            "z": _fmt(order["filled"]),
+            "L": _fmt(order["fill_price"]),
+            "n": _fmt(order["filled"] * order["fill_price"] * self.fee),
+            "N": self.quote if filled else None,
+            "T": order["update_time"],
+            "t": order["trade_id"] if filled else -1,
+            "I": order["id"],
+            "w": order["status"] == "NEW",
+            "m": False,
+            "M": False,
+            "O": order["time"],
+            "Z": _fmt(order["filled"] * order["fill_price"]),
+            "Y": _fmt(order["filled"] * order["fill_price"]),
+            "Q": "0.00000000",
+        }
+
+    def create_order(self, params):
+        order, error = self._new_order(params)
+        if error is not None:
+            return error
+        return self._ok(self._order_json(order, full=True))
+
+    def _cancel(self, id):
+        order = self.orders.get(id)
+        if order is None or id not in self.open_ids:
+            return None
+        self._lock_funds(order, -1)
+        self.open_ids.discard(id)
+        order.update(status="CANCELED", update_time=int(time.time() * 1000))
+        self._notify(order)
+        return order
+
+    def cancel_order(self, params):
+        order = self._cancel(int(params.get("orderId", 0)))
+        if order is None:
+            return _error(-2011, "Unknown order sent.")
+        return self._ok(self._order_json(order))
+
+    def cancel_replace(self, params):
+        canceled = self._cancel(int(params.get("cancelOrderId", 0)))
+        if canceled is None:
+            return 400, {}, json.dumps({
+                "code": -2022, "msg": "Order cancel-replace failed.",
+                "data": {"cancelResult": "FAILURE", "newOrderResult": "NOT_ATTEMPTED",
+                         "cancelResponse": {"code": -2011, "msg": "Unknown order sent."}, "newOrderResponse": None},
+            }, separators=(",", ":"))
+
+        order, error = self._new_order(params)
+        if error is not None:
+            return 409, {}, json.dumps({
+                "code": -2021, "msg": "Order cancel-replace partially failed.",
+                "data": {"cancelResult": "SUCCESS", "newOrderResult": "FAILURE",
+                         "cancelResponse": self._order_json(canceled), "newOrderResponse": json.loads(error[2])},
+            }, separators=(",", ":"))
+
+        return self._ok({
+            "cancelResult": "SUCCESS", "newOrderResult": "SUCCESS",
+            "cancelResponse": self._order_json(canceled), "newOrderResponse": self._order_json(order, full=True),
+        })
+
+    ############################################
+    # price model
+
+    def set_price(self, price):
+        """
+        Move the last price and fill the resting orders it crosses (with the "cross" fill model).
+        """
+        with self._lock:
+            self.price = price
+            if self.fill_model != "cross":
+                return
+            for id in list(self.open_ids):
+                order = self.orders[id]
+                if (order["side"] == "BUY" and order["price"] >= price) or (order["side"] == "SELL" and order["price"] <= price):
+                    self._fill(order, order["price"], locked=True)
+
+    def tick(self):
+        """
+        Take one random-walk step of the price.
+        """
+        self.set_price(self.price * (1 + self.random.gauss(0, self.volatility)))
+
+
+class FakeBinanceAdapter(BaseAdapter):
+    """
+    requests transport adapter answering from a FakeBinance instead of the network.
+    """
+
+    def __init__(self, fake):
+        super().__init__()
+        self.fake = fake
+
+    def send(self, request, **kwargs):
+        status, headers, body = self.fake.handle(request.method, request.url, request.body)
+
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict({"Content-Type": "application/json;charset=UTF-8", **headers})
+        response._content = body.encode()
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        response.reason = "OK" if status == 200 else "Error"
+        return response
+
+    def close(self):
+        pass
+
+
+def serve(fake, host="127.0.0.1", port=8765):
+    """
+    Serve a FakeBinance over HTTP until interrupted. Point ccxt at it by replacing
+    https://api.binance.com in exchange.urls["api"] with http://host:port.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _answer(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else None
+            status, headers, data = fake.handle(self.command, self.path, body)
+
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json;charset=UTF-8")
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data.encode())
+
+        do_GET = do_POST = do_DELETE = do_PUT = _answer
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"Fake Binance listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+class FakeUserDataStream():
+    """
+    Local websocket API pushing a FakeBinance's order updates, enough for ccxt.pro's
+    watch_orders: `userDataStream.subscribe.signature` is accepted (the signature isn't
+    checked), then every order placed, filled or canceled is sent to the subscribed
+    connections as an executionReport event.
+
+    drop() closes the connections and refuses new ones until accept(), so the updates
+    made meanwhile are lost the way they are when the real stream is down:
+
+        stream = FakeUserDataStream(fake).start()
+        OrderStream(exchange, on_update, tracked_orders, ws_url=stream.url).start()
+    """
+
+    def __init__(self, fake, host="127.0.0.1", port=0):
+        self.fake = fake
+        self.host = host
+        self.port = port
+        self.url = None
+
+        self.connections = 0
+        self.sent = 0
+        self.accepting = True
+
+        self._subscribed = set()
+        self._loop = None
+        self._thread = None
+        self._runner = None
+
+    @property
+    def subscribers(self):
+        """
+        Number of connections subscribed to the user data stream.
+        """
+        return len(self._subscribed)
+
+    def _on_order(self, order):
+        # called by the fake with its lock held, from any thread
+        if self._loop is not None and self._subscribed:
+            event = json.dumps({"subscriptionId": 0, "event": self.fake.execution_report(order)})
+            self._loop.call_soon_threadsafe(self._push, event)
+
+    def _push(self, event):
+        for ws in list(self._subscribed):
+            asyncio.ensure_future(ws.send_str(event))
+            self.sent += 1
+
+    async def _handle(self, request):
+        if not self.accepting:
+            raise web.HTTPServiceUnavailable()
+
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.connections += 1
+
+        try:
+            async for message in ws:
+                if message.type != web.WSMsgType.TEXT:
+                    continue
+                data = json.loads(message.data)
+                if data.get("method") == "userDataStream.subscribe.signature":
+                    self._subscribed.add(ws)
+                    await ws.send_json({"id": data["id"], "status": 200, "result": {"subscriptionId": 0}})
+                else:
+                    await ws.send_json({"id": data.get("id"), "status": 400, "error": {"code": -1100, "msg": "Unknown method."}})
+        finally:
+            self._subscribed.discard(ws)
+        return ws
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        app = web.Application()
+        app.router.add_get("/{path:.*}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"ws://{self.host}:{port}/ws-api/v3"
+
+    def start(self):
+        """
+        Serve in a background thread. Returns self, with url set.
+        """
+        loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=loop.run_forever, name="fake-user-data-stream", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._serve(), loop).result()
+        self.fake.listeners.append(self._on_order)
+        return self
+
+    def _call(self, coroutine_function, timeout=5):
+        return asyncio.run_coroutine_threadsafe(coroutine_function(), self._loop).result(timeout)
+
+    def drop(self):
+        """
+        Close every connection and refuse new ones until accept().
+        """
+        async def close():
+            self.accepting = False
+            subscribed, self._subscribed = self._subscribed, set()
+            for ws in subscribed:
+                await ws.close()
+        self._call(close)
+
+    def accept(self):
+        """
+        Accept connections again after drop().
+        """
+        self.accepting = True
+
+    def stop(self):
+        """
+        Stop serving and the background thread.
+        """
+        if self._on_order in self.fake.listeners:
+            self.fake.listeners.remove(self._on_order)
+        self._call(self._runner.cleanup)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+
+
+def load_test(fake, duration, workers, symbol):
+    """
+    Hammer ExtendedSymbolExchange, the MAX_NUM_ORDERS rebalancer and OrderMonitor from `workers`
+    threads for `duration` seconds: market buys laddered into limit sells, and limit buys that are
+    canceled again. Returns the throughput report (orders counts one buy/sell round).
+    """
+    from exchange import ExtendedSymbolExchange
+    from order_monitor import OrderMonitor
+    from weight_budget import WeightBudget
+
+    # the fake enforces the Binance limits, the local budget only has to keep up
+    budget = WeightBudget(weight_limit=10**9, order_limit=10**9)
+    exchange = ExtendedSymbolExchange(symbol, fake.exchange_config(), snapshot_ttl=1.0, budget=budget)
+    order_monitor = OrderMonitor(exchange)
+
+    counts = {"orders": 0, "cancels": 0, "errors": 0}
+    errors = {}
+    latencies = []
+    counts_lock = threading.Lock()
+    stop = time.monotonic() + duration
+
+    def worker(n):
+        rng = random.Random(n)
+        while time.monotonic() < stop:
+            fake.tick()
+
+            started = time.perf_counter()
+            try:
+                if rng.random() < 0.7:
+                    # market buy and ladder the fill as a limit sell, like bot.market_buy()
+                    order = exchange.create_order(symbol, "market", "buy", exchange.min_order_amount(fake.price))
+                    order_monitor.log(order)
+                    price = order["price"] * (1 + rng.uniform(0.001, 0.02))
+                    order = exchange.create_order(symbol, "limit", "sell", order["filled"], price)
+                    order_monitor.log(order)
+                else:
+                    # limit buy below the price and cancel it, like bot.limit_buy() after BUY_CANCEL_TIMEOUT
+                    price = fake.price * (1 - rng.uniform(0.001, 0.02))
+                    order = exchange.create_order(symbol, "limit", "buy", exchange.min_order_amount(price), price)
+                    order_monitor.log(order)
+                    if order["status"] == "open":
+                        order_monitor.log(exchange.cancel_order(order["id"], symbol=symbol))
+                        with counts_lock:
+                            counts["cancels"] += 1
+
+                with counts_lock:
+                    counts["orders"] += 1
+                    latencies.append(time.perf_counter() - started)
+
+            except Exception as e:
+                with counts_lock:
+                    counts["errors"] += 1
+                    errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    threads = [threading.Thread(target=worker, args=(n,), name=f"load-{n}") for n in range(workers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "elapsed": elapsed,
+        "orders_per_minute": counts["orders"] / elapsed * 60,
+        "requests": fake.requests,
+        "rate_limited": fake.rate_limited,
+        "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else None,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else None,
+        "open_orders": len(fake.open_ids),
+        "monitor_open_orders": len(order_monitor.open_orders),
+        **counts,
+        "error_types": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Binance spot API for offline runs and load tests.")
+    parser.add_argument("--serve", action="store_true", help="Serve the fake over HTTP instead of running the load test")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--symbol", default="BTC/FDUSD")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.002)
+    parser.add_argument("--jitter", type=float, default=0.002)
+    parser.add_argument("--fill-model", choices=["cross", "instant", "never"], default="cross")
+    parser.add_argument("--max-num-orders", type=int, default=200)
+    parser.add_argument("--weight-limit", type=int, default=10**9)
+    parser.add_argument("--order-limit", type=int, default=10**9)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fake = FakeBinance(
+        symbol=args.symbol,
+        balances={args.symbol.split("/")[1]: 10**7},
+        max_num_orders=args.max_num_orders,
+        latency=args.latency,
+        jitter=args.jitter,
+        fill_model=args.fill_model,
+        weight_limit=args.weight_limit,
+        order_limit=args.order_limit,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+
+    if args.serve:
+        serve(fake, port=args.port)
+        return
+
+    report = load_test(fake, args.duration, args.workers, args.symbol)
+    for key, value in report.items():
+        print(f"{key:<20} {value}")
+
+
+if __name__ == "__main__":
+    main()
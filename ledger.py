@@ -0,0 +1,195 @@
+"""
+Running profit and loss of the bot's buy -> sell pairs.
+"""
+
+import json
+import os
+import threading
+import time
+
+from utils import log_error
+
+
+def _new_state():
+    return {
+        # realized profit in quote, after fees
+        "realized_pnl": 0.0,
+        # fees paid, in quote (fees paid in other currencies are in fees_other)
+        "fees": 0.0,
+        "fees_other": {},
+        # base held from filled buys not yet sold, and what it cost in quote
+        "inventory_amount": 0.0,
+        "inventory_cost": 0.0,
+        "buys_filled": 0,
+        "sells_filled": 0,
+        # sells filled that were placed from a known buy, and the summed seconds in between
+        "round_trips": 0,
+        "holding_seconds": 0.0,
+        # sell order id -> [buy order id, amount, cost in quote, buy timestamp ms]
+        "pairs": {},
+        # buy order id -> id of the sell whose fill it buys back
+        "buybacks": {},
+    }
+
+
+class PairLedger():
+    """
+    Link every sell to the buy it was placed from (and every buyback to the sell it
+    follows), and keep realized PnL, fees, holding time and the cost basis of the open
+    inventory as running totals, updated in O(1) per order update.
+
+    A filled sell is charged the cost of its buy. Sells without a known buy (e.g. placed
+    by a rebalance, or before a restart) are charged the average cost of the inventory.
+    Fees come from the order's fee, which user data stream updates and market order
+    responses carry, but orders fetched over REST do not.
+
+    With a path, the state is written there (atomically, at most every save_interval
+    seconds and on save()) and loaded back on start.
+    """
+
+    def __init__(self, path=None, save_interval=5.0):
+        self.path = path
+        self.save_interval = save_interval
+
+        self.symbols = {}
+
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.symbols = json.load(f)["symbols"]
+
+    def _state(self, symbol):
+        state = self.symbols.get(symbol)
+        if state is None:
+            state = self.symbols[symbol] = _new_state()
+        return state
+
+    @staticmethod
+    def _fill_time(order):
+        return order.get("lastTradeTimestamp") or order.get("timestamp") or int(time.time() * 1000)
+
+    @staticmethod
+    def _filled(order):
+        filled = order.get("filled") or 0.0
+        cost = order.get("cost")
+        if cost is None:
+            cost = filled * (order.get("average") or order.get("price") or 0.0)
+        return filled, cost
+
+    @staticmethod
+    def _fee(order, base, quote):
+        """
+        (fee in quote, other currency, fee in that currency) of an order. Fees in base are converted at the order price.
+        """
+        fee = order.get("fee") or {}
+        cost, currency = fee.get("cost") or 0.0, fee.get("currency")
+        if currency == quote:
+            return cost, None, 0.0
+        if currency == base:
+            return cost * (order.get("average") or order.get("price") or 0.0), None, 0.0
+        return 0.0, currency, cost
+
+    def _charge_fee(self, state, order, base, quote):
+        fee, other_currency, other_fee = self._fee(order, base, quote)
+        state["fees"] += fee
+        if other_fee:
+            state["fees_other"][other_currency] = state["fees_other"].get(other_currency, 0.0) + other_fee
+        return fee
+
+    def on_order(self, order, order_prev=None):
+        """
+        Account for an order update. order_prev is the order this one was placed from, if any.
+        """
+        symbol = order.get("symbol")
+        if symbol is None or "/" not in symbol:
+            return
+        base, quote = symbol.split("/")[0], symbol.split("/")[1].split(":")[0]
+
+        with self._lock:
+            state = self._state(symbol)
+            id, side, status = order["id"], order["side"], order["status"]
+
+            if order_prev is not None and order_prev.get("side") != side:
+                if side == "sell":
+                    filled, cost = self._filled(order_prev)
+                    # the buy's fee was charged when it filled, it is part of the pair's cost
+                    fee, _, _ = self._fee(order_prev, base, quote)
+                    state["pairs"][id] = [order_prev["id"], filled, cost + fee, self._fill_time(order_prev)]
+                else:
+                    state["buybacks"][id] = order_prev["id"]
+
+            if status == "open":
+                return
+
+            filled, cost = self._filled(order)
+
+            if side == "buy":
+                state["buybacks"].pop(id, None)
+                if filled > 0:
+                    fee = self._charge_fee(state, order, base, quote)
+                    state["buys_filled"] += 1
+                    state["inventory_amount"] += filled
+                    state["inventory_cost"] += cost + fee
+
+            else:
+                pair = state["pairs"].pop(id, None)
+                if filled > 0:
+                    fee = self._charge_fee(state, order, base, quote)
+                    state["sells_filled"] += 1
+
+                    if pair is not None and pair[1] > 0:
+                        basis = pair[2] * min(1.0, filled / pair[1])
+                        state["round_trips"] += 1
+                        state["holding_seconds"] += max(0, self._fill_time(order) - pair[3]) / 1000
+                    elif state["inventory_amount"] > 0:
+                        basis = state["inventory_cost"] / state["inventory_amount"] * filled
+                    else:
+                        basis = 0.0
+
+                    state["realized_pnl"] += cost - fee - basis
+                    state["inventory_amount"] -= filled
+                    state["inventory_cost"] -= basis
+
+                    # don't carry rounding dust once everything is sold
+                    if state["inventory_amount"] <= 1e-12:
+                        state["inventory_amount"], state["inventory_cost"] = 0.0, 0.0
+
+        self._maybe_save()
+
+    def summary(self, symbol):
+        """
+        Running totals for one symbol, with the average holding time and inventory cost.
+        """
+        with self._lock:
+            state = dict(self._state(symbol))
+
+        state["open_pairs"] = len(state.pop("pairs"))
+        state["open_buybacks"] = len(state.pop("buybacks"))
+        state["avg_holding_seconds"] = state["holding_seconds"] / state["round_trips"] if state["round_trips"] else 0.0
+        state["avg_inventory_price"] = state["inventory_cost"] / state["inventory_amount"] if state["inventory_amount"] else 0.0
+        return state
+
+    def _maybe_save(self):
+        if self.path is not None and time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
+
+    def save(self):
+        """
+        Write the state to path (if set), replacing the file atomically.
+        """
+        if self.path is None:
+            return
+
+        with self._lock:
+            data = json.dumps({"symbols": self.symbols}, separators=(",", ":"))
+            self._last_save = time.monotonic()
+
+        try:
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log_error(e, "PairLedger.save()")
@@ -0,0 +1,334 @@
+"""
+Queue-backed logging: records are captured on the calling thread, then formatted and written by a background thread.
+"""
+
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+
+############################################
+# formatting, on the writer thread (or inline without a pipeline)
+
+
+def format_error(e, name):
+    module = e.__module__ if hasattr(e, "__module__") else ""
+    traceback = e.__traceback__
+    location = f"{traceback.tb_frame.f_code.co_filename} at line {traceback.tb_lineno}" if traceback is not None else "unknown"
+    return f'''
+    Error in {name}:
+    {e.__class__=}
+    {module=}
+    {e.args=}
+    {e.__context__=}
+    Error occured in {location}
+    '''
+
+
+def _error_fields(e, name):
+    traceback = e.__traceback__
+    return {
+        "name": name,
+        "error": e.__class__.__name__,
+        "module": getattr(e, "__module__", ""),
+        "args": repr(e.args),
+        "context": repr(e.__context__) if e.__context__ is not None else None,
+        "file": traceback.tb_frame.f_code.co_filename if traceback is not None else None,
+        "line": traceback.tb_lineno if traceback is not None else None,
+    }
+
+
+def _order_fields(o, o_prev=None):
+    fields = {key: o.get(key) for key in ("id", "symbol", "datetime", "type", "side", "amount", "filled", "price", "status")}
+    if o_prev is not None:
+        fields["prev_id"] = o_prev.get("id")
+        fields["prev_price"] = o_prev.get("price")
+        fields["prev_amount"] = o_prev.get("amount")
+    return fields
+
+
+def format_order(f):
+    amount = f["amount"] if f["amount"] else f["filled"]
+    value = f["price"] * f["amount"]
+
+    # only a sell has a profit, against the buy it was placed from
+    profit = "X"
+    if f.get("prev_id") is not None and f["side"] == "sell":
+        value_prev = f["prev_price"] * f["prev_amount"]
+        profit = value - value_prev
+
+    return f'{f["datetime"]} | {f["id"]} | {f["type"].upper():<6} | {f["side"].upper():<4} | {amount:<7} | {f["price"]:<8} | {value:<18} | {f["status"]:<6} | Profit: {profit:<18}'
+
+
+############################################
+
+
+class LogPipeline():
+    """
+    Capture log records into a queue and write them from one background thread: the
+    console text to stdout, and (with a path) one JSON object per line to a file that is
+    rotated at max_bytes, keeping `backups` old files (path.1 is the newest).
+
+    Capturing a record is an append to a deque, without taking a lock. The writer drains
+    it every `interval` seconds (or right away on flush() and close()). Errors keep the
+    exception object, so the traceback is only read on the writer thread. When max_queue
+    records are waiting, new ones are dropped (and counted) rather than blocking the caller.
+
+    sampled() lines (e.g. one per order of a rebalance) are rate limited per key to
+    sample_rate lines per second with bursts of sample_burst. The number of lines
+    suppressed since is added to the next line that goes through.
+    """
+
+    def __init__(self, path=None, max_bytes=50 * 2**20, backups=5, stdout=True, sample_rate=5.0, sample_burst=20, max_queue=100000, interval=0.05):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.stdout = stdout
+        self.sample_rate = sample_rate
+        self.sample_burst = sample_burst
+        self.max_queue = max_queue
+        self.interval = interval
+
+        self.captured = 0
+        self.written = 0
+        self.dropped = 0
+        self.suppressed = 0
+        self.rotations = 0
+
+        # key -> [tokens, last refill, suppressed since the last line]
+        self._samplers = {}
+        self._sample_lock = threading.Lock()
+
+        self._file = None
+        self._size = 0
+
+        self._records = collections.deque()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    ############################################
+    # capture, on the calling thread
+
+    def submit(self, kind, fields):
+        if len(self._records) >= self.max_queue:
+            self.dropped += 1
+            return
+        self._records.append((time.time(), kind, threading.current_thread().name, fields))
+        self.captured += 1
+
+    def info(self, message, **fields):
+        self.submit("text", {"message": message, **fields})
+
+    def error(self, e, name):
+        self.submit("error", (e, name))
+
+    def order(self, o, o_prev=None):
+        self.submit("order", _order_fields(o, o_prev))
+
+    def sampled(self, key, message, **fields):
+        """
+        info() limited to sample_rate lines per second for `key`. Returns True if the line was kept.
+        """
+        with self._sample_lock:
+            now = time.monotonic()
+            sampler = self._samplers.get(key)
+            if sampler is None:
+                sampler = self._samplers[key] = [float(self.sample_burst), now, 0]
+
+            sampler[0] = min(self.sample_burst, sampler[0] + (now - sampler[1]) * self.sample_rate)
+            sampler[1] = now
+            if sampler[0] < 1:
+                sampler[2] += 1
+                self.suppressed += 1
+                return False
+
+            sampler[0] -= 1
+            suppressed, sampler[2] = sampler[2], 0
+
+        if suppressed:
+            fields["suppressed"] = suppressed
+        self.submit("text", {"message": message, "key": key, **fields})
+        return True
+
+    def flush(self, timeout=None):
+        """
+        Wait until everything captured so far is written.
+        """
+        done = threading.Event()
+        self._records.append(done)
+        self._wake.set()
+        return done.wait(timeout)
+
+    def close(self, timeout=10):
+        """
+        Write the pending records and stop the writer.
+        """
+        self._records.append(None)
+        self._wake.set()
+        self._thread.join(timeout)
+
+    ############################################
+    # writing, on the writer thread
+
+    def _text(self, kind, fields):
+        try:
+            if kind == "error":
+                return format_error(*fields)
+            if kind == "order":
+                return format_order(fields)
+            if fields.get("suppressed"):
+                return f"{fields['message']} (+{fields['suppressed']} similar lines suppressed)"
+            return fields["message"]
+        except Exception as e:
+            # one bad record doesn't cost the rest of the batch
+            return f"{kind} {fields!r} (could not be formatted: {e!r})"
+
+    def _json(self, ts, kind, thread, fields):
+        if kind == "error":
+            fields = _error_fields(*fields)
+        return json.dumps({"ts": ts, "kind": kind, "thread": thread, **fields}, default=str)
+
+    def _open(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.rotations += 1
+        self._open()
+
+    def _write(self, records):
+        if self.stdout:
+            sys.stdout.write("".join(self._text(kind, fields) + "\n" for _, kind, _, fields in records))
+            sys.stdout.flush()
+
+        if self.path is not None:
+            data = "".join(self._json(*record) + "\n" for record in records)
+            if self._file is None:
+                self._open()
+            elif self._size + len(data) > self.max_bytes and self._size > 0:
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data)
+
+        self.written += len(records)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            records, waiters = [], []
+
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+            # take whatever is queued, popleft() is safe against concurrent appends
+            while self._records:
+                item = self._records.popleft()
+                if item is None:
+                    stopping = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    records.append(item)
+
+            if records:
+                try:
+                    self._write(records)
+                except Exception as e:
+                    sys.stderr.write(format_error(e, "LogPipeline write"))
+
+            for waiter in waiters:
+                waiter.set()
+
+        if self._file is not None:
+            self._file.close()
+
+    def stats(self):
+        """
+        Get the captured/written/dropped/suppressed counters and the records waiting to be written.
+        """
+        return {
+            "captured": self.captured,
+            "written": self.written,
+            "dropped": self.dropped,
+            "suppressed": self.suppressed,
+            "rotations": self.rotations,
+            "pending": len(self._records),
+        }
+
+
+############################################
+# module-level logging, through the installed pipeline or inline
+
+_pipeline = None
+
+
+def install(pipeline):
+    """
+    Send the module-level logging functions through `pipeline` (None to print inline again).
+    """
+    global _pipeline
+    _pipeline = pipeline
+    return pipeline
+
+
+def shutdown(timeout=10):
+    """
+    Write what the installed pipeline still holds, stop it and print inline from then on.
+    """
+    global _pipeline
+    pipeline, _pipeline = _pipeline, None
+    if pipeline is not None:
+        pipeline.close(timeout)
+
+
+def info(message, **fields):
+    """
+    Log a line of text.
+    """
+    if _pipeline is not None:
+        _pipeline.info(message, **fields)
+    else:
+        print(message)
+
+
+def sampled(key, message, **fields):
+    """
+    Log a line of text that may be dropped when lines of the same key come in faster than the sample rate.
+    """
+    if _pipeline is not None:
+        _pipeline.sampled(key, message, **fields)
+    else:
+        print(message)
+
+
+def log_error(e, name):
+    """
+    Print a formatted error message to the console.
+    """
+    if _pipeline is not None:
+        _pipeline.error(e, name)
+    else:
+        print(format_error(e, name))
+
+
+def log_order(o, o_prev=None):
+    """
+    Log an order to the console.
+    """
+    if _pipeline is not None:
+        _pipeline.order(o, o_prev)
+    else:
+        print(format_order(_order_fields(o, o_prev)))
@@ -0,0 +1,167 @@
+"""
+Fixed-point arithmetic of one market (price ticks, amount lots) precompiled from its precision and limits.
+"""
+
+import math
+from decimal import ROUND_CEILING, ROUND_DOWN, ROUND_FLOOR, ROUND_UP
+
+import numpy as np
+
+from utils import amount_scale_from_step, amount_to_units, round_array, round_units, units_to_amount
+
+# below this many units a decimal of `scale` places has at most 15 significant digits, so it is the
+# only one of its length rounding to its float, i.e. it is what the float's repr reads back as
+_EXACT_UNITS = 10 ** 15
+
+# the rounding modes of the decimal module with a fast path: the result for a value strictly
+# between the integers lo and hi = lo + 1
+_DIRECTED = {
+    ROUND_FLOOR: lambda lo, hi: lo,
+    ROUND_CEILING: lambda lo, hi: hi,
+    ROUND_DOWN: lambda lo, hi: lo if lo >= 0 else hi,
+    ROUND_UP: lambda lo, hi: hi if lo >= 0 else lo,
+}
+
+
+class StepMath():
+    """
+    Rounding to one step size and conversion to and from integer units, with results
+    identical to ExtendedSymbolExchange.round() / round_array() (decimals) and to
+    utils.amount_to_units() / units_to_amount() / round_units() (units).
+
+    Everything derived from the step (decimal places, unit scale, units per step) is
+    computed once. Conversions take a float fast path whenever it provably gives the
+    Decimal result, and fall back to the utils functions for the rest (values not on the
+    step, very large unit counts, scaled values within rounding error of an integer).
+    """
+
+    def __init__(self, step):
+        self.step = step
+
+        # number of decimal places of the step, as ExtendedSymbolExchange.decimal_places() has it
+        self.decimals = int(round(-math.log10(step))) if step else None
+
+        # units are 10**-scale, scale as utils.amount_scale_from_step() has it
+        self.scale = amount_scale_from_step(step) if step else 0
+        self.unit = 10.0 ** self.scale
+        self.step_units = amount_to_units(step, step) if step else None
+
+        # 10**scale is only an exact float up to 10**22, Binance steps don't come near
+        self._fast = self.scale <= 15
+
+    ############################################
+    # rounding to decimals
+
+    def round(self, x):
+        """
+        round(x, decimals), x unchanged without a step.
+        """
+        if self.decimals is None:
+            return x
+        return round(x, self.decimals)
+
+    def round_array(self, values):
+        """
+        round() over an array, see utils.round_array().
+        """
+        if self.decimals is None:
+            return np.asarray(values, dtype=np.float64)
+        return round_array(values, self.decimals)
+
+    ############################################
+    # integer units
+
+    def to_units(self, x):
+        """
+        utils.amount_to_units(step, x): x in units, ValueError if it is not a multiple of one.
+        """
+        scaled = x * self.unit
+        if self._fast and math.isfinite(scaled):
+            units = int(round(scaled))
+            if -_EXACT_UNITS < units < _EXACT_UNITS and units / self.unit == x:
+                return units
+        return amount_to_units(self.step, x)
+
+    def to_units_rounded(self, x, rounding):
+        """
+        utils.round_units(step, x, rounding) for a decimal module rounding mode.
+        """
+        directed = _DIRECTED.get(rounding)
+        scaled = x * self.unit
+        if directed is not None and self._fast and math.isfinite(scaled):
+            units = int(round(scaled))
+            if -_EXACT_UNITS < units < _EXACT_UNITS:
+                nearest = units / self.unit
+                if nearest == x:
+                    return units
+                # x's decimal is less than a unit from `units`, and (rounding being monotonic)
+                # on the side of it that x is of the float nearest to units * 10**-scale
+                lo = units if x > nearest else units - 1
+                return directed(lo, lo + 1)
+        return round_units(self.step, x, rounding)
+
+    def from_units(self, units):
+        """
+        utils.units_to_amount(step, units).
+        """
+        if self._fast and -2 ** 53 <= units <= 2 ** 53:
+            # both exact as floats, so the division is correctly rounded like float(Decimal division)
+            return float(units) / self.unit
+        return units_to_amount(self.step, units)
+
+    def to_units_array(self, values):
+        """
+        to_units() over an array, as int64. ValueError if any value is not a multiple of one unit.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        units = np.rint(values * self.unit)
+        exact = (np.abs(units) < _EXACT_UNITS) & (units / self.unit == values) & self._fast
+        units = np.where(exact, units, 0).astype(np.int64)
+        for i in np.flatnonzero(~exact):
+            units[i] = amount_to_units(self.step, float(values[i]))
+        return units
+
+    def from_units_array(self, units):
+        """
+        from_units() over an int64 array.
+        """
+        units = np.asarray(units, dtype=np.int64)
+        if not self._fast or (units.size and np.abs(units).max() > 2 ** 53):
+            return np.array([units_to_amount(self.step, int(u)) for u in units])
+        return units / self.unit
+
+
+class MarketMath():
+    """
+    The StepMath of every precision of a market (price tick, amount step, ...), and of
+    its min_amount lot, the unit the sell ladders are planned in.
+    """
+
+    def __init__(self, precision, limits):
+        self.steps = {key: StepMath(step) for key, step in precision.items()}
+        self.price = self.steps["price"]
+        self.amount = self.steps["amount"]
+        self.lot = StepMath(limits["amount"]["min"])
+
+    def _step(self, precision):
+        step = self.steps.get(precision)
+        assert step is not None, f"precision must be one of {self.steps.keys()}"
+        return step
+
+    def decimal_places(self, precision):
+        """
+        Number of decimal places of the step size for the specified precision, or None if there is no step.
+        """
+        return self._step(precision).decimals
+
+    def round(self, x, precision):
+        """
+        Round x to the decimal places of the specified precision.
+        """
+        return self._step(precision).round(x)
+
+    def round_array(self, values, precision):
+        """
+        round() over an array.
+        """
+        return self._step(precision).round_array(values)
@@ -0,0 +1,181 @@
+"""
+On-disk cache of Binance markets, so that starting a bot does not download exchangeInfo.
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+import zlib
+
+from utils import log_error
+
+
+VERSION = 1
+
+
+class MarketsCache():
+    """
+    Markets (ccxt market structures) stored in one file, readable one symbol at a time.
+
+    The file starts with a JSON header line holding the time the markets were fetched and,
+    per symbol, the offset, length and CRC32 of its zlib-compressed JSON entry. Loading a
+    symbol reads the header and that one entry, not the few MB all markets take.
+
+    Entries older than ttl are still used, but refresh_in_background() should then be
+    called to download fresh ones for the next start. Entries older than max_age, corrupt
+    entries and missing symbols make load() return None, and the caller downloads instead.
+    Several bots can share the file, it is always replaced atomically.
+    """
+
+    def __init__(self, path, ttl=86400, max_age=7 * 86400):
+        self.path = path
+        self.ttl = ttl
+        self.max_age = max_age
+
+        self.fetched_at = None
+        self._refreshing = threading.Lock()
+
+    def _read_header(self, f):
+        header = json.loads(f.readline())
+        if header.get("version") != VERSION:
+            return None
+        return header
+
+    def load(self, symbols):
+        """
+        Get {symbol: market} for the given symbols, or None if any of them is not usable from the cache.
+        """
+        try:
+            with open(self.path, "rb") as f:
+                header = self._read_header(f)
+                if header is None or time.time() - header["fetched_at"] > self.max_age:
+                    return None
+
+                start = f.tell()
+                markets = {}
+                for symbol in symbols:
+                    entry = header["entries"].get(symbol)
+                    if entry is None:
+                        return None
+
+                    offset, length, checksum = entry
+                    f.seek(start + offset)
+                    data = f.read(length)
+                    if len(data) != length or zlib.crc32(data) != checksum:
+                        print(f"Markets cache entry for {symbol} is corrupt, ignoring {self.path}")
+                        return None
+
+                    markets[symbol] = json.loads(zlib.decompress(data))
+
+        except FileNotFoundError:
+            return None
+
+        except (ValueError, KeyError, zlib.error) as e:
+            log_error(e, "MarketsCache.load()")
+            return None
+
+        self.fetched_at = header["fetched_at"]
+        return markets
+
+    def is_stale(self):
+        """
+        Whether the last loaded entries are older than ttl.
+        """
+        return self.fetched_at is None or time.time() - self.fetched_at > self.ttl
+
+    def save(self, markets, fetched_at=None):
+        """
+        Replace the cache with `markets` ({symbol: market} or a list of markets).
+        """
+        if isinstance(markets, dict):
+            markets = markets.values()
+
+        fetched_at = fetched_at if fetched_at is not None else time.time()
+
+        entries = {}
+        blobs = []
+        offset = 0
+        for market in markets:
+            data = zlib.compress(json.dumps(market, separators=(",", ":")).encode(), 6)
+            entries[market["symbol"]] = [offset, len(data), zlib.crc32(data)]
+            blobs.append(data)
+            offset += len(data)
+
+        header = json.dumps({"version": VERSION, "fetched_at": fetched_at, "entries": entries}, separators=(",", ":"))
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(header.encode() + b"\n")
+            for data in blobs:
+                f.write(data)
+        os.replace(tmp_path, self.path)
+
+        self.fetched_at = fetched_at
+
+    def refresh(self, exchange):
+        """
+        Download all markets with `exchange` and save them. The exchange's own markets are left as they are.
+        """
+        with exchange.budget.low_priority():
+            markets = exchange.fetch_markets()
+        self.save(markets)
+        print(f"Markets cache refreshed with {len(markets)} markets")
+
+    def refresh_in_background(self, exchange):
+        """
+        refresh() in a daemon thread, unless a refresh is already running.
+        """
+        if not self._refreshing.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self.refresh(exchange)
+            except Exception as e:
+                log_error(e, "MarketsCache.refresh()")
+            finally:
+                self._refreshing.release()
+
+        threading.Thread(target=run, name="markets-cache", daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or refresh the markets cache.")
+    parser.add_argument("path", help="Cache file, e.g. /tmp/binance-trading-bot/markets")
+    parser.add_argument("--refresh", action="store_true", help="Download all markets from Binance and save them")
+    parser.add_argument("--symbol", default="BTC/FDUSD", help="Symbol to time loading from the cache")
+    args = parser.parse_args()
+
+    cache = MarketsCache(args.path)
+
+    if args.refresh:
+        import ccxt
+
+        started = time.perf_counter()
+        exchange = ccxt.binance({"options": {"fetchMarkets": ["spot"]}})
+        markets = exchange.load_markets()
+        download = time.perf_counter() - started
+        cache.save(exchange.markets)
+        print(f"Downloaded {len(markets)} markets in {download:.3f}s")
+
+    started = time.perf_counter()
+    markets = cache.load([args.symbol])
+    loaded = time.perf_counter() - started
+
+    if markets is None:
+        print(f"{args.symbol} is not usable from {args.path}")
+        return
+
+    with open(args.path, "rb") as f:
+        entries = len(json.loads(f.readline())["entries"])
+
+    print(f"{args.path} | {entries} markets | {os.path.getsize(args.path) / 1024:.0f} KiB | age {time.time() - cache.fetched_at:.0f}s")
+    print(f"Loaded {args.symbol} from the cache in {loaded * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""
+Counters, gauges and histograms of the bot, served in the Prometheus text format.
+"""
+
+import bisect
+import contextlib
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils import log_error
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        return f"{value:.1f}"
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Registry():
+    """
+    The metrics exposed together on one endpoint.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self.metrics.append(metric)
+        return metric
+
+    def exposition(self):
+        """
+        Every metric in the Prometheus text format (version 0.0.4).
+        """
+        with self._lock:
+            metrics = list(self.metrics)
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# seconds, for request latencies
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Metric():
+    """
+    A metric with a child per combination of label values. Children are created on first
+    use and cached, so the hot path is a dict lookup plus the update under a per-child lock.
+    """
+
+    kind = None
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+        self._children = {}
+        self._lock = threading.Lock()
+
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values):
+        """
+        The child of the given label values (in labelnames order).
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def _child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            yield from child.samples(self.labelnames, values)
+
+
+class _CounterChild():
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, names, values):
+        yield "_total", _format_labels(names, values), self.value
+
+
+class Counter(_Metric):
+    """
+    A value that only goes up. name should not end in _total, it is added.
+    """
+
+    kind = "counter"
+
+    def _child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class _GaugeChild():
+
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, function):
+        """
+        Read the value from function() when scraped instead, costing nothing until then.
+        """
+        self.function = function
+
+    def samples(self, names, values):
+        value = self.value
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception as e:
+                log_error(e, "Gauge function")
+                return
+        yield "", _format_labels(names, values), value
+
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down, set directly or read from a function when scraped.
+    """
+
+    kind = "gauge"
+
+    def _child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def set_function(self, function):
+        self.labels().set_function(function)
+
+
+class _HistogramChild():
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextlib.contextmanager
+    def time(self):
+        """
+        Observe the seconds spent in the with block.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self, names, values):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            yield "_bucket", _format_labels(names, values, (("le", _format_value(float(bound))),)), cumulative
+        yield "_sum", _format_labels(names, values), total
+        yield "_count", _format_labels(names, values), cumulative
+
+
+class Histogram(_Metric):
+    """
+    Counts of observed values per bucket (upper bounds, +Inf is added), with their sum.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=None, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets if buckets is not None else LATENCY_BUCKETS))
+        super().__init__(name, help, labelnames, registry)
+
+    def _child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+
+############################################
+# the bot's metrics
+
+REST_LATENCY = Histogram(
+    "binance_rest_request_seconds", "Latency of Binance REST requests, after the wait for the weight budget.",
+    ("method", "endpoint"),
+)
+REST_WEIGHT = Counter("binance_rest_request_weight", "Request weight reserved by Binance REST requests.", ("endpoint",))
+USED_WEIGHT = Gauge("binance_used_weight_1m", "Request weight used in the current minute, as counted by the weight budget.")
+
+FILL_TO_ACK = Histogram(
+    "bot_fill_to_ack_seconds", "Time from a fill being detected to the follow-up order being acknowledged.",
+    ("symbol", "side"),
+)
+
+REBALANCE_SECONDS = Histogram(
+    "bot_rebalance_seconds", "Duration of sell order rebalances.",
+    ("symbol",), buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+REBALANCE_OPS = Histogram(
+    "bot_rebalance_ops", "Cancel, replace and create operations per rebalance.",
+    ("symbol",), buckets=(1, 5, 10, 25, 50, 100, 200),
+)
+
+OPEN_ORDERS = Gauge("bot_open_orders", "Open orders tracked by the order monitor.", ("symbol", "side"))
+MAX_NUM_ORDERS = Gauge("bot_max_num_orders", "MAX_NUM_ORDERS filter of the symbol.", ("symbol",))
+
+LOOP_LAG = Histogram(
+    "bot_loop_lag_seconds", "How late a loop woke up, or how long an order update waited to be processed.",
+    ("loop", "symbol"), buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+
+TRADE_RATE = Gauge("bot_trades_per_minute", "Fills per minute over the trade tracker's window (an hour).", ("symbol",))
+
+PRICE_READS = Counter(
+    "bot_price_reads", "Price reads by source: stream and cache reads saved a ticker request, rest ones made it.",
+    ("symbol", "source"),
+)
+
+ORDER_BOOK_RESYNCS = Counter("bot_order_book_resyncs", "Order book mirror resyncs after a gap in the depth stream.", ("symbol",))
+
+############################################
+
+
+def serve(port, host="127.0.0.1", registry=REGISTRY):
+    """
+    Serve the registry on http://host:port/metrics from a daemon thread. Returns the server.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            data = registry.exposition().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"Metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,232 @@
+"""
+Run the bot.py strategy for several symbols in one process.
+
+All symbols share one markets download, one HTTP connection pool, one request-weight
+budget and one user data stream, whose order updates are routed to the bot of their
+symbol. Per-symbol parameters come from a JSON file (see symbols.example.json),
+credentials and the shared settings from config.py (the environment / .env) as for bot.py:
+
+    SYMBOLS_FILE=symbols.json python multi_bot.py
+"""
+
+import json
+import os
+import signal
+import threading
+
+import requests
+
+import config
+import logs
+import metrics
+from cancel_scheduler import CancelScheduler
+from exchange import ExtendedSymbolExchange
+from order_book import OrderBook
+from order_stream import OrderStream
+from symbol_bot import SymbolBot
+
+
+PARAMETERS = ("SLEEP_MIN", "SLEEP_MAX", "BUY_CANCEL_TIMEOUT", "PROFIT_MARGIN_MIN", "PROFIT_MARGIN_MAX")
+
+
+def load_symbols(path):
+    """
+    Read the per-symbol parameters, with "defaults" applied to every entry of "symbols".
+    """
+    with open(path) as f:
+        data = json.load(f)
+
+    defaults = data.get("defaults", {})
+    symbols = {}
+    for symbol, overrides in data["symbols"].items():
+        params = {**defaults, **overrides}
+        missing = [name for name in PARAMETERS if name not in params]
+        if missing:
+            raise RuntimeError(f"Missing parameters {missing} for {symbol} in {path}")
+        symbols[symbol] = params
+    return symbols
+
+
+def create_session(pool_size):
+    """
+    One requests session (and connection pool) for the REST calls of every symbol.
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    return session
+
+
+def create_exchanges(symbols, config, budget, snapshot_ttl=5.0, markets_cache=None, retry_policy=None, order_retry_deadline=60.0, price_ttl=1.0):
+    """
+    Create one ExtendedSymbolExchange per symbol. Markets are read from the cache or
+    downloaded once, and every instance keeps only the markets of the traded symbols.
+    All of them share the budget and the retry policy (and so its circuit breaker).
+    """
+    first, *others = symbols
+    shared = dict(
+        snapshot_ttl=snapshot_ttl, budget=budget, retry_policy=retry_policy, order_retry_deadline=order_retry_deadline, price_ttl=price_ttl,
+    )
+
+    markets = markets_cache.load(symbols) if markets_cache is not None else None
+
+    if markets is not None:
+        exchanges = {first: ExtendedSymbolExchange(first, config, markets=markets, **shared)}
+        if markets_cache.is_stale():
+            markets_cache.refresh_in_background(exchanges[first])
+    else:
+        # downloads all markets, and saves them to the cache
+        exchanges = {first: ExtendedSymbolExchange(first, config, markets_cache=markets_cache, **shared)}
+        markets = {symbol: exchanges[first].markets[symbol] for symbol in symbols}
+        exchanges[first].set_markets(markets)
+
+    for symbol in others:
+        exchanges[symbol] = ExtendedSymbolExchange(symbol, config, markets=markets, **shared)
+
+    return exchanges
+
+
+class MultiBot():
+    """
+    Host one SymbolBot per symbol, fed by a single user data stream.
+    """
+
+    def __init__(self, exchanges, symbols, ws_url=None, journal=None, max_closed_orders=10000, ledger=None):
+        self.exchanges = exchanges
+        self.stop_event = threading.Event()
+
+        # one thread cancels the unfilled limit buys of every symbol
+        self.cancel_scheduler = CancelScheduler(self.cancel_orders)
+
+        self.bots = {
+            symbol: SymbolBot(
+                exchange,
+                sleep_min=symbols[symbol]["SLEEP_MIN"],
+                sleep_max=symbols[symbol]["SLEEP_MAX"],
+                profit_margin_min=symbols[symbol]["PROFIT_MARGIN_MIN"],
+                profit_margin_max=symbols[symbol]["PROFIT_MARGIN_MAX"],
+                buy_cancel_timeout=symbols[symbol]["BUY_CANCEL_TIMEOUT"],
+                stop_event=self.stop_event,
+                cancel_scheduler=self.cancel_scheduler,
+                journal=journal,
+                max_closed_orders=max_closed_orders,
+                ledger=ledger,
+            )
+            for symbol, exchange in exchanges.items()
+        }
+
+        self.order_stream = OrderStream(
+            next(iter(exchanges.values())),
+            on_update=self.process_order_update,
+            tracked_orders=self.tracked_orders,
+            ws_url=ws_url,
+            exchanges=exchanges,
+        )
+
+        self.journal = journal
+        self.ledger = ledger
+        self._threads = []
+
+    def process_order_update(self, order):
+        """
+        Route an order update to the bot of its symbol.
+        """
+        bot = self.bots.get(order.get("symbol"))
+        if bot is None:
+            return False
+        return bot.process_order_update(order)
+
+    def cancel_orders(self, orders):
+        """
+        Route orders due for cancellation to the bot of their symbol.
+        """
+        for symbol, bot in self.bots.items():
+            bot_orders = [order for order in orders if order.get("symbol") == symbol]
+            if bot_orders:
+                bot.cancel_orders(bot_orders)
+
+    def tracked_orders(self):
+        """
+        Open orders of all bots.
+        """
+        return [order for bot in self.bots.values() for order in bot.tracked_orders()]
+
+    def start(self):
+        """
+        Start the order stream and the main loop of every bot, each in its own thread.
+        """
+        for exchange in self.exchanges.values():
+            exchange.cancel_all_buy_orders()
+
+        self.order_stream.start()
+
+        for symbol, bot in self.bots.items():
+            thread = threading.Thread(target=bot.run, name=f"bot-{symbol}")
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """
+        Stop all bots and cancel their open buy orders.
+        """
+        self.stop_event.set()
+        self.cancel_scheduler.stop()
+        self.order_stream.stop()
+        for exchange in self.exchanges.values():
+            logs.info(f"Cancelling all open {exchange.s} buy orders...")
+            exchange.cancel_all_buy_orders()
+        if self.journal is not None:
+            self.journal.close()
+        if self.ledger is not None:
+            self.ledger.save()
+        logs.info("Exiting...")
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+
+def main():
+    symbols = load_symbols(os.getenv("SYMBOLS_FILE") or "symbols.json")
+
+    config.get_log_pipeline()
+
+    if config.METRICS_PORT is not None:
+        metrics.serve(config.METRICS_PORT, config.METRICS_HOST)
+
+    exchange_config = {
+        **config.EXCHANGE_CONFIGS["binance"],
+        "session": create_session(pool_size=max(10, 4 * len(symbols))),
+    }
+
+    exchanges = create_exchanges(
+        symbols, exchange_config, config.get_budget(), snapshot_ttl=config.SNAPSHOT_TTL, markets_cache=config.get_markets_cache(),
+        retry_policy=config.get_retry_policy(), order_retry_deadline=config.ORDER_RETRY_DEADLINE, price_ttl=config.PRICE_TTL,
+    )
+    for exchange in exchanges.values():
+        if config.PRICE_STREAM:
+            exchange.price_feed.start()
+        if config.ORDER_BOOK_DEPTH > 0:
+            exchange.order_book = OrderBook(exchange, depth=config.ORDER_BOOK_DEPTH).start()
+
+    multi_bot = MultiBot(
+        exchanges, symbols, journal=config.get_order_journal(), max_closed_orders=config.MAX_CLOSED_ORDERS, ledger=config.get_ledger()
+    )
+
+    def end(_a, _b):
+        multi_bot.stop()
+
+    signal.signal(signal.SIGINT, end)
+    signal.signal(signal.SIGTERM, end)
+
+    for symbol, params in symbols.items():
+        logs.info(f"{symbol}: " + " ".join(f"{name}: {params[name]}" for name in PARAMETERS))
+
+    multi_bot.start()
+    multi_bot.join()
+
+    logs.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""
+Local mirror of a symbol's order book: a REST depth snapshot kept current by the Binance diff depth stream.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+import aiohttp
+
+import logs
+import metrics
+from utils import log_error
+
+STREAM_URL = "wss://stream.binance.com:9443/ws"
+
+
+class BookSide():
+    """
+    The price levels of one side of the book, in two arrays of doubles sorted so that the
+    best level is last (ask prices are stored negated). Most updates are near the top of
+    the book, so inserting or removing a level only moves the few levels above it.
+    """
+
+    def __init__(self, is_bid):
+        self.sign = 1.0 if is_bid else -1.0
+        self.keys = array("d")
+        self.amounts = array("d")
+
+    def __len__(self):
+        return len(self.keys)
+
+    def set(self, price, amount):
+        """
+        Set the amount at a price level, removing the level when amount is 0.
+        """
+        key = self.sign * price
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            if amount == 0:
+                del self.keys[i]
+                del self.amounts[i]
+            else:
+                self.amounts[i] = amount
+        elif amount != 0:
+            self.keys.insert(i, key)
+            self.amounts.insert(i, amount)
+
+    def load(self, levels):
+        """
+        Replace every level with [price, amount] pairs (as strings or numbers).
+        """
+        levels = sorted((self.sign * float(price), float(amount)) for price, amount in levels if float(amount) != 0)
+        self.keys = array("d", (key for key, _ in levels))
+        self.amounts = array("d", (amount for _, amount in levels))
+
+    def top(self, n):
+        """
+        The best n levels as ((price, amount), ...), best first.
+        """
+        n = min(n, len(self.keys))
+        keys, amounts = self.keys, self.amounts
+        return tuple((self.sign * keys[-i], amounts[-i]) for i in range(1, n + 1))
+
+
+class OrderBook():
+    """
+    Keep a local copy of one symbol's order book, following Binance's procedure: buffer
+    the diff depth stream, load a REST snapshot, drop the events it already contains,
+    then apply every event whose first update id follows the last one applied. A gap in
+    the update ids (or a reconnect) marks the book out of sync and loads a new snapshot.
+
+    After every event the best `depth` levels of each side are published as one
+    immutable view, so best_bid_ask() and top() read it without a lock or a copy from
+    any thread. While the book is out of sync they return None.
+
+    start() runs the mirror on its own event loop in a background thread, with the
+    snapshot fetched through the threaded exchange. With the asyncio exchange, run()
+    it as a task on the exchange's event loop instead.
+    """
+
+    def __init__(self, exchange, depth=20, snapshot_limit=1000, ws_url=None, speed="100ms", reconnect_delay=1):
+        """
+        Args:
+            exchange: ExtendedSymbolExchange (or AsyncExtendedSymbolExchange) of the symbol, used for the REST snapshot
+            depth: Levels per side published for readers
+            snapshot_limit: Levels per side of the REST snapshot (1000 costs 50 request weight)
+            ws_url: Override the stream base url (e.g. a local fake server)
+            speed: Update speed of the diff depth stream, "100ms" or "1000ms"
+            reconnect_delay: Seconds to wait before reconnecting after an error
+        """
+        self.exchange = exchange
+        self.symbol = exchange.s
+        self.depth = depth
+        self.snapshot_limit = snapshot_limit
+        self.reconnect_delay = reconnect_delay
+
+        market_id = exchange.market_id(self.symbol)
+        stream = f"{market_id.lower()}@depth" + ("@100ms" if speed == "100ms" else "")
+        self.url = f"{(ws_url or STREAM_URL).rstrip('/')}/{stream}"
+        self._snapshot_params = {"symbol": market_id, "limit": snapshot_limit}
+
+        self.bids = BookSide(is_bid=True)
+        self.asks = BookSide(is_bid=False)
+        self.update_id = None
+
+        self.events = 0
+        self.snapshots = 0
+        self.resyncs = 0
+        self.reconnects = 0
+
+        # (bids, asks, update id, event time ms), None while out of sync
+        self._view = None
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._loop = None
+        self._task = None
+
+    ############################################
+    # reading, from any thread
+
+    @property
+    def synced(self):
+        return self._view is not None
+
+    def best_bid_ask(self):
+        """
+        (best bid, best ask) prices, or None while out of sync.
+        """
+        view = self._view
+        if view is None or not view[0] or not view[1]:
+            return None
+        return view[0][0][0], view[1][0][0]
+
+    def top(self, n=None):
+        """
+        The best n levels (up to depth) as a ccxt-style order book, or None while out of sync.
+        """
+        view = self._view
+        if view is None:
+            return None
+        bids, asks, update_id, timestamp = view
+        if n is not None:
+            bids, asks = bids[:n], asks[:n]
+        return {"symbol": self.symbol, "bids": bids, "asks": asks, "nonce": update_id, "timestamp": timestamp}
+
+    def stats(self):
+        """
+        Get the event/snapshot/resync/reconnect counters and the levels held per side.
+        """
+        return {
+            "synced": self.synced,
+            "update_id": self.update_id,
+            "events": self.events,
+            "snapshots": self.snapshots,
+            "resyncs": self.resyncs,
+            "reconnects": self.reconnects,
+            "bid_levels": len(self.bids),
+            "ask_levels": len(self.asks),
+        }
+
+    ############################################
+    # keeping the book, on the event loop
+
+    def _publish(self, timestamp):
+        self._view = (self.bids.top(self.depth), self.asks.top(self.depth), self.update_id, timestamp)
+
+    def _unsync(self):
+        self._view = None
+        self.update_id = None
+
+    async def _fetch_snapshot(self):
+        if asyncio.iscoroutinefunction(self.exchange.fetch2):
+            return await self.exchange.publicGetDepth(self._snapshot_params)
+        # the threaded exchange blocks, and the stream has to be read meanwhile
+        return await asyncio.to_thread(self.exchange.publicGetDepth, self._snapshot_params)
+
+    def _load(self, snapshot):
+        self.bids.load(snapshot["bids"])
+        self.asks.load(snapshot["asks"])
+        self.update_id = int(snapshot["lastUpdateId"])
+        self.snapshots += 1
+        self._publish(int(time.time() * 1000))
+
+    def _apply(self, event):
+        """
+        Apply a diff depth event. Returns False if it doesn't follow the last update applied.
+        """
+        if event["u"] <= self.update_id:
+            # already part of the snapshot
+            return True
+        if event["U"] > self.update_id + 1:
+            return False
+
+        set_bid, set_ask = self.bids.set, self.asks.set
+        for price, amount in event["b"]:
+            set_bid(float(price), float(amount))
+        for price, amount in event["a"]:
+            set_ask(float(price), float(amount))
+
+        self.update_id = event["u"]
+        self.events += 1
+        self._publish(event.get("E"))
+        return True
+
+    async def _consume(self, ws):
+        # events are buffered while a snapshot is being fetched
+        buffer = []
+        snapshot = asyncio.create_task(self._fetch_snapshot())
+
+        try:
+            async for message in ws:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    if message.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                        break
+                    continue
+
+                event = json.loads(message.data)
+                if event.get("e") != "depthUpdate":
+                    continue
+
+                if snapshot is not None:
+                    buffer.append(event)
+                    if not snapshot.done():
+                        continue
+                    data = snapshot.result()
+                    snapshot = None
+
+                    # the snapshot must not be older than the first buffered event
+                    if int(data["lastUpdateId"]) < buffer[0]["U"]:
+                        snapshot = asyncio.create_task(self._fetch_snapshot())
+                        continue
+
+                    self._load(data)
+                    events, buffer = buffer, []
+                else:
+                    events = (event,)
+
+                for i, event in enumerate(events):
+                    if not self._apply(event):
+                        logs.info(f"{self.symbol} order book: gap after update {self.update_id}, got {event['U']}, resyncing")
+                        self.resyncs += 1
+                        metrics.ORDER_BOOK_RESYNCS.labels(self.symbol).inc()
+                        self._unsync()
+                        buffer = list(events[i:])
+                        snapshot = asyncio.create_task(self._fetch_snapshot())
+                        break
+        finally:
+            if snapshot is not None:
+                snapshot.cancel()
+
+    async def run(self):
+        """
+        Keep the book until stop() is called, reconnecting on errors.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.current_task()
+
+        async with aiohttp.ClientSession() as session:
+            while not self._stop.is_set():
+                try:
+                    async with session.ws_connect(self.url, heartbeat=30) as ws:
+                        await self._consume(ws)
+                except asyncio.CancelledError:
+                    # stop() cancels the task
+                    if self._stop.is_set():
+                        break
+                    raise
+                except Exception as e:
+                    if self._stop.is_set():
+                        break
+                    log_error(e, f"OrderBook {self.symbol}")
+                finally:
+                    self._unsync()
+
+                if self._stop.is_set():
+                    break
+                self.reconnects += 1
+                await asyncio.sleep(self.reconnect_delay)
+
+    def start(self):
+        """
+        Keep the book in a background thread. Returns self.
+        """
+        self._thread = threading.Thread(target=asyncio.run, args=(self.run(),), name=f"order-book-{self.symbol}", daemon=True)
+        self._thread.start()
+        logs.info(f"{self.exchange.current_timestamp()} | OrderBook started for {self.symbol}")
+        return self
+
+    def stop(self, timeout=5):
+        """
+        Stop keeping the book and wait for the background thread, if any, to finish.
+        """
+        self._stop.set()
+        if self._loop is not None and self._task is not None:
+            # ends the pending read, closing the socket would wait for the server's close frame
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        if self._thread is not None:
+            self._thread.join(timeout)
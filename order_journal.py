@@ -0,0 +1,184 @@
+"""
+Append-only journal of order lifecycle events, in SQLite.
+"""
+
+import contextlib
+import queue
+import sqlite3
+import threading
+import time
+
+from utils import log_error
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS order_events (
+    seq INTEGER PRIMARY KEY,
+    ts INTEGER NOT NULL,
+    logged_at INTEGER NOT NULL,
+    symbol TEXT,
+    order_id TEXT NOT NULL,
+    prev_order_id TEXT,
+    type TEXT,
+    side TEXT,
+    status TEXT,
+    price REAL,
+    amount REAL,
+    filled REAL,
+    cost REAL
+);
+CREATE INDEX IF NOT EXISTS order_events_order_id ON order_events (order_id);
+CREATE INDEX IF NOT EXISTS order_events_ts ON order_events (ts);
+"""
+
+COLUMNS = ("seq", "ts", "logged_at", "symbol", "order_id", "prev_order_id", "type", "side", "status", "price", "amount", "filled", "cost")
+
+INSERT = f"INSERT INTO order_events ({', '.join(COLUMNS[1:])}) VALUES ({', '.join('?' * (len(COLUMNS) - 1))})"
+
+
+def order_event(order, order_prev=None, logged_at=None):
+    """
+    The journal row of an order update: the order's state without the raw exchange payload.
+    """
+    logged_at = logged_at if logged_at is not None else int(time.time() * 1000)
+    ts = order.get("lastUpdateTimestamp") or order.get("lastTradeTimestamp") or order.get("timestamp") or logged_at
+    return (
+        ts,
+        logged_at,
+        order.get("symbol"),
+        str(order["id"]),
+        str(order_prev["id"]) if order_prev is not None else None,
+        order.get("type"),
+        order.get("side"),
+        order.get("status"),
+        order.get("price"),
+        order.get("amount"),
+        order.get("filled"),
+        order.get("cost"),
+    )
+
+
+class OrderJournal():
+    """
+    Record order events to an SQLite file, written by a background thread.
+
+    record() only queues the event, so the trading threads never wait for the disk.
+    The writer commits in batches of up to batch_size rows, at least every
+    flush_interval seconds. Reads use their own connection (the database is in WAL
+    mode), so analytics queries don't block the writer either.
+    """
+
+    def __init__(self, path, batch_size=500, flush_interval=1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.recorded = 0
+        self.written = 0
+        self.commits = 0
+
+        with contextlib.closing(self._connect()) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="order-journal", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def record(self, order, order_prev=None):
+        """
+        Queue an order update for writing.
+        """
+        self.recorded += 1
+        self._queue.put(order_event(order, order_prev))
+
+    def flush(self, timeout=None):
+        """
+        Wait until everything recorded so far is committed.
+        """
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=10):
+        """
+        Commit the pending events and stop the writer.
+        """
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        connection = self._connect()
+        connection.execute("PRAGMA synchronous=NORMAL")
+
+        stopping = False
+        while not stopping:
+            rows, waiters = [], []
+
+            # block for the first item, then take what else arrives within flush_interval
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    stopping = True
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                rows.append(item)
+                if len(rows) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+
+            if rows:
+                try:
+                    with connection:
+                        connection.executemany(INSERT, rows)
+                    self.written += len(rows)
+                    self.commits += 1
+                except sqlite3.Error as e:
+                    log_error(e, "OrderJournal write")
+
+            for waiter in waiters:
+                waiter.set()
+
+        connection.close()
+
+    ############################################
+    # queries
+
+    def _query(self, sql, params=()):
+        with contextlib.closing(self._connect()) as connection:
+            connection.row_factory = sqlite3.Row
+            return [dict(row) for row in connection.execute(sql, params)]
+
+    def events(self, order_id):
+        """
+        Events of one order, oldest first.
+        """
+        return self._query("SELECT * FROM order_events WHERE order_id = ? ORDER BY seq", (str(order_id),))
+
+    def between(self, start_ms=None, end_ms=None, symbol=None, status=None):
+        """
+        Events with ts within [start_ms, end_ms], optionally of one symbol and status, oldest first.
+        """
+        conditions, params = [], []
+        for condition, value in (("ts >= ?", start_ms), ("ts <= ?", end_ms), ("symbol = ?", symbol), ("status = ?", status)):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self._query(f"SELECT * FROM order_events {where} ORDER BY ts, seq", params)
+
+    def stats(self):
+        """
+        Get the recorded/written/commit counters and the number of events waiting to be written.
+        """
+        return {"recorded": self.recorded, "written": self.written, "commits": self.commits, "pending": self._queue.qsize()}
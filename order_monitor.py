@@ -2,41 +2,245 @@
 Order monitor: tracks open/closed orders and prints bot status.
 """
 
+import threading
 import time
+from collections import OrderedDict
 
 import ccxt
+from sortedcontainers import SortedKeyList
 
+import logs
+import metrics
 from utils import log_error, log_order, map_range
 
 
+class PriceIndex():
+    """
+    Ids of the open orders on one side, kept sorted by price.
+    """
+
+    def __init__(self):
+        # (price, id) pairs sorted by price
+        self._keys = SortedKeyList(key=lambda k: k[0])
+        self._prices = {}
+
+    def __len__(self):
+        return len(self._prices)
+
+    def add(self, order):
+        """
+        Insert or reprice an order. O(log n).
+        """
+        self.discard(order["id"])
+        if order["price"] is None:
+            return
+        self._keys.add((order["price"], order["id"]))
+        self._prices[order["id"]] = order["price"]
+
+    def discard(self, id):
+        """
+        Remove an order if present. O(log n).
+        """
+        price = self._prices.pop(id, None)
+        if price is not None:
+            self._keys.remove((price, id))
+
+    def lowest(self):
+        """
+        Id of the lowest priced order, or None.
+        """
+        return self._keys[0][1] if self._keys else None
+
+    def highest(self):
+        """
+        Id of the highest priced order, or None.
+        """
+        return self._keys[-1][1] if self._keys else None
+
+    def between(self, min_price=None, max_price=None):
+        """
+        Ids of orders priced within [min_price, max_price], in ascending price order. O(log n + k).
+        """
+        return [id for _, id in self._keys.irange_key(min_price, max_price)]
+
+
+class RecentOrders():
+    """
+    The last `maxlen` closed orders by id, with an index by time. Oldest evicted first.
+
+    Orders are stored without the raw exchange payload ("info"), the full history
+    belongs in an OrderJournal.
+    """
+
+    def __init__(self, maxlen=10000):
+        self.maxlen = maxlen
+
+        self._orders = OrderedDict()
+        # (timestamp, id) pairs sorted by timestamp
+        self._times = SortedKeyList(key=lambda k: k[0])
+
+    def __len__(self):
+        return len(self._orders)
+
+    def __contains__(self, id):
+        return id in self._orders
+
+    def __getitem__(self, id):
+        return self._orders[id]
+
+    def __setitem__(self, id, order):
+        self.add(order)
+
+    def get(self, id, default=None):
+        return self._orders.get(id, default)
+
+    def values(self):
+        return self._orders.values()
+
+    @staticmethod
+    def _timestamp(order):
+        return order.get("lastTradeTimestamp") or order.get("timestamp") or 0
+
+    def add(self, order):
+        """
+        Insert or replace an order, evicting the oldest one when full. O(log n).
+        """
+        order = {key: value for key, value in order.items() if key != "info"}
+        id = order["id"]
+
+        previous = self._orders.pop(id, None)
+        if previous is not None:
+            self._times.remove((self._timestamp(previous), id))
+
+        self._orders[id] = order
+        self._times.add((self._timestamp(order), id))
+
+        while len(self._orders) > self.maxlen:
+            _, evicted = self._orders.popitem(last=False)
+            self._times.remove((self._timestamp(evicted), evicted["id"]))
+
+    def between(self, start_ms=None, end_ms=None):
+        """
+        Orders with a timestamp within [start_ms, end_ms], oldest first. O(log n + k).
+        """
+        return [self._orders[id] for _, id in self._times.irange_key(start_ms, end_ms)]
+
+
 class OrderMonitor():
     """
     Class to keep track of orders.
     """
 
     # initialize the class
-    def __init__(self, exchange):
-        assert isinstance(exchange, ccxt.binance)
+    def __init__(self, exchange, open_orders=None, journal=None, max_closed_orders=10000, ledger=None, price_ttl=None):
+        """
+        open_orders: the currently open orders, fetched from the exchange if None (e.g. when
+        the exchange is an AsyncExtendedSymbolExchange, whose caller awaits them instead)
+        journal: OrderJournal every logged order update is recorded to
+        max_closed_orders: number of recent closed orders kept in memory
+        ledger: PairLedger fed with every logged order update
+        price_ttl: seconds the last fill or ticker price is used by status(), defaults to the snapshot ttl
+        """
+        assert isinstance(exchange, ccxt.Exchange)
 
         self.exchange = exchange
+        self.journal = journal
+        self.ledger = ledger
 
         self.open_orders = {}
-        self.closed_orders = {}
-        self.init_orders()
+        self.closed_orders = RecentOrders(max_closed_orders)
+
+        # open order ids per side, sorted by price
+        self.indexes = {"buy": PriceIndex(), "sell": PriceIndex()}
+        self._lock = threading.Lock()
+
+        # running totals of the open sell orders, updated as orders are added and removed
+        self._sell_base_amount = 0.0
+        self._sell_base_value = 0.0
+
+        # ids of recently canceled or closed orders, so that late "open" updates don't revive them
+        self._finished = OrderedDict()
+        self._max_finished = max_closed_orders
+
+        self.price_ttl = price_ttl if price_ttl is not None else exchange.snapshot.ttl
+
+        # read when the metrics are scraped, nothing to update on the trading path
+        metrics.OPEN_ORDERS.labels(exchange.s, "buy").set_function(lambda: len(self.indexes["buy"]))
+        metrics.OPEN_ORDERS.labels(exchange.s, "sell").set_function(lambda: len(self.indexes["sell"]))
+        metrics.MAX_NUM_ORDERS.labels(exchange.s).set_function(lambda: exchange.max_num_orders)
+        self._price = None
+        self._price_time = 0.0
+
+        # called with every tracked order that is logged as canceled or closed
+        self.on_close = []
 
-        # key: sell order id, value: buy order id
-        self.order_pairs = {}
+        self.init_orders(open_orders)
 
         print("Initialized OrderMonitor")
 
-    def init_orders(self):
+    def init_orders(self, open_orders=None):
         """
         Fetch all open orders and add them to the open_orders dict
         """
-        for open_order in self.exchange.open_orders():
-            self.open_orders[open_order["id"]] = open_order
+        if open_orders is None:
+            open_orders = self.exchange.open_orders()
+        for open_order in open_orders:
+            self._add_open(open_order)
         print(f'{self.exchange.current_timestamp()} | Initialized {len(self.open_orders)} open orders')
 
+    def _account(self, order, sign):
+        # caller holds _lock
+        if order["side"] == "sell" and order["price"] is not None:
+            self._sell_base_amount += sign * order["amount"]
+            self._sell_base_value += sign * order["price"] * order["amount"]
+
+        # don't carry float dust once the ladder is empty
+        if len(self.indexes["sell"]) == 0:
+            self._sell_base_amount = self._sell_base_value = 0.0
+
+    def _add_open(self, order):
+        with self._lock:
+            previous = self.open_orders.get(order["id"])
+            if previous is not None:
+                self._account(previous, -1)
+            self.open_orders[order["id"]] = order
+            self.indexes[order["side"]].add(order)
+            self._account(order, 1)
+
+    def _remove_open(self, id):
+        with self._lock:
+            order = self.open_orders.pop(id, None)
+            if order is not None:
+                self.indexes[order["side"]].discard(id)
+                self._account(order, -1)
+            return order
+
+    def _finish(self, id):
+        self._finished[id] = None
+        while len(self._finished) > self._max_finished:
+            self._finished.popitem(last=False)
+
+    def adopt(self, order):
+        """
+        Start tracking an open order placed elsewhere (e.g. by a rebalance), unless it already
+        finished. Returns True if the order is now tracked.
+        """
+        if order["status"] != "open" or order["id"] in self._finished:
+            return False
+        self.log(order)
+        return True
+
+    def replaced(self, old_orders, new_orders):
+        """
+        Account for a rebalance: stop tracking old_orders and adopt new_orders, without logging each one.
+        """
+        for order in old_orders:
+            self._finish(order["id"])
+            self._remove_open(order["id"])
+        for order in new_orders:
+            if order["status"] == "open" and order["id"] not in self._finished:
+                self._add_open(order)
+
     def log(self, order, order_prev = None):
         """
         Log an order and update the open_orders dict
@@ -44,89 +248,188 @@ class OrderMonitor():
         id = order["id"]
         log_order(order, order_prev)
 
+        if self.journal is not None:
+            self.journal.record(order, order_prev)
+
+        if self.ledger is not None:
+            self.ledger.on_order(order, order_prev)
+
+        if order["status"] != "open":
+            self._finish(id)
+
+        # a fill tells the current price as well as a ticker does
+        if order["status"] == "closed":
+            self._set_price(order.get("average") or order.get("price"))
+
         match order["status"]:
 
             case "open":
 
-                self.open_orders[id] = order
+                self._add_open(order)
 
             case "canceled":
 
-                if id in self.open_orders:
-                    del self.open_orders[id]
+                if self._remove_open(id) is not None:
+                    self._closed(order)
 
             case "closed":
 
-                if id in self.open_orders:
-                    del self.open_orders[id]
-                    self.closed_orders[id] = order
+                if self._remove_open(id) is not None:
+                    self.closed_orders.add(order)
+                    self._closed(order)
 
             case _:
                 print(f"error. invalid status: {order['status']}")
 
+    def _closed(self, order):
+        for callback in self.on_close:
+            try:
+                callback(order)
+            except Exception as e:
+                log_error(e, "OrderMonitor.on_close")
+
+    def _best(self, side, pick):
+        with self._lock:
+            id = pick(self.indexes[side])
+            return self.open_orders[id] if id is not None else None
+
     def get_lowest_sell_order(self):
         """
         Get the lowest sell order
         """
-        sell_orders = [o for o in self.open_orders.values() if o["side"] == "sell"]
-        if len(sell_orders) > 0:
-            return min(sell_orders, key=lambda o: o["price"])
-        return None
+        return self._best("sell", PriceIndex.lowest)
 
     def get_highest_buy_order(self):
         """
         Get the highest buy order
         """
-        buy_orders = [o for o in self.open_orders.values() if o["side"] == "buy"]
-        if len(buy_orders) > 0:
-            return max(buy_orders, key=lambda o: o["price"])
+        return self._best("buy", PriceIndex.highest)
+
+    def get_orders_between(self, side, min_price=None, max_price=None):
+        """
+        Get open orders of one side priced within [min_price, max_price], sorted by price
+        """
+        with self._lock:
+            return [self.open_orders[id] for id in self.indexes[side].between(min_price, max_price)]
+
+    def get_sell_orders_near(self, price, percent):
+        """
+        Get sell orders priced at most percent % above price, e.g. the ones closest to being filled
+        """
+        return self.get_orders_between("sell", max_price=price * (1 + percent / 100))
+
+    def get_buy_orders_near(self, price, percent):
+        """
+        Get buy orders priced at most percent % below price
+        """
+        return self.get_orders_between("buy", min_price=price * (1 - percent / 100))
+
+    def aggregates(self):
+        """
+        Counts and sums of the open orders, maintained as orders are logged. O(1).
+        """
+        with self._lock:
+            lowest, highest = self.indexes["sell"].lowest(), self.indexes["sell"].highest()
+            return {
+                "buy_count": len(self.indexes["buy"]),
+                "sell_count": len(self.indexes["sell"]),
+                "sell_base_amount": self._sell_base_amount,
+                "sell_base_value": self._sell_base_value,
+                "min_sell_price": self.open_orders[lowest]["price"] if lowest is not None else 0,
+                "max_sell_price": self.open_orders[highest]["price"] if highest is not None else 0,
+            }
+
+    def cached_price(self):
+        """
+        The price of the last fill or ticker if newer than price_ttl, else None.
+        """
+        if self._price is not None and time.monotonic() - self._price_time < self.price_ttl:
+            return self._price
         return None
 
-    def status(self):
+    def last_price(self, fetch=True):
+        """
+        The price of the last fill or ticker, fetching the ticker if older than price_ttl (and fetch is set).
+        Falls back to the last known price (or None) when the fetch fails.
+        """
+        price = self.cached_price()
+        if price is not None or not fetch:
+            return price if price is not None else self._price
+
+        try:
+            # status output is the first thing to go when the weight budget runs low
+            with self.exchange.budget.low_priority():
+                self._set_price(self.exchange.price())
+        except Exception as e:
+            log_error(e, "OrderMonitor.last_price()")
+
+        return self._price
+
+    def _set_price(self, price):
+        if price:
+            self._price, self._price_time = price, time.monotonic()
+
+    def status(self, price=None, fetch=True):
         """
-        Print the status of the bot. This includes the current balances, open orders, etc.
+        Print the status of the bot from the tracked orders, the last price and the cached balance.
+        At most one ticker request (none without fetch), never retries or sleeps.
         """
         try:
+            if price is None:
+                price = self.last_price(fetch)
+            else:
+                self._set_price(price)
 
-            orders = self.exchange.open_orders()
-            buy_orders = [o for o in orders if o["side"] == "buy"]
-            sell_orders = [o for o in orders if o["side"] == "sell"]
+            # whatever balance the snapshot last held, even if expired
+            balance = self.exchange.snapshot.peek("balance")
+            if balance is not None:
+                free_quote, total_quote = balance["free"][self.exchange.quote], balance["total"][self.exchange.quote]
+            else:
+                free_quote, total_quote = None, None
 
-            sell_base_amount = 0
-            sell_base_value = 0
-            curr_sell_value = 0
+            self.print_status(free_quote, total_quote, price)
 
-            if len(sell_orders) > 0:
-                amounts = [o["amount"] for o in sell_orders]
-                values = [o["price"] * o["amount"] for o in sell_orders]
-                sell_base_amount = sum(amounts)
-                sell_base_value = sum(values)
-                curr_sell_value = sell_base_amount * self.exchange.price()
+        except Exception as e:
+            log_error(e, "OrderMonitor.status()")
 
-            free_quote, total_quote = self.exchange.quote_balance()
+    def print_status(self, free_quote, total_quote, price):
+        """
+        Print the status from the order aggregates and the given quote balance and price (either may be None).
+        """
+        a = self.aggregates()
+        sell_base_amount, sell_base_value = a["sell_base_amount"], a["sell_base_value"]
+        p_min, p_max = a["min_sell_price"], a["max_sell_price"]
+
+        curr_sell_value = sell_base_amount * price if price else 0
+
+        if free_quote is not None:
             free_balance_percent = map_range(free_quote, 0, total_quote + sell_base_value, 0, 100)
+            balance_info = f"{free_quote:.2f} / {total_quote + sell_base_value:.2f} {self.exchange.quote} ({free_balance_percent:.2f}%)"
+        else:
+            balance_info = f"n/a {self.exchange.quote}"
 
-            prices = [o['price'] for o in sell_orders]
-            p_max = max(prices) if len(prices) > 0 else 0
-            p_min = min(prices) if len(prices) > 0 else 0
+        # Calculate price difference percentage (avoid division by zero)
+        if p_min > 0:
+            price_diff_pct = round((p_max - p_min) / p_min * 100, 2)
+            price_info = f"Min: {p_min} | Max: {p_max} | Diff: {round(p_max - p_min, 2)} ({price_diff_pct}%)"
+        else:
+            price_info = "No sell orders"
 
-            # Calculate price difference percentage (avoid division by zero)
-            if p_min > 0:
-                price_diff_pct = round((p_max - p_min) / p_min * 100, 2)
-                price_info = f"Min: {p_min} | Max: {p_max} | Diff: {round(p_max - p_min, 2)} ({price_diff_pct}%)"
-            else:
-                price_info = "No sell orders"
+        snapshot = self.exchange.snapshot.stats()
 
-            print(f"""
+        logs.info(f"""
     {self.exchange.current_timestamp()}
-    Available balances | {free_quote:.2f} / {total_quote + sell_base_value:.2f} {self.exchange.quote} ({free_balance_percent:.2f}%) | {sell_base_amount:.5f} {self.exchange.base}
+    Available balances | {balance_info} | {sell_base_amount:.5f} {self.exchange.base}
     {self.exchange.base} value          | Expected: {sell_base_value:.2f} | Current: {curr_sell_value:.2f} | Curr loss: {curr_sell_value - sell_base_value:.2f}
-    Open orders        | {len(buy_orders)} buy | {len(sell_orders)} sell | {len(orders)} total
+    Open orders        | {a['buy_count']} buy | {a['sell_count']} sell | {a['buy_count'] + a['sell_count']} total
     Sell prices        | {price_info}
+    Snapshot cache     | {snapshot['hits']} hits | {snapshot['misses']} misses ({snapshot['hit_rate'] * 100:.1f}%)
             """)
 
-        except Exception as e:
-            log_error(e, "OrderMonitor.status()")
-            print("Error in OrderMonitor.status(). Sleeping for 10 seconds and retrying...")
-            time.sleep(10)
-            self.status()
+        if self.ledger is not None:
+            ledger = self.ledger.summary(self.exchange.s)
+            logs.info(
+                f"    Ledger             | PnL: {ledger['realized_pnl']:.4f} {self.exchange.quote} | Fees: {ledger['fees']:.4f} | "
+                f"{ledger['round_trips']} round trips, avg held {ledger['avg_holding_seconds'] / 3600:.1f}h | "
+                f"Inventory: {ledger['inventory_amount']:.5f} {self.exchange.base} at {ledger['avg_inventory_price']:.2f}"
+            )
@@ -0,0 +1,185 @@
+"""
+Event-driven order tracking over the Binance user data stream (ccxt.pro watch_orders).
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ccxt
+import ccxt.pro as ccxtpro
+
+import logs
+import metrics
+from utils import log_error
+
+
+class OrderStream():
+    """
+    Watch order updates for one symbol and hand them to a callback as they happen.
+
+    watch_orders runs on its own asyncio event loop in a background thread. Updates
+    are dispatched in arrival order on a single worker thread, so a slow callback
+    (e.g. one that places the follow-up order over REST) never stalls the socket.
+
+    The user data stream is subscribed through the Binance websocket API, and
+    ccxt.pro keeps the subscription (and any listen key) alive. After a reconnect,
+    and every reconcile_interval seconds, the tracked open orders are reconciled
+    against REST so that updates missed while disconnected are still delivered.
+
+    With several exchanges (one per symbol, same account) a single stream watches
+    the orders of all of them, and on_update receives the orders of every symbol.
+    """
+
+    def __init__(self, exchange, on_update, tracked_orders, ws_url=None, reconcile_interval=60, reconnect_delay=1, exchanges=None):
+        """
+        Args:
+            exchange: ExtendedSymbolExchange used for credentials, markets and REST reconciliation
+            on_update: Called with each ccxt order structure received
+            tracked_orders: Called without arguments, returns the orders we believe are open
+            ws_url: Override the websocket API url (e.g. a local fake server)
+            reconcile_interval: Seconds between REST reconciliations while connected
+            reconnect_delay: Seconds to wait before resubscribing after an error
+            exchanges: ExtendedSymbolExchange per symbol to watch, defaults to {exchange.s: exchange}
+        """
+        self.exchange = exchange
+        self.exchanges = exchanges if exchanges is not None else {exchange.s: exchange}
+        self.on_update = on_update
+        self.tracked_orders = tracked_orders
+        self.ws_url = ws_url
+        self.reconcile_interval = reconcile_interval
+        self.reconnect_delay = reconnect_delay
+
+        self.updates = 0
+        self.reconnects = 0
+        self.reconciled = 0
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._loop = None
+        self._client = None
+        self._reconcile_now = None
+        self._dispatcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="order-stream")
+
+    def _create_client(self):
+        client = ccxtpro.binance({
+            "apiKey": self.exchange.apiKey,
+            "secret": self.exchange.secret,
+        })
+        # reuse the markets the REST exchanges already loaded instead of downloading them again
+        markets = {}
+        for exchange in self.exchanges.values():
+            markets.update(exchange.markets)
+        client.set_markets(markets, self.exchange.currencies)
+        if self.ws_url is not None:
+            client.urls["api"]["ws"]["ws-api"]["spot"] = self.ws_url
+        return client
+
+    def start(self):
+        """
+        Start watching orders in a background thread.
+        """
+        self._thread = threading.Thread(target=asyncio.run, args=(self._run(),), name="order-stream", daemon=True)
+        self._thread.start()
+        logs.info(f"{self.exchange.current_timestamp()} | OrderStream started for {', '.join(self.exchanges)}")
+
+    def stop(self, timeout=5):
+        """
+        Stop watching orders and wait for the background thread to finish.
+        """
+        self._stop.set()
+        if self._loop is not None and self._client is not None:
+            # closing the client makes the pending watch_orders() call raise
+            asyncio.run_coroutine_threadsafe(self._client.close(), self._loop)
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._dispatcher.shutdown(wait=False)
+
+    def dispatch(self, order):
+        """
+        Queue an order update for the callback.
+        """
+        self.updates += 1
+        self._dispatcher.submit(self._call_on_update, order, time.monotonic())
+
+    def _call_on_update(self, order, queued_at):
+        metrics.LOOP_LAG.labels("watcher", order.get("symbol") or "").observe(time.monotonic() - queued_at)
+        try:
+            self.on_update(order)
+        except Exception as e:
+            log_error(e, "OrderStream.on_update")
+
+    def reconcile(self):
+        """
+        Fetch the state of tracked orders that are no longer open on the exchange and dispatch them.
+        """
+        tracked = self.tracked_orders()
+
+        for symbol, exchange in self.exchanges.items():
+            orders = [o for o in tracked if o.get("symbol", symbol) == symbol]
+            if not orders:
+                continue
+
+            exchange.snapshot.invalidate("open_orders")
+            with exchange.budget.low_priority():
+                open_ids = {o["id"] for o in exchange.open_orders()}
+
+            for order in orders:
+                if order["id"] in open_ids:
+                    continue
+                try:
+                    self.dispatch(exchange.fetch_order(order["id"], symbol))
+                    self.reconciled += 1
+                except ccxt.errors.OrderNotFound:
+                    pass
+
+    async def _run(self):
+        self._loop = asyncio.get_running_loop()
+        self._client = self._create_client()
+        self._reconcile_now = asyncio.Event()
+        reconciler = asyncio.create_task(self._reconcile_loop())
+
+        # one symbol filters the stream, None gets the orders of all symbols
+        symbol = self.exchange.s if len(self.exchanges) == 1 else None
+
+        try:
+            while not self._stop.is_set():
+                try:
+                    orders = await self._client.watch_orders(symbol)
+                except asyncio.CancelledError:
+                    # close() from stop() cancels the pending watch
+                    if self._stop.is_set():
+                        break
+                    raise
+                except Exception as e:
+                    if self._stop.is_set():
+                        break
+                    log_error(e, "OrderStream.watch_orders")
+                    self.reconnects += 1
+                    await asyncio.sleep(self.reconnect_delay)
+                    # the stream may have dropped updates while it was down
+                    self._reconcile_now.set()
+                    for exchange in self.exchanges.values():
+                        exchange.trade_tracker.invalidate()
+                    continue
+
+                for order in orders:
+                    self.dispatch(order)
+
+        finally:
+            reconciler.cancel()
+            await self._client.close()
+
+    async def _reconcile_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._reconcile_now.wait(), timeout=self.reconcile_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._reconcile_now.clear()
+
+            try:
+                await asyncio.to_thread(self.reconcile)
+            except Exception as e:
+                log_error(e, "OrderStream.reconcile")
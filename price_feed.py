@@ -0,0 +1,195 @@
+"""
+Last price and best bid/ask of a symbol kept in memory, from the Binance trade and bookTicker streams or a short-lived REST cache.
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+import aiohttp
+
+import logs
+import metrics
+from utils import log_error
+
+STREAM_URL = "wss://stream.binance.com:9443/stream"
+
+# request weight of the ticker/price request a memory read saves
+TICKER_PRICE_WEIGHT = 2
+
+
+class PriceFeed():
+    """
+    Serve the symbol's price from memory.
+
+    While the stream runs (start() in a background thread, or run() as a task on the
+    asyncio exchange's loop), the last trade price and the best bid/ask come from the
+    `<symbol>@trade` and `<symbol>@bookTicker` streams. They count as fresh while a message
+    arrived on the connection within max_age seconds: the last trade price stays the last
+    price however long ago the trade was, as long as the connection is known to be alive.
+
+    Otherwise the exchange fetches the price over REST and stores it with remember(),
+    which serves it for rest_ttl seconds. Callers can pass a tighter max_age to get().
+    """
+
+    def __init__(self, exchange, max_age=5.0, rest_ttl=1.0, ws_url=None, reconnect_delay=1):
+        """
+        Args:
+            exchange: ExtendedSymbolExchange (or AsyncExtendedSymbolExchange) of the symbol
+            max_age: Seconds without a stream message before the stream's values are stale
+            rest_ttl: Seconds a price fetched over REST is served
+            ws_url: Override the combined stream url (e.g. a local fake server)
+            reconnect_delay: Seconds to wait before reconnecting after an error
+        """
+        self.exchange = exchange
+        self.symbol = exchange.s
+        self.max_age = max_age
+        self.rest_ttl = rest_ttl
+        self.reconnect_delay = reconnect_delay
+
+        stream = exchange.market_id(self.symbol).lower()
+        self.url = f"{ws_url or STREAM_URL}?streams={stream}@trade/{stream}@bookTicker"
+
+        # (price, monotonic time) of the last trade and of the last REST fetch
+        self._trade = None
+        self._rest = None
+        # (bid, ask), and the monotonic time of the last message on the connection
+        self._book_ticker = None
+        self._seen_at = None
+
+        self.reads = {"stream": 0, "cache": 0, "rest": 0}
+        self.reconnects = 0
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._loop = None
+        self._task = None
+
+    ############################################
+    # reading, from any thread
+
+    def _count(self, source):
+        self.reads[source] += 1
+        metrics.PRICE_READS.labels(self.symbol, source).inc()
+
+    def _stream_fresh(self, max_age, now):
+        seen_at = self._seen_at
+        return seen_at is not None and now - seen_at <= max_age
+
+    def get(self, max_age=None):
+        """
+        The last price if known within max_age seconds (defaults: max_age for the stream,
+        rest_ttl for REST), else None and the caller fetches it and calls remember().
+        """
+        now = time.monotonic()
+
+        trade = self._trade
+        if trade is not None and self._stream_fresh(self.max_age if max_age is None else max_age, now):
+            self._count("stream")
+            return trade[0]
+
+        rest = self._rest
+        if rest is not None and now - rest[1] <= (self.rest_ttl if max_age is None else min(max_age, self.rest_ttl)):
+            self._count("cache")
+            return rest[0]
+
+        return None
+
+    def remember(self, price):
+        """
+        Store a price fetched over REST. Returns it.
+        """
+        self._rest = (price, time.monotonic())
+        self._count("rest")
+        return price
+
+    def best_bid_ask(self, max_age=None):
+        """
+        (best bid, best ask) from the bookTicker stream, or None if not fresh within max_age seconds.
+        """
+        book_ticker = self._book_ticker
+        if book_ticker is None or not self._stream_fresh(self.max_age if max_age is None else max_age, time.monotonic()):
+            return None
+        return book_ticker
+
+    def stats(self):
+        """
+        Get the reads per source, the request weight the memory reads saved and whether the stream is fresh.
+        """
+        reads = dict(self.reads)
+        return {
+            **reads,
+            "weight_saved": (reads["stream"] + reads["cache"]) * TICKER_PRICE_WEIGHT,
+            "stream_fresh": self._stream_fresh(self.max_age, time.monotonic()),
+            "reconnects": self.reconnects,
+        }
+
+    ############################################
+    # the stream, on the event loop
+
+    def _on_message(self, data):
+        stream, event = data.get("stream", ""), data.get("data") or {}
+        if stream.endswith("@trade"):
+            self._trade = (float(event["p"]), time.monotonic())
+        elif stream.endswith("@bookTicker"):
+            self._book_ticker = (float(event["b"]), float(event["a"]))
+        self._seen_at = time.monotonic()
+
+    def _disconnected(self):
+        # values of a dropped connection are not known to be current
+        self._seen_at = None
+        self._trade = None
+        self._book_ticker = None
+
+    async def run(self):
+        """
+        Follow the streams until stop() is called, reconnecting on errors.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.current_task()
+
+        async with aiohttp.ClientSession() as session:
+            while not self._stop.is_set():
+                try:
+                    async with session.ws_connect(self.url, heartbeat=30) as ws:
+                        async for message in ws:
+                            if message.type == aiohttp.WSMsgType.TEXT:
+                                self._on_message(json.loads(message.data))
+                            elif message.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                                break
+                except asyncio.CancelledError:
+                    # stop() cancels the task
+                    if self._stop.is_set():
+                        break
+                    raise
+                except Exception as e:
+                    if self._stop.is_set():
+                        break
+                    log_error(e, f"PriceFeed {self.symbol}")
+                finally:
+                    self._disconnected()
+
+                if self._stop.is_set():
+                    break
+                self.reconnects += 1
+                await asyncio.sleep(self.reconnect_delay)
+
+    def start(self):
+        """
+        Follow the streams in a background thread. Returns self.
+        """
+        self._thread = threading.Thread(target=asyncio.run, args=(self.run(),), name=f"price-feed-{self.symbol}", daemon=True)
+        self._thread.start()
+        logs.info(f"{self.exchange.current_timestamp()} | PriceFeed started for {self.symbol}")
+        return self
+
+    def stop(self, timeout=5):
+        """
+        Stop following the streams and wait for the background thread, if any, to finish.
+        """
+        self._stop.set()
+        if self._loop is not None and self._task is not None:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        if self._thread is not None:
+            self._thread.join(timeout)
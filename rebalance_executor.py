@@ -0,0 +1,226 @@
+"""
+Concurrent execution of rebalance plans (cancel old sell orders, place new ones).
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import logs
+from utils import log_error
+
+
+# Binance spot allows 100 new orders per 10 seconds per account. Stay well below it,
+# other threads keep trading meanwhile. Request weight is enforced for every REST call
+# by the exchange's WeightBudget.
+ORDERS_PER_10S = 50
+
+
+class SlidingWindowLimiter():
+    """
+    Thread-safe limiter allowing at most `limit` units of cost per `interval` seconds.
+    """
+
+    def __init__(self, limit, interval):
+        self.limit = limit
+        self.interval = interval
+
+        self._events = deque()
+        self._used = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self, cost=1):
+        """
+        Consume `cost` units if they fit in the window now. Returns 0 if so, otherwise the seconds to wait.
+        """
+        with self._lock:
+            now = time.monotonic()
+            while self._events and now - self._events[0][0] >= self.interval:
+                self._used -= self._events.popleft()[1]
+
+            if self._used + cost <= self.limit:
+                self._events.append((now, cost))
+                self._used += cost
+                return 0
+
+            return self.interval - (now - self._events[0][0])
+
+    def acquire(self, cost=1):
+        """
+        Block until `cost` units fit in the window, then consume them.
+        """
+        while wait := self.try_acquire(cost):
+            time.sleep(wait)
+
+    async def acquire_async(self, cost=1):
+        """
+        acquire() for asyncio, waiting on the event loop instead of blocking the thread.
+        """
+        while wait := self.try_acquire(cost):
+            await asyncio.sleep(wait)
+
+
+class RebalanceExecutor():
+    """
+    Execute a rebalance plan with a bounded worker pool.
+
+    Old and new orders are paired per price level (lowest with lowest) and each pair
+    is swapped atomically with Binance's cancel-replace endpoint, so the ladder is
+    never missing a level. The plan runs in phases so that free balance is always
+    available for the orders being placed:
+
+        cancel          old orders without a new counterpart
+        replace_shrink  pairs where the new amount is <= the old amount
+        replace_grow    pairs where the new amount is larger
+        create          new orders without an old counterpart
+
+    Operations within a phase run concurrently, limited by the order-rate limiter.
+    """
+
+    def __init__(self, exchange, max_workers=8, pair=True, order_limiter=None):
+        self.exchange = exchange
+        self.max_workers = max_workers
+        self.pair = pair
+        self.order_limiter = order_limiter or SlidingWindowLimiter(ORDERS_PER_10S, 10)
+
+    def plan(self, orders, orders_new):
+        """
+        Split a rebalance into phases. Returns a list of (phase name, [(action, old, new), ...]).
+        """
+        if not self.pair:
+            return [
+                ("cancel", [("cancel", o, None) for o in orders]),
+                ("create", [("create", None, n) for n in orders_new]),
+            ]
+
+        old = sorted(orders, key=lambda o: o["price"])
+        new = sorted(orders_new, key=lambda o: o["price"])
+        n_pairs = min(len(old), len(new))
+
+        pairs = list(zip(old[:n_pairs], new[:n_pairs]))
+
+        return [
+            ("cancel", [("cancel", o, None) for o in old[n_pairs:]]),
+            ("replace_shrink", [("replace", o, n) for o, n in pairs if n["amount"] <= o["amount"]]),
+            ("replace_grow", [("replace", o, n) for o, n in pairs if n["amount"] > o["amount"]]),
+            ("create", [("create", None, n) for n in new[n_pairs:]]),
+        ]
+
+    def execute(self, orders, orders_new):
+        """
+        Replace `orders` with `orders_new`. Returns a report with per-phase wall times and errors.
+        """
+        report = {"phases": {}, "ops": 0, "errors": []}
+
+        # the calling thread may hold the rebalance lock, let the workers place orders under it
+        rebalancing = getattr(self.exchange._rebalance_local, "active", False)
+
+        def run(op):
+            self.exchange._rebalance_local.active = rebalancing
+            try:
+                return self._run_op(*op)
+            except Exception as e:
+                log_error(e, f"RebalanceExecutor.{op[0]}")
+                return e
+
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="rebalance") as pool:
+            for phase, ops in self.plan(orders, orders_new):
+                if not ops:
+                    continue
+
+                phase_start = time.perf_counter()
+                results = list(pool.map(run, ops))
+                report["phases"][phase] = time.perf_counter() - phase_start
+
+                report["ops"] += len(ops)
+                report["errors"] += [(phase, op, r) for op, r in zip(ops, results) if isinstance(r, Exception)]
+
+        report["total"] = time.perf_counter() - start
+
+        phases = " | ".join(f"{phase}: {seconds:.2f}s" for phase, seconds in report["phases"].items())
+        logs.info(f"Rebalance executed {report['ops']} ops in {report['total']:.2f}s ({phases}) | {len(report['errors'])} errors")
+
+        return report
+
+    async def execute_async(self, orders, orders_new):
+        """
+        execute() for an asyncio exchange (async_exchange.py), with up to max_workers operations in flight.
+        """
+        report = {"phases": {}, "ops": 0, "errors": []}
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def run(op):
+            async with semaphore:
+                try:
+                    return await self._run_op_async(*op)
+                except Exception as e:
+                    log_error(e, f"RebalanceExecutor.{op[0]}")
+                    return e
+
+        start = time.perf_counter()
+
+        for phase, ops in self.plan(orders, orders_new):
+            if not ops:
+                continue
+
+            phase_start = time.perf_counter()
+            results = await asyncio.gather(*(run(op) for op in ops))
+            report["phases"][phase] = time.perf_counter() - phase_start
+
+            report["ops"] += len(ops)
+            report["errors"] += [(phase, op, r) for op, r in zip(ops, results) if isinstance(r, Exception)]
+
+        report["total"] = time.perf_counter() - start
+
+        phases = " | ".join(f"{phase}: {seconds:.2f}s" for phase, seconds in report["phases"].items())
+        logs.info(f"Rebalance executed {report['ops']} ops in {report['total']:.2f}s ({phases}) | {len(report['errors'])} errors")
+
+        return report
+
+    def _run_op(self, action, old, new):
+        exchange = self.exchange
+
+        if action == "cancel":
+            return exchange.cancel_order(old["id"], symbol=exchange.s)
+
+        self.order_limiter.acquire(1)
+
+        # one line per order of the rebalance, sampled by the log pipeline
+        logs.sampled(f"rebalance {exchange.s}", f"{exchange.s} limit sell {new['amount']} {new['price']} ")
+
+        if action == "replace":
+            return exchange.edit_order(
+                old["id"], exchange.s, "limit", "sell", amount=new["amount"], price=new["price"],
+                params={"cancelReplaceMode": "STOP_ON_FAILURE"},
+            )
+
+        return exchange.create_order(
+            symbol=exchange.s, type="limit", side="sell", amount=new["amount"], price=new["price"],
+            rebalance_on_max_orders=False
+        )
+
+    async def _run_op_async(self, action, old, new):
+        exchange = self.exchange
+
+        if action == "cancel":
+            return await exchange.cancel_order(old["id"], symbol=exchange.s)
+
+        await self.order_limiter.acquire_async(1)
+
+        # one line per order of the rebalance, sampled by the log pipeline
+        logs.sampled(f"rebalance {exchange.s}", f"{exchange.s} limit sell {new['amount']} {new['price']} ")
+
+        if action == "replace":
+            return await exchange.edit_order(
+                old["id"], exchange.s, "limit", "sell", amount=new["amount"], price=new["price"],
+                params={"cancelReplaceMode": "STOP_ON_FAILURE"},
+            )
+
+        return await exchange.create_order(
+            symbol=exchange.s, type="limit", side="sell", amount=new["amount"], price=new["price"],
+            rebalance_on_max_orders=False
+        )
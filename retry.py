@@ -0,0 +1,281 @@
+"""
+Retry policy shared by the exchange wrappers: which errors to retry, how long to back off, and when to give up.
+"""
+
+import asyncio
+import random
+import threading
+import time
+
+import ccxt
+import requests
+
+from utils import log_error
+
+
+class RetryRule():
+    """
+    How to retry the errors of the given classes: exponential backoff from base_delay,
+    capped at max_delay, for at most max_attempts attempts (None for no limit).
+    """
+
+    def __init__(self, errors, retry=True, base_delay=0.1, max_delay=30.0, max_attempts=None):
+        self.errors = errors
+        self.retry = retry
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+
+    def delay(self, attempt, random=random):
+        """
+        Seconds to wait before the given retry (1 for the first), with full jitter.
+        """
+        # the exponent is capped, it would overflow a float in a long outage
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** min(attempt - 1, 32)))
+
+
+# first matching rule wins, errors matching no rule are raised right away
+DEFAULT_RULES = (
+    # will fail the same way again (MAX_NUM_ORDERS is an InvalidOrder, handled by create_order)
+    RetryRule((ccxt.errors.InvalidOrder, ccxt.errors.InsufficientFunds, ccxt.errors.AuthenticationError, ccxt.errors.BadRequest), retry=False),
+    # the weight budget already holds calls back for Retry-After, so back off from a second
+    RetryRule((ccxt.errors.DDoSProtection,), base_delay=1.0, max_delay=60.0),
+    RetryRule((ccxt.errors.NetworkError, requests.exceptions.RequestException), base_delay=0.1, max_delay=30.0),
+)
+
+
+class CircuitOpen(ccxt.errors.ExchangeNotAvailable):
+    """
+    Raised instead of calling the exchange while the circuit breaker is open.
+    """
+
+
+class CircuitBreaker():
+    """
+    Stop calling the exchange for reset_timeout seconds after failure_threshold
+    consecutive transient failures. Then one call is let through as a probe: if it
+    succeeds the circuit closes, if it fails it opens again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.opens = 0
+
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self._opened_at >= self.reset_timeout else "open"
+
+    def wait_time(self):
+        """
+        Seconds until a call may go through, 0 if it may go now (possibly as the probe).
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return 0
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                return remaining
+            if not self._probing:
+                self._probing = True
+                return 0
+            # another call is probing, check back shortly
+            return min(1.0, self.reset_timeout)
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._opened_at is None and self._failures >= self.failure_threshold):
+                if self._opened_at is None:
+                    self.opens += 1
+                    print(f"Circuit breaker open for {self.reset_timeout}s after {self._failures} failures")
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class RetryPolicy():
+    """
+    Call a function and retry it on transient errors, by the first RetryRule matching the error.
+
+    Retries are drawn from a budget shared by every call of the policy (a token bucket
+    refilled at budget_rate per second, up to budget_burst), so an outage doesn't turn
+    every thread into a retry loop: once the budget is spent, retries are spaced out at
+    budget_rate. A call gives up, raising the last error, once its next attempt would
+    start after its deadline (seconds from the first attempt, None for no deadline) or
+    its rule's max_attempts is reached.
+
+    With a CircuitBreaker, calls wait for the circuit to close (or raise CircuitOpen if
+    that is past their deadline).
+    """
+
+    def __init__(self, rules=DEFAULT_RULES, budget_rate=2.0, budget_burst=20, breaker=None, seed=None):
+        self.rules = rules
+        self.budget_rate = budget_rate
+        self.budget_burst = budget_burst
+        self.breaker = breaker
+
+        self.calls = 0
+        self.retries = 0
+        self.gave_up = 0
+        self.not_retried = 0
+        self.retried_seconds = 0.0
+        self.errors = {}
+
+        self.random = random.Random(seed)
+
+        self._tokens = float(budget_burst)
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def rule_for(self, error):
+        for rule in self.rules:
+            if isinstance(error, rule.errors):
+                return rule
+        return None
+
+    def _reserve_token(self):
+        """
+        Take a retry token, possibly going into debt. Returns seconds until the token is actually available.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.budget_burst, self._tokens + (now - self._refilled_at) * self.budget_rate)
+            self._refilled_at = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.budget_rate)
+
+    def _refund_token(self):
+        with self._lock:
+            self._tokens += 1
+
+    def _before_attempt(self, name, started, deadline):
+        """
+        Seconds to wait for the circuit breaker before the next attempt. Raises CircuitOpen if past the deadline.
+        """
+        if self.breaker is None:
+            return 0
+        wait = self.breaker.wait_time()
+        if wait > 0 and deadline is not None and time.monotonic() + wait - started > deadline:
+            self.gave_up += 1
+            raise CircuitOpen(f"{name}: circuit breaker open for another {wait:.1f}s")
+        return wait
+
+    def _after_error(self, e, name, attempt, started, deadline):
+        """
+        Account for a failed attempt. Returns seconds to wait before retrying, or raises e if it is not retried.
+        """
+        rule = self.rule_for(e)
+
+        if rule is None or not rule.retry:
+            # the exchange answered, as far as the circuit breaker is concerned
+            if self.breaker is not None and isinstance(e, ccxt.errors.ExchangeError):
+                self.breaker.success()
+            self.not_retried += 1
+            raise e
+
+        if self.breaker is not None:
+            self.breaker.failure()
+
+        with self._lock:
+            self.errors[e.__class__.__name__] = self.errors.get(e.__class__.__name__, 0) + 1
+
+        if rule.max_attempts is not None and attempt >= rule.max_attempts:
+            self.gave_up += 1
+            raise e
+
+        delay = max(rule.delay(attempt, self.random), self._reserve_token())
+
+        if deadline is not None and time.monotonic() + delay - started > deadline:
+            self._refund_token()
+            self.gave_up += 1
+            raise e
+
+        if attempt == 1:
+            log_error(e, name)
+        print(f"{name}: {e.__class__.__name__}, retry {attempt} in {delay:.2f}s")
+
+        self.retries += 1
+        self.retried_seconds += delay
+        return delay
+
+    def call(self, fn, name="call", deadline=None):
+        """
+        Call fn() until it returns, or raise once the error is not retried or the call gives up.
+        """
+        self.calls += 1
+        started = time.monotonic()
+        attempt = 0
+
+        while True:
+            wait = self._before_attempt(name, started, deadline)
+            if wait > 0:
+                time.sleep(wait)
+                continue
+
+            attempt += 1
+            try:
+                result = fn()
+            except Exception as e:
+                time.sleep(self._after_error(e, name, attempt, started, deadline))
+                continue
+
+            if self.breaker is not None:
+                self.breaker.success()
+            return result
+
+    async def call_async(self, fn, name="call", deadline=None):
+        """
+        call() for asyncio, with fn() returning an awaitable.
+        """
+        self.calls += 1
+        started = time.monotonic()
+        attempt = 0
+
+        while True:
+            wait = self._before_attempt(name, started, deadline)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            attempt += 1
+            try:
+                result = await fn()
+            except Exception as e:
+                await asyncio.sleep(self._after_error(e, name, attempt, started, deadline))
+                continue
+
+            if self.breaker is not None:
+                self.breaker.success()
+            return result
+
+    def stats(self):
+        """
+        Get the call/retry counters, the retried errors by class and the circuit breaker state.
+        """
+        with self._lock:
+            errors = dict(self.errors)
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "gave_up": self.gave_up,
+            "not_retried": self.not_retried,
+            "retried_seconds": self.retried_seconds,
+            "errors": errors,
+            "circuit": self.breaker.state if self.breaker is not None else None,
+            "circuit_opens": self.breaker.opens if self.breaker is not None else 0,
+        }
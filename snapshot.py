@@ -0,0 +1,99 @@
+"""
+Short-lived in-memory snapshots of account state (balances, open orders).
+"""
+
+import threading
+import time
+
+
+class AccountSnapshot():
+    """
+    TTL cache for account state fetched over REST.
+
+    Each entry is keyed by name (e.g. "balance", "open_orders") and loaded lazily
+    through a loader callable. Entries expire after ``ttl`` seconds or when
+    ``invalidate()`` is called, e.g. after we create or cancel an order ourselves.
+    """
+
+    def __init__(self, ttl=5.0):
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        """
+        Return the cached value for key, calling loader() on a miss or after expiry.
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+
+        value = loader()
+
+        with self._lock:
+            # don't store a value that was loaded before an invalidation, it may
+            # not reflect an order we've just created or canceled
+            if generation == self._generation:
+                self._entries[key] = (now, value)
+
+        return value
+
+    async def get_async(self, key, loader):
+        """
+        get() for asyncio, with loader() returning an awaitable.
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+
+        value = await loader()
+
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (now, value)
+
+        return value
+
+    def peek(self, key):
+        """
+        The last value stored for key even if expired, or None. Never loads.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[1] if entry is not None else None
+
+    def invalidate(self, key=None):
+        """
+        Drop one cached entry, or all of them if key is None.
+        """
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        """
+        Get hit/miss counters.
+        """
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total > 0 else 0
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": hit_rate}
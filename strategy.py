@@ -0,0 +1,32 @@
+"""
+Pricing rules of the market-buy / limit-ladder strategy, shared by bot.py and backtest.py.
+"""
+
+from utils import calculate_min_order_amount, map_range
+
+
+def scale_by_balance(free_quote, total_quote, sell_base_value, x, y):
+    """
+    Get a value between x and y scaled linearly by the free share of the quote currency.
+
+    All quote free gives x, all of it tied up in open sell orders gives y.
+    """
+    scaled_value = map_range(free_quote, 0, total_quote + sell_base_value, x, y)
+
+    # Clamp to handle floating-point precision issues
+    return max(min(x, y), min(scaled_value, max(x, y)))
+
+
+def limit_sell_for(order, scale):
+    """
+    Price and amount of the limit sell placed after a buy order is filled.
+    """
+    return order["price"] * scale, order["filled"]
+
+
+def limit_buy_for(order, scale, min_cost, min_price, min_amount):
+    """
+    Price and amount of the limit buy placed after a sell order is filled.
+    """
+    buy_price = order["price"] / scale
+    return buy_price, calculate_min_order_amount(buy_price, min_cost, min_price, min_amount)
@@ -0,0 +1,296 @@
+"""
+The market-buy / limit-ladder strategy for one symbol, run by bot.py and multi_bot.py.
+"""
+
+import threading
+import random
+import time
+
+import ccxt
+
+import logs
+import metrics
+from averager import rebalance_sell_orders
+from cancel_scheduler import CancelScheduler
+from order_monitor import OrderMonitor
+from strategy import limit_buy_for, limit_sell_for
+from utils import log_error
+
+
+class SymbolBot():
+    """
+    Periodically market buy the minimum amount of one symbol, sell every filled buy with a
+    limit order above its price, and buy back every filled sell below its price.
+
+    Order updates are fed in through process_order_update(), by the OrderStream that
+    watches this bot's symbol (or by a shared stream that routes updates per symbol).
+
+    Unfilled limit buys are canceled after buy_cancel_timeout by a CancelScheduler,
+    which forgets an order as soon as the order monitor sees it filled or canceled.
+    """
+
+    def __init__(
+        self, exchange, sleep_min, sleep_max, profit_margin_min, profit_margin_max, buy_cancel_timeout,
+        stop_event=None, cancel_scheduler=None, journal=None, max_closed_orders=10000, ledger=None,
+    ):
+        self.exchange = exchange
+        self.symbol = exchange.s
+
+        self.sleep_min = sleep_min
+        self.sleep_max = sleep_max
+        self.profit_margin_min = profit_margin_min
+        self.profit_margin_max = profit_margin_max
+        self.buy_cancel_timeout = buy_cancel_timeout
+
+        # set to stop the main loop and pending delayed cancels, shared by all bots of a process
+        self.stop_event = stop_event if stop_event is not None else threading.Event()
+
+        # order updates are journaled to disk when a journal is passed in, only the recent closed orders stay in memory
+        self.order_monitor = OrderMonitor(exchange, journal=journal, max_closed_orders=max_closed_orders, ledger=ledger)
+
+        # delayed cancels of limit buys, possibly shared by all bots of a process
+        self.cancel_scheduler = cancel_scheduler if cancel_scheduler is not None else CancelScheduler(self.cancel_orders, name=f"cancel-{self.symbol}")
+        self.order_monitor.on_close.append(lambda order: self.cancel_scheduler.unschedule(order["id"]))
+
+        # updates can arrive from the stream and from REST reconciliation at the same
+        # time, only the first terminal update for a tracked order is acted upon
+        self.order_update_lock = threading.Lock()
+
+    def tracked_orders(self):
+        """
+        Open orders as currently known by the order monitor.
+        """
+        return list(self.order_monitor.open_orders.values())
+
+    def process_order_update(self, order):
+        """
+        Process order updates. Returns True if the order has been filled.
+        """
+        if order.get("symbol") == self.symbol:
+            self.exchange.trade_tracker.on_order(order)
+
+        with self.order_update_lock:
+
+            if order["id"] not in self.order_monitor.open_orders:
+                # e.g. an order placed by a rebalance
+                if order.get("symbol") == self.symbol:
+                    self.order_monitor.adopt(order)
+                return False
+
+            if order["status"] == "open":
+                return False
+
+            self.order_monitor.log(order)
+
+        if order["status"] == "closed":
+
+            detected = time.perf_counter()
+            if order["side"] == "buy":
+                self.limit_sell(order, detected)
+            else:
+                self.limit_buy(order, detected)
+            return True
+
+        return False
+
+    ############################################
+
+    def cancel_order(self, order):
+        """
+        Cancel an order.
+        """
+        try:
+            canceled_order = self.exchange.cancel_order(order["id"], symbol=self.symbol)
+            self.order_monitor.log(canceled_order)
+
+        except (ccxt.errors.OrderNotFound, KeyError):
+            pass
+
+        except ccxt.errors.ExchangeError as e:
+            log_error(e, f"cancel_order {self.symbol}")
+
+    def cancel_orders(self, orders):
+        """
+        Cancel the orders whose cancel deadline has passed, skipping the ones no longer open.
+        """
+        if self.stop_event.is_set():
+            return
+
+        for order in orders:
+            if order["id"] in self.order_monitor.open_orders:
+                self.cancel_order(order)
+
+    def market_buy(self):
+        """
+        Market buy the minimum amount of the symbol.
+        """
+        exchange = self.exchange
+
+        try:
+
+            # get min_order_amount based on the current price, min_cost, and
+            # min_amount
+            price = exchange.price()
+            amount = exchange.min_order_amount(price)
+
+            # place a market buy order for the min amount
+            order = exchange.create_order(
+                symbol=self.symbol,
+                type="market",
+                side="buy",
+                amount=amount,
+                rebalance_on_max_orders=True
+            )
+
+            # log the market buy order
+            self.order_monitor.log(order)
+
+            # place a limit sell order for the amount of base that was bought
+            self.limit_sell(order, time.perf_counter())
+
+        except ccxt.errors.InsufficientFunds:
+
+            logs.info(f"Insufficient funds for market buy of {self.symbol}")
+
+        except (ccxt.errors.ExchangeError, ccxt.errors.NetworkError) as e:
+
+            log_error(e, f"market_buy {self.symbol}")
+
+    def _profit_scale(self):
+        return random.uniform(self.profit_margin_min, self.exchange.scale_by_balance(self.profit_margin_min, self.profit_margin_max))
+
+    def limit_sell(self, order, detected=None):
+        """
+        Limit sell the amount of base that was bought. detected is the perf_counter() time the buy was seen filled.
+        """
+        exchange = self.exchange
+
+        try:
+            sell_price, sell_amount = limit_sell_for(order, self._profit_scale())
+
+            sell_order = exchange.create_order(
+                symbol=self.symbol,
+                type="limit",
+                side="sell",
+                amount=sell_amount,
+                price=sell_price,
+                rebalance_on_max_orders=True
+            )
+
+            if detected is not None:
+                metrics.FILL_TO_ACK.labels(self.symbol, "sell").observe(time.perf_counter() - detected)
+
+            self.order_monitor.log(sell_order, order)
+
+            # if status closed then immediately buy back
+            if sell_order["status"] == "closed":
+                self.limit_buy(sell_order, time.perf_counter())
+                return
+
+        except ccxt.errors.InsufficientFunds:
+            logs.info(f'Insufficient funds for limit sell of {sell_amount} at {sell_price} for total: {sell_price * sell_amount}')
+            return
+
+        except (ccxt.errors.ExchangeError, ccxt.errors.NetworkError) as e:
+            log_error(e, f"limit_sell {self.symbol}")
+            return
+
+    def limit_buy(self, order, detected=None):
+        """
+        Limit buy the amount of base that was sold. Cancel the order if it is not filled within buy_cancel_timeout.
+        detected is the perf_counter() time the sell was seen filled.
+        """
+        exchange = self.exchange
+
+        try:
+            buy_price, buy_amount = limit_buy_for(order, self._profit_scale(), exchange.min_cost, exchange.min_price, exchange.min_amount)
+
+            buy_order = exchange.create_order(
+                symbol=self.symbol,
+                type="limit",
+                side="buy",
+                amount=buy_amount,
+                price=buy_price,
+                rebalance_on_max_orders=True
+            )
+
+            if detected is not None:
+                metrics.FILL_TO_ACK.labels(self.symbol, "buy").observe(time.perf_counter() - detected)
+
+            self.order_monitor.log(buy_order, order)
+
+            # if status closed then immediately sell again
+            if buy_order["status"] == "closed":
+                self.limit_sell(buy_order, time.perf_counter())
+                return
+
+            self.cancel_scheduler.schedule(buy_order, self.buy_cancel_timeout)
+
+        except ccxt.errors.InsufficientFunds:
+            logs.info(f'Insufficient funds for limit buy of {buy_amount} at {buy_price} for total: {buy_price * buy_amount}')
+            return
+
+        except (ccxt.errors.ExchangeError, ccxt.errors.NetworkError) as e:
+            log_error(e, f"limit_buy {self.symbol}")
+            return
+
+    ############################################
+
+    def rebalance_if_needed(self):
+        """
+        Proactive check: rebalance if we're getting close to max orders.
+        """
+        exchange = self.exchange
+
+        try:
+            max_orders = exchange.get_max_num_orders()
+            current_sell_orders = len(exchange.open_sell_orders())
+            threshold = int(max_orders * 0.9)  # Rebalance at 90% capacity
+
+            if current_sell_orders >= threshold:
+                # Try to acquire lock without blocking
+                acquired = exchange._rebalance_lock.acquire(blocking=False)
+
+                if acquired:
+                    try:
+                        logs.info(f"Proactive rebalancing {self.symbol}: {current_sell_orders}/{max_orders} orders (threshold: {threshold})")
+                        old_orders, new_orders = rebalance_sell_orders(exchange)
+                        self.order_monitor.replaced(old_orders, new_orders)
+                        logs.info(f"Rebalanced {len(old_orders)} orders into {len(new_orders)} orders")
+                    finally:
+                        exchange._rebalance_lock.release()
+                else:
+                    logs.info(f"Proactive rebalancing skipped: {current_sell_orders}/{max_orders} (rebalancing already in progress)")
+        except Exception as check_error:
+            logs.info(f"Error during proactive order check: {check_error}")
+
+    def run(self):
+        """
+        Begin the main loop. Returns once stop_event is set.
+        """
+        exchange = self.exchange
+
+        self.rebalance_if_needed()
+
+        logs.info(f"Starting main loop for {self.symbol}...")
+
+        while not self.stop_event.is_set():
+
+            seconds_since_last_trade = exchange.seconds_since_last_trade()
+            sleep_timer = exchange.scale_by_balance(self.sleep_max, self.sleep_min)
+            if seconds_since_last_trade > sleep_timer:
+
+                self.market_buy()
+                seconds_since_last_trade = 0
+
+                self.order_monitor.status()
+
+            sleeping_for = int(sleep_timer - seconds_since_last_trade + 1)
+            ts = exchange.iso8601(exchange.milliseconds())
+            ts_unitl = exchange.iso8601(exchange.milliseconds() + sleeping_for * 1000)
+            logs.info(f"{ts} | {self.symbol} | Sleeping until {ts_unitl}... ({sleeping_for} seconds)")
+
+            # returns early when stop_event is set
+            wake_at = time.monotonic() + sleeping_for
+            if not self.stop_event.wait(sleeping_for):
+                metrics.LOOP_LAG.labels("main", self.symbol).observe(max(0.0, time.monotonic() - wake_at))
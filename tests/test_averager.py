@@ -0,0 +1,110 @@
+"""
+The vectorized sell ladder planner against the per-level reference it replaced.
+"""
+
+import random
+
+import pytest
+
+from averager import get_new_orders, get_new_orders_reference
+from backtest import SimExchange
+
+TICKS = (1.0, 0.1, 0.01, 0.001, 0.0001, 1e-05, 1e-06, 1e-08)
+STEPS = (1.0, 0.1, 0.01, 0.001, 0.0001, 1e-05, 1e-06, 1e-08)
+
+
+def random_exchange(rng):
+    tick = rng.choice(TICKS)
+    step = rng.choice(STEPS)
+    market = {
+        "symbol": "BASE/QUOTE",
+        "base": "BASE",
+        "quote": "QUOTE",
+        "precision": {"amount": step, "price": tick, "base": 1e-08, "quote": 1e-08},
+        "limits": {
+            "amount": {"min": step},
+            "price": {"min": tick},
+            "cost": {"min": rng.choice((1.0, 5.0, 10.0))},
+        },
+        "info": {"filters": [{"filterType": "MAX_NUM_ORDERS", "maxNumOrders": "200"}]},
+    }
+    return SimExchange(market, quote_balance=0.0)
+
+
+def random_ladder(rng, exchange, max_n=120):
+    """
+    (n, sum_amount, min_price, max_price) for a spread of prices on the market's tick.
+    """
+    min_price = exchange.round(10 ** rng.uniform(-2, 5) + 100 * exchange.min_price, "price")
+    max_price = exchange.round(min_price * rng.uniform(1.0, 1.5), "price")
+    n = rng.randint(1, max_n)
+    min_total = n * exchange.min_order_amount(max_price)
+    sum_amount = exchange.round(min_total * rng.uniform(0.8, 4.0) + rng.randint(0, 50) * exchange.min_amount, "amount")
+    return n, sum_amount, min_price, max_price
+
+
+def plan(planner, *args, **kwargs):
+    """
+    The planner's orders, or AssertionError when it refuses the input.
+    """
+    try:
+        return planner(*args, **kwargs)
+    except AssertionError:
+        return AssertionError
+
+
+def decrement_loop(exchange, n, sum_amount, min_price, max_price, set_amount, max_steps=300):
+    """
+    The loop rebalance_sell_orders used: lower set_amount one min_amount at a time until the
+    ladder fits. None if that takes more than max_steps.
+    """
+    for _ in range(max_steps):
+        orders = plan(get_new_orders_reference, exchange, n, sum_amount, min_price, max_price, set_amount=set_amount)
+        if orders is not AssertionError:
+            return orders
+        set_amount = exchange.round(set_amount - exchange.min_amount, "amount")
+        if set_amount <= 0:
+            return AssertionError
+    return None
+
+
+def same_orders(orders, expected):
+    if orders is AssertionError or expected is AssertionError:
+        return orders is expected
+    # float equality and types: bit for bit, not approximately
+    return [(type(o["price"]), o["price"], o["amount"]) for o in orders] == [(float, o["price"], o["amount"]) for o in expected]
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_matches_reference(seed):
+    rng = random.Random(seed)
+    exchange = random_exchange(rng)
+
+    for _ in range(10):
+        n, sum_amount, min_price, max_price = random_ladder(rng, exchange)
+        set_amount = rng.choice((None, exchange.round(sum_amount / n * rng.uniform(0.5, 1.5), "amount")))
+
+        expected = plan(get_new_orders_reference, exchange, n, sum_amount, min_price, max_price, set_amount=set_amount)
+        orders = plan(get_new_orders, exchange, n, sum_amount, min_price, max_price, set_amount=set_amount)
+        assert same_orders(orders, expected), (exchange.precision, exchange.m["limits"], n, sum_amount, min_price, max_price, set_amount)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_lower_set_amount_matches_decrement_loop(seed):
+    rng = random.Random(1000 + seed)
+    exchange = random_exchange(rng)
+
+    compared = 0
+    while compared < 5:
+        n, sum_amount, min_price, max_price = random_ladder(rng, exchange, max_n=40)
+        # sum / n is what the rebalancer starts from, the larger values need (many) more decrements
+        set_amount = exchange.round(sum_amount / n * rng.choice((1.0, 1.0, 1.001, 1.01, 1.1, 3.0)), "amount")
+        if set_amount <= 0:
+            continue
+
+        expected = decrement_loop(exchange, n, sum_amount, min_price, max_price, set_amount)
+        if expected is None:
+            continue
+        orders = plan(get_new_orders, exchange, n, sum_amount, min_price, max_price, set_amount=set_amount, lower_set_amount=True)
+        assert same_orders(orders, expected), (exchange.precision, exchange.m["limits"], n, sum_amount, min_price, max_price, set_amount)
+        compared += 1
@@ -0,0 +1,103 @@
+"""
+OrderStream against FakeBinance and its local user data stream.
+"""
+
+import threading
+import time
+
+import pytest
+
+from exchange import ExtendedSymbolExchange
+from fake_exchange import FakeBinance, FakeUserDataStream
+from order_stream import OrderStream
+from weight_budget import WeightBudget
+
+SYMBOL = "BTC/FDUSD"
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture
+def fake():
+    return FakeBinance(symbol=SYMBOL, price=100000.0, balances={"FDUSD": 100000.0}, fee=0.0)
+
+
+@pytest.fixture
+def exchange(fake):
+    budget = WeightBudget(weight_limit=10**9, order_limit=10**9)
+    return ExtendedSymbolExchange(SYMBOL, fake.exchange_config(), snapshot_ttl=0.0, budget=budget)
+
+
+@pytest.fixture
+def user_data_stream(fake):
+    stream = FakeUserDataStream(fake).start()
+    yield stream
+    stream.stop()
+
+
+class Tracker():
+    """
+    The orders the test believes are open, kept from the updates OrderStream delivers.
+    """
+
+    def __init__(self):
+        self.updates = []
+        self.open = {}
+        self.lock = threading.Lock()
+
+    def on_update(self, order):
+        with self.lock:
+            self.updates.append(order)
+            if order["status"] == "open":
+                self.open[order["id"]] = order
+            else:
+                self.open.pop(order["id"], None)
+
+    def tracked_orders(self):
+        with self.lock:
+            return list(self.open.values())
+
+    def status(self, id):
+        with self.lock:
+            statuses = [o["status"] for o in self.updates if o["id"] == id]
+        return statuses[-1] if statuses else None
+
+
+def test_fill_missed_while_disconnected_is_reconciled(fake, exchange, user_data_stream):
+    tracker = Tracker()
+    stream = OrderStream(exchange, tracker.on_update, tracker.tracked_orders, ws_url=user_data_stream.url, reconcile_interval=3600, reconnect_delay=0.2)
+    stream.start()
+    try:
+        assert wait_for(lambda: user_data_stream.subscribers == 1)
+
+        order = exchange.create_order(SYMBOL, "limit", "buy", 0.001, 99000.0)
+        assert wait_for(lambda: tracker.status(order["id"]) == "open"), "executionReport was not delivered"
+        assert user_data_stream.sent == 1
+        assert stream.reconciled == 0
+
+        # the fill happens while the stream is down, so it is never pushed
+        user_data_stream.drop()
+        sent = user_data_stream.sent
+        fake.set_price(98000.0)
+        user_data_stream.accept()
+
+        assert wait_for(lambda: tracker.status(order["id"]) == "closed"), "missed fill was not reconciled"
+        assert stream.reconciled == 1
+        assert stream.reconnects >= 1
+        assert user_data_stream.sent == sent
+        assert tracker.tracked_orders() == []
+
+        # and the stream is back: a new order arrives over the socket again
+        assert wait_for(lambda: user_data_stream.subscribers == 1)
+        order = exchange.create_order(SYMBOL, "limit", "buy", 0.001, 97000.0)
+        assert wait_for(lambda: tracker.status(order["id"]) == "open")
+        assert stream.reconciled == 1
+    finally:
+        stream.stop()
@@ -0,0 +1,59 @@
+"""
+Ladder size search against the linear search it replaced.
+"""
+
+import random
+
+import pytest
+
+from utils import (
+    calculate_min_order_amount,
+    how_many_orders_can_fit_in_spread_given_amount,
+    how_many_orders_can_fit_in_spread_given_amount_reference,
+)
+
+MARKETS = (
+    # min_cost, min_price_tick, min_amount
+    (5.0, 0.01, 1e-05),
+    (1.0, 0.0001, 0.1),
+    (10.0, 1e-08, 1.0),
+    (5.0, 0.001, 0.001),
+)
+
+
+def both(*args):
+    return how_many_orders_can_fit_in_spread_given_amount(*args), how_many_orders_can_fit_in_spread_given_amount_reference(*args)
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_matches_reference(seed):
+    rng = random.Random(seed)
+    min_cost, tick, min_amount = rng.choice(MARKETS)
+    spread_min_price = round(10 ** rng.uniform(-1, 5), 2) + tick
+    spread_max_price = spread_min_price * rng.choice((1.0, 1.0001, 1.01, rng.uniform(1.0, 3.0)))
+    # from less than one order up to a few hundred
+    amount = calculate_min_order_amount(spread_min_price, min_cost, tick, min_amount) * rng.uniform(0.5, 300)
+
+    n, expected = both(amount, spread_min_price, spread_max_price, min_cost, tick, min_amount)
+    assert n == expected
+
+
+def test_zero_spread():
+    # every order at the same price: as many whole minimum orders as the amount holds
+    min_amount = calculate_min_order_amount(100.0, 5.0, 0.01, 1e-05)
+    for k in (1, 2, 3, 17, 64, 65):
+        n, expected = both(min_amount * k + 1e-06, 100.0, 100.0, 5.0, 0.01, 1e-05)
+        assert n == expected == k
+
+
+def test_amount_below_one_order():
+    min_amount = calculate_min_order_amount(100.0, 5.0, 0.01, 1e-05)
+    for amount in (0.0, min_amount / 2, min_amount - 1e-05):
+        assert both(amount, 100.0, 110.0, 5.0, 0.01, 1e-05) == (1, 1)
+
+
+def test_large_n():
+    # a few thousand orders, past several galloping doublings
+    n, expected = both(0.2, 100000.0, 150000.0, 5.0, 0.01, 1e-05)
+    assert n == expected
+    assert n > 2000
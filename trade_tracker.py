@@ -0,0 +1,119 @@
+"""
+Time of the last fill and the recent fill rate of one symbol, kept from order updates instead of fetch_my_trades.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class TradeTracker():
+    """
+    Follow the fills of one symbol from the orders seen by the bot: order responses
+    (e.g. a market buy) and user data stream updates. An order counts as a fill whenever
+    its filled amount grows, however often the same update is seen (stream, REST
+    reconciliation). The fill times within the last `window` seconds give the trade rate.
+
+    Until a fill is seen or seed() is called the last trade is unknown, and the exchange
+    asks Binance once. invalidate() makes it ask again, e.g. after the user data stream
+    reconnected and may have missed fills of orders the bot doesn't track.
+    """
+
+    def __init__(self, window=3600.0, max_orders=4096):
+        self.window = window
+        self.max_orders = max_orders
+
+        self.fills = 0
+        self.seeds = 0
+
+        self._last_trade = None
+        self._known = False
+        # fill timestamps (ms) within the window, oldest first
+        self._times = deque()
+        # order id -> filled amount, of the most recently updated orders
+        self._filled = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def known(self):
+        """
+        True once the last trade is known, either from a fill or from seed().
+        """
+        return self._known
+
+    def last_trade(self):
+        """
+        Timestamp (ms) of the last fill, or None if there was none (or it is not known yet).
+        """
+        return self._last_trade
+
+    def seed(self, timestamp):
+        """
+        Set the last trade as fetched over REST (None if there are no trades). Fills seen since are kept if newer.
+        """
+        with self._lock:
+            if timestamp is not None and (self._last_trade is None or timestamp > self._last_trade):
+                self._last_trade = timestamp
+            self._known = True
+            self.seeds += 1
+
+    def invalidate(self):
+        """
+        Ask Binance for the last trade on the next read.
+        """
+        self._known = False
+
+    def on_order(self, order):
+        """
+        Account for an order update or response. Returns True if it is a new fill.
+        """
+        filled = order.get("filled") or 0.0
+        if filled <= 0:
+            return False
+
+        id = order["id"]
+        timestamp = order.get("lastTradeTimestamp") or order.get("timestamp") or int(time.time() * 1000)
+
+        with self._lock:
+            if filled <= self._filled.get(id, 0.0):
+                return False
+
+            self._filled[id] = filled
+            self._filled.move_to_end(id)
+            if len(self._filled) > self.max_orders:
+                self._filled.popitem(last=False)
+
+            if self._last_trade is None or timestamp > self._last_trade:
+                self._last_trade = timestamp
+            self._known = True
+
+            self.fills += 1
+            self._times.append(timestamp)
+            self._prune()
+
+        return True
+
+    def _prune(self):
+        cutoff = time.time() * 1000 - self.window * 1000
+        while self._times and self._times[0] < cutoff:
+            self._times.popleft()
+
+    def trade_rate(self):
+        """
+        Fills per minute over the last `window` seconds.
+        """
+        with self._lock:
+            self._prune()
+            return len(self._times) * 60 / self.window
+
+    def stats(self):
+        """
+        Get the fill/seed counters, the last trade and the trade rate.
+        """
+        return {
+            "fills": self.fills,
+            "seeds": self.seeds,
+            "known": self.known,
+            "last_trade": self._last_trade,
+            "trades_per_minute": self.trade_rate(),
+        }
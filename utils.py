@@ -5,6 +5,11 @@ Pure and shared utility helpers (no I/O, no exchange state).
 import math
 from decimal import Decimal
 
+import numpy as np
+
+# the logging helpers live in logs.py, imported from here by most modules
+from logs import log_error, log_order  # noqa: F401
+
 
 def amount_scale_from_step(step: float) -> int:
     """
@@ -63,43 +68,54 @@ def calculate_min_order_amount(price: float, min_cost: float, min_price: float,
     return math.ceil(effective_min_cost / price / min_amount) * min_amount
 
 
-def map_range(x, a, b, y, z):
+def round_array(values, decimals: int) -> np.ndarray:
     """
-    Map a value from one range to another.
+    Vectorized ``round(x, decimals)`` over a float array, with results identical to the builtin.
+
+    ``rint(x * 10**decimals) / 10**decimals`` gives the same float as ``round`` unless the
+    scaled value sits (almost) exactly halfway between two integers, where the error of
+    the multiplication can pick the wrong side. Those rare elements fall back to ``round``.
     """
-    return (x - a) * (z - y) / (b - a) + y
+    values = np.asarray(values, dtype=np.float64)
+    if decimals < 0 or decimals > 22:
+        return np.array([round(float(v), decimals) for v in values])
 
+    scale = 10.0 ** decimals
+    scaled = values * scale
+    rounded = np.rint(scaled) / scale
 
-def log_error(e, name):
-    """
-    Print a formatted error message to the console.
-    """
-    module = e.__module__ if hasattr(e, "__module__") else ""
-    print(f'''
-    Error in {name}:
-    {e.__class__=}
-    {module=}
-    {e.args=}
-    {e.__context__=}
-    Error occured in {e.__traceback__.tb_frame.f_code.co_filename} at line {e.__traceback__.tb_lineno}
-    ''')
+    frac = np.abs(scaled - np.trunc(scaled))
+    near_tie = np.abs(frac - 0.5) <= np.abs(scaled) * 1e-12 + 1e-12
+    for i in np.flatnonzero(near_tie):
+        rounded[i] = round(float(values[i]), decimals)
 
+    return rounded
 
-def log_order(o, o_prev=None):
+
+def min_order_units_array(prices, min_cost: float, min_price: float, min_amount: float) -> np.ndarray:
     """
-    Log an order to the console.
+    Vectorized ``round_units(min_amount, calculate_min_order_amount(p, ...), ROUND_CEILING)`` for an array of prices.
+
+    ``calculate_min_order_amount`` returns ``k * min_amount`` as a float, and ``round_units``
+    reads it back through its shortest repr. When the product rounded above the exact decimal
+    ``k * min_amount`` the repr is above it too and the ceiling adds one unit, which is kept here.
     """
-    amount = o["amount"] if o["amount"] else o["filled"]
-    value = o["price"] * o["amount"]
+    prices = np.asarray(prices, dtype=np.float64)
+    scale = amount_scale_from_step(min_amount)
+    units_per_step = amount_to_units(min_amount, min_amount)
 
-    profit = "X"
-    if o_prev is not None:
-        value_prev = o_prev["price"] * o_prev["amount"]
-        profit = value - value_prev
+    steps = np.ceil((min_cost + min_price) / prices / min_amount)
+    units = steps.astype(np.int64) * units_per_step
+    exact = units / 10.0 ** scale
 
-    print(
-        f'{o["datetime"]} | {o["id"]} | {o["type"].upper():<6} | {o["side"].upper():<4} | {amount:<7} | {o["price"]:<8} | {value:<18} | {o["status"]:<6} | Profit: {profit:<18}'
-    )
+    return units + (steps * min_amount > exact)
+
+
+def map_range(x, a, b, y, z):
+    """
+    Map a value from one range to another.
+    """
+    return (x - a) * (z - y) / (b - a) + y
 
 
 def can_n_orders_fit_in_range(n, amount, spread_min_price, spread_max_price, min_cost, min_price_tick, min_amount):
@@ -118,9 +134,60 @@ def can_n_orders_fit_in_range(n, amount, spread_min_price, spread_max_price, min
     return amount >= 0
 
 
+def remaining_amount_after_n_orders(n, amount, spread_min_price, spread_max_price, min_cost, min_price_tick, min_amount):
+    """
+    `amount` minus the minimum amounts of `n` orders linearly spaced between spread endpoints.
+
+    Vectorized can_n_orders_fit_in_range() with the same floating point result: the prices and
+    the remaining amount are accumulated left to right, exactly like the loop does.
+    """
+    spread = spread_max_price - spread_min_price
+    spread_per_order = spread / (n - 1)
+
+    steps = np.full(n, spread_per_order)
+    steps[0] = spread_min_price
+    prices = np.add.accumulate(steps)
+
+    min_amounts = np.ceil((min_cost + min_price_tick) / prices / min_amount) * min_amount
+
+    return np.subtract.accumulate(np.concatenate(([amount], min_amounts)))[-1]
+
+
 def how_many_orders_can_fit_in_spread_given_amount(amount, spread_min_price, spread_max_price, min_cost, min_price_tick, min_amount):
+    """
+    Largest n such that can_n_orders_fit_in_range(n, ...) is True.
+
+    Fitting more orders never takes less base, so the boundary is found by galloping
+    (n = 2, 4, 8, ...) and then bisecting, each step a vectorized O(n) check.
+    """
+    def fits(n):
+        return remaining_amount_after_n_orders(
+            n, amount, spread_min_price, spread_max_price, min_cost, min_price_tick, min_amount
+        ) >= 0
+
+    if not fits(2):
+        return 1
+
+    lo, hi = 2, 4
+    while fits(hi):
+        lo, hi = hi, hi * 2
+
+    # fits(lo) and not fits(hi)
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if fits(mid):
+            lo = mid
+        else:
+            hi = mid
+
+    return lo
+
+
+def how_many_orders_can_fit_in_spread_given_amount_reference(amount, spread_min_price, spread_max_price, min_cost, min_price_tick, min_amount):
     """
     Largest n such that can_n_orders_fit_in_range(n, ...) is True (search from n=2 upward).
+
+    Linear search that how_many_orders_can_fit_in_spread_given_amount() replaced, kept as its reference.
     """
     n = 2
     while can_n_orders_fit_in_range(n, amount, spread_min_price, spread_max_price, min_cost, min_price_tick, min_amount):
@@ -0,0 +1,198 @@
+"""
+Request-weight and order-count budget shared by every bot process on the host.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import fcntl
+import os
+import struct
+import threading
+import time
+
+import ccxt
+
+import logs
+
+
+# minute, used weight, 10s window, order count, banned until (ms)
+_STATE = struct.Struct("<qqqqq")
+
+
+class WeightBudget():
+    """
+    Track Binance request weight (per minute, per IP) and new orders (per 10 seconds)
+    across threads and processes, and hold calls back before the exchange bans us.
+
+    Binance counts weight in calendar-minute windows and reports the current value in
+    the X-MBX-USED-WEIGHT-1M and X-MBX-ORDER-COUNT-10S response headers. The budget
+    mirrors those windows: every call reserves its weight up front, and the counters
+    are corrected from the headers when the response arrives. On 418/429 the
+    Retry-After header puts every process on the host on hold.
+
+    The state lives in a small file guarded by flock, so containers that share an IP
+    (network_mode: host) should share the file through a volume. With path=None the
+    state is kept in memory and only shared between threads.
+
+    Calls made with priority "low" are shed (RateLimitExceeded) instead of delayed once
+    usage is above low_priority_share of the limit, leaving the rest for trading.
+    The priority is a context variable, so it applies per thread and per asyncio task.
+    """
+
+    def __init__(self, path=None, weight_limit=6000, order_limit=100, low_priority_share=0.7):
+        self.path = path
+        self.weight_limit = weight_limit
+        self.order_limit = order_limit
+        self.low_priority_share = low_priority_share
+
+        self.waits = 0
+        self.waited_seconds = 0
+        self.shed = 0
+
+        self._lock = threading.Lock()
+        self._priority = contextvars.ContextVar(f"weight_budget_priority_{id(self)}", default="high")
+        self._memory = bytearray(_STATE.size)
+        self._fd = None
+
+        if path is not None:
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+
+    @contextlib.contextmanager
+    def _state(self):
+        """
+        Lock the shared state and yield it as a mutable list. Changes are written back on exit.
+        """
+        with self._lock:
+            if self._fd is None:
+                state = list(_STATE.unpack(self._memory))
+                yield state
+                _STATE.pack_into(self._memory, 0, *state)
+                return
+
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                data = os.pread(self._fd, _STATE.size, 0)
+                state = list(_STATE.unpack(data)) if len(data) == _STATE.size else [0] * 5
+                yield state
+                os.pwrite(self._fd, _STATE.pack(*state), 0)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _roll(state, now_ms):
+        minute, ten_seconds = now_ms // 60000, now_ms // 10000
+        if state[0] != minute:
+            state[0], state[1] = minute, 0
+        if state[2] != ten_seconds:
+            state[2], state[3] = ten_seconds, 0
+
+    @property
+    def priority(self):
+        """
+        Priority of calls made from the current thread or task ("high" or "low").
+        """
+        return self._priority.get()
+
+    @contextlib.contextmanager
+    def low_priority(self):
+        """
+        Mark calls made from the current thread or task inside the block as low priority.
+        """
+        token = self._priority.set("low")
+        try:
+            yield
+        finally:
+            self._priority.reset(token)
+
+    def try_acquire(self, weight, orders=0):
+        """
+        Reserve weight (and new orders) for one request if it fits the budget now.
+
+        Returns 0 once reserved, otherwise the milliseconds to wait before trying again.
+        Raises RateLimitExceeded instead for low priority calls.
+        """
+        low = self.priority == "low"
+        now_ms = int(time.time() * 1000)
+
+        with self._state() as state:
+            self._roll(state, now_ms)
+
+            weight_limit = self.weight_limit * (self.low_priority_share if low else 1)
+            order_limit = self.order_limit * (self.low_priority_share if low else 1)
+
+            if state[4] > now_ms:
+                wait_ms = state[4] - now_ms
+            elif state[1] + weight > weight_limit:
+                wait_ms = 60000 - now_ms % 60000
+            elif orders and state[3] + orders > order_limit:
+                wait_ms = 10000 - now_ms % 10000
+            else:
+                state[1] += weight
+                state[3] += orders
+                return 0
+
+        if low:
+            self.shed += 1
+            raise ccxt.errors.RateLimitExceeded(f"Low priority request shed by the local weight budget for {wait_ms} ms")
+
+        self.waits += 1
+        self.waited_seconds += wait_ms / 1000
+        logs.sampled("weight budget", f"Weight budget exhausted. Waiting {wait_ms / 1000:.1f} seconds...")
+        return wait_ms
+
+    def acquire(self, weight, orders=0):
+        """
+        Reserve weight (and new orders) for one request, blocking until it fits the budget.
+
+        Raises RateLimitExceeded instead of blocking for low priority calls.
+        """
+        while wait_ms := self.try_acquire(weight, orders):
+            time.sleep(wait_ms / 1000)
+
+    async def acquire_async(self, weight, orders=0):
+        """
+        acquire() for asyncio, waiting on the event loop instead of blocking the thread.
+        """
+        while wait_ms := self.try_acquire(weight, orders):
+            await asyncio.sleep(wait_ms / 1000)
+
+    def update(self, headers):
+        """
+        Correct the counters from Binance response headers, and record bans from Retry-After (sent with 418/429).
+        """
+        if not headers:
+            return
+
+        now_ms = int(time.time() * 1000)
+
+        used_weight = headers.get("X-MBX-USED-WEIGHT-1M")
+        order_count = headers.get("X-MBX-ORDER-COUNT-10S")
+        retry_after = headers.get("Retry-After")
+
+        with self._state() as state:
+            self._roll(state, now_ms)
+
+            if used_weight is not None:
+                state[1] = max(state[1], int(used_weight))
+            if order_count is not None:
+                state[3] = max(state[3], int(order_count))
+            if retry_after is not None:
+                state[4] = max(state[4], now_ms + int(retry_after) * 1000)
+
+    def stats(self):
+        """
+        Get the current window usage and wait/shed counters.
+        """
+        with self._state() as state:
+            self._roll(state, int(time.time() * 1000))
+            used_weight, order_count, banned_until = state[1], state[3], state[4]
+
+        return {
+            "used_weight": used_weight,
+            "order_count": order_count,
+            "banned_until": banned_until,
+            "waits": self.waits,
+            "waited_seconds": self.waited_seconds,
+            "shed": self.shed,
+        }